@@ -4,6 +4,7 @@ from src.data_loader import init_db
 from src.schema_reader import read_schema
 from src.agent import AnalyticsAgent, ChatState
 from src.config import SETTINGS
+from src.formatting import format_approx
 
 st.set_page_config(page_title="Funnel Analytics Chatbot", layout="wide")
 st.title("Funnel Analytics Chatbot (DuckDB + Ollama)")
@@ -17,6 +18,60 @@ def boot():
 
 agent = boot()
 
+
+def _span_detail(sp: dict) -> str:
+    if sp["name"] == "llm":
+        return f"{sp.get('kind', '')}: {sp.get('prompt_tokens') or '?'} prompt / {sp.get('eval_tokens') or '?'} output tokens"
+    if sp["name"] == "execute":
+        if sp.get("cached"):
+            return f"attempt {sp.get('attempt')}: result cache hit"
+        if sp.get("shared"):
+            return f"attempt {sp.get('attempt')}: shared an identical query already running"
+        prof = sp.get("profile") or {}
+        top = (prof.get("top_operators") or [{}])[0]
+        detail = f"attempt {sp.get('attempt')}: {sp.get('rows', '?')} rows"
+        if prof:
+            detail += f", DuckDB {prof['duckdb_ms']:.1f} ms, top op {top.get('op', '?')} ({top.get('ms', 0):.1f} ms)"
+        return detail
+    if sp["name"] == "prompt":
+        return f"~{sp.get('prompt_tokens_est', '?')} tokens ({sp.get('static_tokens_est', '?')} cacheable), {sp.get('columns', 0)} columns named"
+    if sp["name"] == "approx":
+        if not sp.get("used"):
+            return "not applicable"
+        return f"{sp.get('sample_rows', 0):,} sample rows, {sp.get('replicates', 0)} replicates"
+    if sp["name"] == "route":
+        return sp.get("source", "")
+    return sp.get("error", "")
+
+
+def render_trace_panel(container) -> None:
+    """Stage breakdown of the last answer plus running p50/p95 per stage."""
+    with container.container():
+        st.subheader("Last answer timing")
+        trace = st.session_state.state.last_trace
+        if not trace:
+            st.caption("Ask a question to see where the time goes.")
+            return
+        via = trace.get("source", "?") + (f" ({trace['model']})" if trace.get("model") else "")
+        if trace.get("escalated"):
+            via += f", escalated after a {trace['escalated']} failure"
+        st.caption(f"{trace['total_ms']:.0f} ms total · answered via {via}")
+        spec = trace.get("speculative")
+        if spec:
+            st.caption(
+                f"Speculative: {spec['candidates']} candidates, {spec['valid']} valid, {spec['invalid']} rejected, "
+                f"{spec['cancelled']} cancelled; ran #{', #'.join(str(i) for i in spec['tried']) or '-'}"
+            )
+        st.dataframe(
+            [{"stage": sp["name"], "start ms": sp["start_ms"], "ms": sp["ms"], "detail": _span_detail(sp)} for sp in trace["spans"]],
+            hide_index=True,
+        )
+        hist = agent.metrics.snapshot()["histograms"]
+        stages = {k.split(".", 1)[1]: v for k, v in hist.items() if k.startswith("stage_ms.")}
+        if stages:
+            st.caption("All answers: " + ", ".join(f"{k} p50 {v['p50']:.0f} / p95 {v['p95']:.0f} ms" for k, v in stages.items()))
+
+
 if "state" not in st.session_state:
     st.session_state.state = ChatState()
 if "chat" not in st.session_state:
@@ -25,9 +80,34 @@ if "chat" not in st.session_state:
 with st.sidebar:
     st.subheader("Settings")
     st.write(f"**Model:** {SETTINGS.ollama_model}")
+    if agent.router.enabled:
+        st.write(f"**Small model:** {agent.router.small_model} (complexity < {agent.router.threshold:g})")
     st.write(f"**Table:** {SETTINGS.table_name}_v")
     st.write(f"**Max rows returned:** {SETTINGS.max_rows_returned}")
+    if SETTINGS.data_dir and st.button("Load new data"):
+        stats = agent.ingest_partitions()
+        st.caption(f"Loaded {len(stats['loaded'])} file(s), {stats['rows']} rows; {stats['skipped']} unchanged.")
+    rc = agent.result_cache.snapshot()
+    st.caption(f"Result cache: {rc['hits']} hits / {rc['misses']} misses, {rc['entries']} entries, {rc['bytes'] / 1e6:.1f} MB")
+    for name, ms in agent.router.stats().items():
+        rate = f"{ms['success_rate']:.0%}" if ms["success_rate"] is not None else "-"
+        st.caption(f"{name}: {ms['calls']} calls, p50 {ms['latency_p50_ms']:.0f} ms, {rate} success, {ms['escalated']} escalated")
+    lq = agent.llm.stats()
+    st.caption(f"LLM: {lq['in_flight']} in flight, {lq['waiting']} queued (max {lq['max_waiting']}), {lq['retries']} retries across {lq['servers']} server(s)")
+    cp = agent.cursors.snapshot()
+    st.caption(f"DuckDB cursors: {cp['in_use']}/{cp['size']} in use, {cp['waited']} waits")
+    ie = agent.intents.snapshot()
+    st.caption(f"Fast path: {ie['served_fraction']:.0%} of questions answered without the LLM ({ie['served']} served)")
+    rp = agent.repairer.snapshot()
+    st.caption(f"SQL auto-repair: {rp['repaired']}/{rp['attempts']} fixed locally, {rp['llm_calls_avoided']} LLM refine calls avoided")
+    qc = agent.question_cache.snapshot()
+    st.caption(f"Question cache: {qc['hit_rate']:.0%} hit rate, {qc['entries']} entries, ~{qc['saved_ms'] / 1000:.1f}s LLM time saved")
+    trace_panel = st.empty()
+    render_trace_panel(trace_panel)
+    sc = agent.session_cache.snapshot()
+    st.caption(f"Follow-up intermediates: {sc['reused']} reused / {sc['built']} built, {sc['entries']} cached ({sc['rows']} rows)")
     if st.button("Reset conversation"):
+        agent.end_session(st.session_state.state.session_id)
         st.session_state.state = ChatState()
         st.session_state.chat = []
         st.rerun()
@@ -49,11 +129,46 @@ if user_q:
 
     with st.chat_message("assistant"):
         try:
-            answer, new_state = agent.answer(user_q, st.session_state.state)
+            placeholder = st.empty()
+            parts: dict = {}
+            answer, new_state = "", st.session_state.state
+            for kind, data in agent.answer_stream(user_q, st.session_state.state):
+                if kind == "answer":
+                    answer, new_state = data
+                    break
+                parts[kind] = data
+                progress = []
+                if parts.get("plan"):
+                    progress.append("**Plan:**\n" + "\n".join(f"- {p}" for p in parts["plan"]))
+                if parts.get("sql"):
+                    progress.append(f"```sql\n{parts['sql']}\n```")
+                if parts.get("approx"):
+                    progress.append(format_approx(parts["approx"]))
+                if parts.get("status"):
+                    progress.append(f"_{parts['status']}_")
+                placeholder.markdown("\n\n".join(progress))
             st.session_state.state = new_state
-            st.markdown(answer)
+            render_trace_panel(trace_panel)
+            placeholder.markdown(answer)
             st.session_state.chat.append(("assistant", answer))
         except Exception as e:
             err = f"Something went wrong: {e}"
             st.markdown(err)
             st.session_state.chat.append(("assistant", err))
+
+# Full result of the last answer, streamed to a file by DuckDB on request.
+if st.session_state.state.last_sql:
+    with st.expander("Download full result"):
+        fmt = st.radio("Format", ["csv", "parquet"], horizontal=True, key="export_fmt")
+        if st.button("Prepare download"):
+            try:
+                path = agent.export_result(st.session_state.state.last_sql, fmt)
+                with open(path, "rb") as f:
+                    st.download_button(
+                        f"Download {fmt.upper()}",
+                        f,
+                        file_name=f"result.{fmt}",
+                        mime="text/csv" if fmt == "csv" else "application/octet-stream",
+                    )
+            except Exception as e:
+                st.error(f"Export failed: {e}")
@@ -0,0 +1,46 @@
+import argparse
+import json
+import sys
+
+from src.data_loader import init_db
+from src.schema_reader import read_schema
+from src.agent import AnalyticsAgent
+from src.batch import BatchRunner, BatchWriter, format_summary, read_questions
+from src.config import SETTINGS
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Answer a JSONL file of questions and write the answers.")
+    ap.add_argument("questions", help="JSONL: {\"id\", \"question\", \"thread\"} or {\"id\", \"turns\": [...]} per line")
+    ap.add_argument("output", help="answers as .jsonl or .parquet")
+    ap.add_argument("--format", choices=["jsonl", "parquet"], default="", help="default: from the output extension")
+    ap.add_argument("--concurrency", type=int, default=SETTINGS.batch_concurrency)
+    ap.add_argument("--llm-parallel", type=int, default=SETTINGS.batch_llm_parallel)
+    ap.add_argument("--db-parallel", type=int, default=SETTINGS.batch_db_parallel)
+    ap.add_argument("--summary", default="", help="also write the summary as JSON here")
+    ap.add_argument("--quiet", action="store_true")
+    args = ap.parse_args()
+
+    threads = read_questions(args.questions)
+    con = init_db()
+    schema = read_schema(SETTINGS.schema_path, SETTINGS.table_name)
+    agent = AnalyticsAgent(con, schema)
+    runner = BatchRunner(agent, args.concurrency, args.llm_parallel, args.db_parallel)
+
+    def progress(record):
+        if not args.quiet:
+            status = "ok" if record["ok"] else f"ERROR {record['error']}"
+            print(f"[{record['id']}] {record['total_ms']:.0f} ms {status}", flush=True)
+
+    summary = runner.run(threads, BatchWriter(args.output, args.format), progress)
+    print()
+    for line in format_summary(summary):
+        print(line)
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    sys.exit(1 if summary["errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
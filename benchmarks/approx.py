@@ -0,0 +1,157 @@
+"""
+Error of sample-based approximate answers against exact ones. Builds
+synthetic data (metrics jittered so repeated days differ), draws the
+stratified (date, city) sample at each --rates (re-drawn --draws times),
+and runs the scripted corpus SQL plus ratio-metric questions both ways.
+For every numeric cell of a row present in both results it reports the
+relative error (ratio metrics from src/prompts.py separately), how often
+the exact value falls inside the confidence interval, and the time of the
+approximate run (estimate + replicates) vs the exact query.
+
+    python -m benchmarks.approx --rows 2000000 --rates 0.01,0.02,0.05 --draws 3
+"""
+from __future__ import annotations
+import argparse
+import re
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import duckdb
+
+from src.config import SETTINGS
+from src.data_loader import create_date_view, finalize_storage, get_date_bounds
+from src.rollups import RollupRouter, metric_columns
+from src.sampling import Approximator, build_sample
+from src.schema_reader import read_schema
+from src.sql_rewrite import inline_date_bounds
+from benchmarks.e2e import load_corpus
+from benchmarks.speculative import _pct
+from benchmarks.synth import build_scaled_table, shape_for_rows
+
+T = SETTINGS.table_name
+BASE_ROWS = 3591
+RATIO = re.compile(r"rate")
+# The ratio metrics the system prompt defines, by a few dimensions and filters.
+EXTRA = [
+    "SELECT order_utm_campaign, SUM(dplus_orders) / NULLIF(SUM(dplus_form_filled), 0) AS dplus_conversion_rate, "
+    "SUM(dplus_form_filled) AS forms FROM {view} WHERE order_utm_campaign IS NOT NULL AND order_utm_campaign <> '' "
+    "GROUP BY 1 HAVING SUM(dplus_form_filled) > 0 ORDER BY forms DESC LIMIT 10",
+    "SELECT city, SUM(d0_orders) / NULLIF(SUM(d0_form_filled), 0) AS d0_conversion_rate FROM {view} "
+    "WHERE city IS NOT NULL AND city <> '' GROUP BY city ORDER BY city LIMIT 200",
+    "SELECT DATE_TRUNC('month', date_parsed) AS month, SUM(total_form_filled) / NULLIF(SUM(total_form_start), 0) "
+    "AS form_completion_rate FROM {view} GROUP BY 1 ORDER BY 1 LIMIT 200",
+    "SELECT platform, SUM(dplus_orders) / NULLIF(SUM(dplus_form_filled), 0) AS dplus_conversion_rate FROM {view} "
+    "WHERE city = 'Mumbai' AND date_parsed >= (SELECT MAX(date_parsed) FROM {view}) - INTERVAL '90 days' "
+    "GROUP BY platform ORDER BY platform LIMIT 200",
+]
+
+
+def jitter(con: duckdb.DuckDBPyConnection, cols: List[str]) -> None:
+    # Replicated days are identical copies; give each row its own values.
+    sets = ", ".join(f'"{c}" = CAST(ROUND("{c}" * (0.4 + 1.2 * random())) AS {t})' for c, t in cols)
+    con.execute(f"UPDATE {T} SET {sets}")
+
+
+def _rows(table, keys: List[str]) -> Dict[Tuple[Any, ...], Dict[str, Any]]:
+    out: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+    for i, row in enumerate(table.to_pylist()):
+        out[tuple(row[c] for c in keys) if keys else (i,)] = row
+    return out
+
+
+def compare(exact, approx) -> List[Dict[str, Any]]:
+    """One record per numeric cell of the rows both results have."""
+    keys = [c for c in approx.result.columns if c not in approx.intervals]
+    ex = _rows(exact, keys)
+    ap_rows = approx.result.head.to_pylist()
+    out = []
+    for i, row in enumerate(ap_rows):
+        key = tuple(row[c] for c in keys) if keys else (i,)
+        if key not in ex:
+            out.append({"matched": False})
+            continue
+        for c, ivs in approx.intervals.items():
+            truth, est, iv = ex[key].get(c), row[c], ivs[i]
+            if truth is None or est is None:
+                continue
+            truth, est = float(truth), float(est)
+            err = abs(est - truth) / abs(truth) if truth else abs(est)
+            out.append({
+                "matched": True, "ratio": bool(RATIO.search(c)), "err": err, "has_ci": iv is not None,
+                "covered": iv is None or iv[0] - 1e-9 <= truth <= iv[1] + 1e-9,
+            })
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=2_000_000)
+    ap.add_argument("--rates", default="0.01,0.02,0.05")
+    ap.add_argument("--min-per-stratum", type=int, default=SETTINGS.approx_min_per_stratum)
+    ap.add_argument("--replicates", type=int, default=SETTINGS.approx_replicates)
+    ap.add_argument("--draws", type=int, default=3, help="samples drawn per rate")
+    args = ap.parse_args()
+
+    con = duckdb.connect()
+    scale, density = shape_for_rows(args.rows, BASE_ROWS)
+    rows = build_scaled_table(con, T, scale, density)
+    schema = read_schema(SETTINGS.schema_path, T)
+    described = dict(con.execute(f"SELECT column_name, column_type FROM (DESCRIBE {T})").fetchall())
+    jitter(con, [(m, described[m]) for m in metric_columns(schema) if m in described])
+    create_date_view(con, T)
+    finalize_storage(con, T, schema)
+    view = f"{T}_v"
+    rollups = RollupRouter(con, schema, T, [view, T])
+    approx = Approximator(con, schema, T, rollups)
+    bounds = get_date_bounds(con, T)
+
+    corpus = [t["sql"] for c in load_corpus() for t in c["turns"] if t.get("sql") and not t.get("refine")]
+    queries = [inline_date_bounds(q.replace("{view}", view), [view, T], bounds) for q in corpus + EXTRA]
+    exact: List[Optional[Any]] = []
+    exact_ms: List[float] = []
+    for q in queries:
+        t0 = time.perf_counter()
+        try:
+            exact.append(con.execute(q).fetch_arrow_table())
+        except duckdb.Error:
+            exact.append(None)  # a deliberately broken corpus query
+        exact_ms.append((time.perf_counter() - t0) * 1000)
+    runnable = [i for i, e in enumerate(exact) if e is not None]
+    print(f"{rows:,} rows, {len(runnable)} runnable queries; exact median {statistics.median(exact_ms[i] for i in runnable):.0f} ms")
+    print(f"{'rate':>5} {'sample':>9} {'frac':>6} {'usable':>6} {'ratio err p50':>13} {'p90':>7} "
+          f"{'other err p50':>13} {'p90':>7} {'CI cover':>8} {'unmatched':>9} {'approx ms':>9}")
+
+    worst_cover = 1.0
+    for rate in [float(r) for r in args.rates.split(",")]:
+        cells: List[Dict[str, Any]] = []
+        usable, ms = 0, []
+        for _ in range(args.draws):
+            sample = build_sample(con, T, schema, rate, args.min_per_stratum, args.replicates, min_rows=0)
+            approx.reload()
+            for i in runnable:
+                result = approx.run(con, queries[i], SETTINGS.query_timeout_s)
+                if result is None:
+                    continue
+                usable += 1
+                ms.append(result.ms)
+                cells += compare(exact[i], result)
+        matched = [c for c in cells if c["matched"]]
+        ratio = [c["err"] for c in matched if c["ratio"]]
+        other = [c["err"] for c in matched if not c["ratio"]]
+        with_ci = [c for c in matched if c["has_ci"]]
+        cover = sum(c["covered"] for c in with_ci) / len(with_ci) if with_ci else 1.0
+        worst_cover = min(worst_cover, cover)
+        print(f"{rate:5.2f} {sample.rows:9,d} {sample.fraction:6.1%} {usable // args.draws:6d} "
+              f"{_pct(ratio, 0.5) if ratio else 0:13.2%} {_pct(ratio, 0.9) if ratio else 0:7.2%} "
+              f"{_pct(other, 0.5) if other else 0:13.2%} {_pct(other, 0.9) if other else 0:7.2%} "
+              f"{cover:8.1%} {sum(not c['matched'] for c in cells):9d} {statistics.median(ms) if ms else 0:9.0f}")
+    print(f"target coverage {SETTINGS.approx_confidence:.0%} ({args.replicates} replicates, "
+          f"at least {args.min_per_stratum} rows per (date, city) stratum)")
+    # Intervals must be roughly calibrated: well below nominal means they mislead.
+    sys.exit(0 if worst_cover >= SETTINGS.approx_confidence - 0.1 else 1)
+
+
+if __name__ == "__main__":
+    main()
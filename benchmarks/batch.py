@@ -0,0 +1,106 @@
+"""
+Batch mode throughput. Writes the scripted conversations as a batch file
+(each conversation --copies times, as a report pack asking the same things
+for several teams would), then answers it through src/batch.py with a fake
+Ollama on synthetic data: once one conversation at a time and once with
+--concurrency workers and --llm-parallel model slots. Prints each run's
+summary, checks both runs gave every question the same SQL and rows, and
+that the Parquet output reads back.
+
+    python -m benchmarks.batch --rows 200000 --copies 3 --concurrency 6 --llm-parallel 3
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+import tempfile
+from typing import Any, Dict
+
+import duckdb
+import pyarrow.parquet as pq
+
+from src.agent import AnalyticsAgent
+from src.batch import BatchRunner, BatchWriter, format_summary, read_questions
+from src.config import SETTINGS
+from src.data_loader import create_date_view, finalize_storage
+from src.llm_ollama import OllamaClient
+from src.schema_reader import read_schema
+from benchmarks.e2e import ScriptedResponder, load_corpus
+from benchmarks.fake_ollama import FakeOllama
+from benchmarks.synth import build_scaled_table, shape_for_rows
+
+T = SETTINGS.table_name
+BASE_ROWS = 3591
+
+
+def write_batch(path: str, copies: int) -> int:
+    n = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for c, conv in enumerate(load_corpus()):
+            for k in range(copies):
+                f.write(json.dumps({"id": f"c{c}-{k}", "turns": [t["question"] for t in conv["turns"]]}) + "\n")
+                n += len(conv["turns"])
+    return n
+
+
+def run(agent: AnalyticsAgent, fake: FakeOllama, batch: str, out: str, concurrency: int, llm_parallel: int) -> Dict[str, Any]:
+    agent.llm = OllamaClient(base_url=fake.url)
+    agent.result_cache.clear()
+    summary = BatchRunner(agent, concurrency, llm_parallel).run(read_questions(batch), BatchWriter(out))
+    print(f"-- concurrency {concurrency}, llm parallel {llm_parallel}")
+    for line in format_summary(summary):
+        print("   " + line)
+    return summary
+
+
+def _answers(path: str) -> Dict[str, Any]:
+    if path.endswith(".parquet"):
+        return {r["id"]: (r["sql"], json.loads(r["rows"])) for r in pq.read_table(path).to_pylist()}
+    with open(path, encoding="utf-8") as f:
+        return {r["id"]: (r["sql"], r["rows"]) for r in map(json.loads, f)}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=200_000)
+    ap.add_argument("--copies", type=int, default=3, help="times each conversation appears in the batch")
+    ap.add_argument("--concurrency", type=int, default=6)
+    ap.add_argument("--llm-parallel", type=int, default=3)
+    ap.add_argument("--chunk-ms", type=float, default=4.0)
+    ap.add_argument("--parallel-slowdown", type=float, default=0.15)
+    args = ap.parse_args()
+
+    con = duckdb.connect()
+    scale, density = shape_for_rows(args.rows, BASE_ROWS)
+    rows = build_scaled_table(con, T, scale, density)
+    create_date_view(con, T)
+    schema = read_schema(SETTINGS.schema_path, T)
+    finalize_storage(con, T, schema)
+    agent = AnalyticsAgent(con, schema)
+    # Every question goes to the model; a repeat is only saved at the SQL level.
+    agent.question_cache.enabled = False
+    fake = FakeOllama(chunk_ms=args.chunk_ms, parallel_slowdown=args.parallel_slowdown).start()
+    fake.responder = ScriptedResponder(load_corpus(), agent.table_view)
+
+    tmp = tempfile.mkdtemp(prefix="batch-bench-")
+    batch = os.path.join(tmp, "questions.jsonl")
+    n = write_batch(batch, args.copies)
+    print(f"{rows:,} rows, {n} questions; fake model chunk {args.chunk_ms} ms, parallel slowdown {args.parallel_slowdown}")
+
+    seq = run(agent, fake, batch, os.path.join(tmp, "sequential.jsonl"), 1, 1)
+    par = run(agent, fake, batch, os.path.join(tmp, "concurrent.parquet"), args.concurrency, args.llm_parallel)
+    fake.stop()
+    print(f"throughput x{par['questions_per_s'] / seq['questions_per_s']:.2f}, "
+          f"p50 {seq['latency_ms']['p50']:.0f} -> {par['latency_ms']['p50']:.0f} ms")
+
+    a, b = _answers(os.path.join(tmp, "sequential.jsonl")), _answers(os.path.join(tmp, "concurrent.parquet"))
+    differ = [k for k in a if a[k] != b.get(k)]
+    for k in differ[:5]:
+        print("DIFFERENT", k, a[k][0], "|", b.get(k, (None,))[0])
+    ok = len(a) == len(b) == n and not differ and seq["errors"] == par["errors"] == 0
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Model cascade thresholds. Replays the scripted conversations against a
+fake Ollama that serves two models: a large one that is right almost
+always, and a small one that is ~3x faster but whose answers go wrong more
+often the harder the question's reference SQL is (subqueries, window
+functions, several GROUP BY columns). The difficulty comes from the SQL, not from the
+router's question score. A wrong small-model answer is either not JSON
+(escalated before running) or a query that fails to run (escalated on
+refine); the large model only gets the second kind.
+
+For each CASCADE_THRESHOLD it prints latency percentiles, answers that
+failed, the share routed to the small model and escalations, then the
+small model's success rate by complexity score (from the run that routes
+everything to it). That table is the data to pick a threshold from.
+
+    python -m benchmarks.cascade --thresholds off,1.5,2,3,4,all
+"""
+from __future__ import annotations
+import argparse
+import random
+import re
+import statistics
+import sys
+import threading
+from typing import Any, Dict, List
+
+import duckdb
+
+from src.agent import AnalyticsAgent, ChatState
+from src.config import SETTINGS
+from src.data_loader import create_date_view, finalize_storage
+from src.llm_ollama import OllamaClient
+from src.schema_reader import read_schema
+from benchmarks.e2e import _question_of, _reply, load_corpus
+from benchmarks.fake_ollama import FakeOllama
+from benchmarks.speculative import BROKEN, _pct
+from benchmarks.synth import build_scaled_table, shape_for_rows
+
+T = SETTINGS.table_name
+BASE_ROWS = 3591
+LARGE, SMALL = "large-model", "small-model"
+
+
+def sql_difficulty(sql: str) -> int:
+    low = sql.lower()
+    group = re.search(r"group by (.*?)(?: order by| having| limit|\)|$)", low)
+    return (low.count("select") - 1 + low.count(" over (") + low.count(" join ")
+            + (len(group.group(1).split(",")) > 1 if group else 0))
+
+
+class TwoModelResponder:
+    """Scripted SQL from the large model; the small one fails with probability base + slope * difficulty."""
+
+    by_model = True
+
+    def __init__(self, turns: Dict[str, str], view: str, base: float, slope: float, large_fail: float, seed: int):
+        self.turns = turns
+        self.view = view
+        self.base, self.slope, self.large_fail = base, slope, large_fail
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, messages: List[Dict[str, str]], model: str) -> str:
+        question, _ = _question_of(messages)
+        sql = self.turns.get(question, "SELECT COUNT(*) AS n FROM {view}")
+        p = self.large_fail if model == LARGE else min(0.95, self.base + self.slope * sql_difficulty(sql))
+        with self._lock:
+            wrong, kind = self.rng.random() < p, self.rng.random()
+        if wrong and kind < 0.5 and model != LARGE:
+            return "Sure! Here is the query you asked for:\nSELECT ..."
+        if wrong:
+            sql = self.rng.choice(BROKEN)
+        return _reply(sql.replace("{view}", self.view), question)
+
+
+def _run(agent: AnalyticsAgent, conversations: List[List[str]]) -> List[Dict[str, Any]]:
+    out = []
+    for turns in conversations:
+        state = ChatState()
+        for q in turns:
+            follow_up = bool(state.last_sql)
+            ans, state = agent.answer(q, state)
+            trace = state.last_trace or {}
+            out.append({
+                "ms": trace.get("total_ms", 0.0),
+                "model": trace.get("model"),
+                "score": agent.router.complexity(q, follow_up)["score"],
+                "escalated": trace.get("escalated"),
+                "ok": not ans.startswith("I couldn't"),
+            })
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=200_000)
+    ap.add_argument("--thresholds", default="off,1.5,2,3,4,all")
+    ap.add_argument("--repeat", type=int, default=2, help="times through the corpus per threshold")
+    ap.add_argument("--large-chunk-ms", type=float, default=4.0)
+    ap.add_argument("--small-chunk-ms", type=float, default=1.3)
+    ap.add_argument("--small-fail", type=float, default=0.05, help="small model failure rate on the simplest SQL")
+    ap.add_argument("--small-fail-slope", type=float, default=0.25, help="added per unit of SQL difficulty")
+    ap.add_argument("--large-fail", type=float, default=0.03)
+    ap.add_argument("--seed", type=int, default=11)
+    args = ap.parse_args()
+
+    con = duckdb.connect()
+    scale, density = shape_for_rows(args.rows, BASE_ROWS)
+    rows = build_scaled_table(con, T, scale, density)
+    create_date_view(con, T)
+    schema = read_schema(SETTINGS.schema_path, T)
+    finalize_storage(con, T, schema)
+
+    corpus = load_corpus()
+    turns = {t["question"]: t["sql"] for c in corpus for t in c["turns"] if t.get("sql") and not t.get("refine")}
+    conversations = [[t["question"] for t in c["turns"] if t["question"] in turns] for c in corpus] * args.repeat
+    fake = FakeOllama(chunk_ms_by_model={LARGE: args.large_chunk_ms, SMALL: args.small_chunk_ms}).start()
+    agent = AnalyticsAgent(con, schema)
+    agent.llm = OllamaClient(base_url=fake.url, model=LARGE)
+    agent.question_cache.enabled = False
+    agent.intents.enabled = False
+    agent.session_cache.enabled = False
+    agent.result_cache.max_entries = 0
+    agent.speculative = False
+    agent.router.large_model = LARGE
+    n = sum(len(c) for c in conversations)
+    print(f"{rows:,} rows, {n} questions per threshold; chunk ms large {args.large_chunk_ms}, small {args.small_chunk_ms}")
+
+    print(f"{'threshold':>9} {'p50 ms':>8} {'p90 ms':>8} {'mean ms':>8} {'failed':>6} {'small':>6} {'escalated':>9}  per model")
+    everything: List[Dict[str, Any]] = []
+    results = {}
+    for spec in args.thresholds.split(","):
+        spec = spec.strip()
+        agent.router.small_model = "" if spec == "off" else SMALL
+        agent.router.threshold = float("inf") if spec == "all" else (0.0 if spec == "off" else float(spec))
+        agent.router.reset_stats()
+        fake.responder = TwoModelResponder(turns, agent.table_view, args.small_fail, args.small_fail_slope, args.large_fail, args.seed)
+        runs = _run(agent, conversations)
+        if spec == "all":
+            everything = runs
+        ms = [r["ms"] for r in runs]
+        failed = sum(not r["ok"] for r in runs)
+        small = sum(r["model"] == SMALL for r in runs)
+        escalated = sum(bool(r["escalated"]) for r in runs)
+        results[spec] = failed
+        per_model = "; ".join(
+            f"{m}: {s['calls']} calls p50 {s['latency_p50_ms']:.0f} ms, {s['success_rate'] if s['success_rate'] is not None else '-'} ok"
+            for m, s in agent.router.stats().items()
+        )
+        print(f"{spec:>9} {_pct(ms, 0.5):8.0f} {_pct(ms, 0.9):8.0f} {statistics.mean(ms):8.0f} {failed:6d} "
+              f"{small:6d} {escalated:9d}  {per_model}")
+
+    if everything:
+        print("small model by complexity score (threshold=all):")
+        buckets: Dict[float, List[Dict[str, Any]]] = {}
+        for r in everything:
+            buckets.setdefault(min(6.0, r["score"] // 1), []).append(r)
+        for b in sorted(buckets):
+            rs = buckets[b]
+            ok = sum(not r["escalated"] and r["ok"] for r in rs)
+            label = f"{b:.0f}-{b + 1:.0f}" if b < 6 else "6+"
+            print(f"  score {label:>4}: {len(rs):3d} questions, small model right first time {ok / len(rs):.0%}, "
+                  f"median {statistics.median(r['ms'] for r in rs):.0f} ms")
+    fake.stop()
+    # Escalation must keep the cascade from failing more answers than the large model alone.
+    base = results.get("off", 0)
+    sys.exit(1 if any(f > base + 1 for f in results.values()) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Concurrent sessions against one AnalyticsAgent. N simulated users each ask
+`--questions` questions back to back; the fake Ollama server answers with
+SQL drawn from the rollups corpus, so the time goes to DuckDB. Reports
+answer latency percentiles and throughput per N.
+
+    python -m benchmarks.concurrency --scale 30 --sessions 1,2,4,8,16
+    python -m benchmarks.concurrency --pool-size 1   # single-cursor baseline
+"""
+from __future__ import annotations
+import argparse
+import json
+import statistics
+import threading
+import time
+
+import duckdb
+
+from src.agent import AnalyticsAgent, ChatState
+from src.config import SETTINGS
+from src.data_loader import create_date_view, finalize_storage
+from src.db_pool import CursorPool
+from src.llm_ollama import OllamaClient
+from src.schema_reader import read_schema
+from benchmarks.fake_ollama import FakeOllama
+from benchmarks.rollups import CORPUS
+from benchmarks.synth import build_scaled_table
+
+T = SETTINGS.table_name
+
+
+def corpus_sql():
+    return [sql.replace("t_v", f"{T}_v") for sql, _ in CORPUS]
+
+
+def responder(queries):
+    def reply(messages):
+        # Question text is "q<i>"; answer with the i-th corpus query.
+        i = int(messages[-1]["content"].rsplit("q", 1)[1])
+        return json.dumps({"analysis_plan": ["run corpus query"], "sql": queries[i % len(queries)],
+                           "result_interpretation": "", "assumptions": [], "followups": []})
+    return reply
+
+
+def pct(xs, p):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+
+
+def run(agent: AnalyticsAgent, sessions: int, questions: int, n_queries: int):
+    latencies, lock = [], threading.Lock()
+
+    def user(u):
+        state = ChatState()
+        for k in range(questions):
+            t0 = time.perf_counter()
+            _, state = agent.answer(f"q{(u * questions + k) % n_queries}", ChatState())
+            with lock:
+                latencies.append(time.perf_counter() - t0)
+
+    threads = [threading.Thread(target=user, args=(u,)) for u in range(sessions)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scale", type=int, default=30)
+    ap.add_argument("--sessions", default="1,2,4,8,16")
+    ap.add_argument("--questions", type=int, default=8)
+    ap.add_argument("--pool-size", type=int, default=SETTINGS.db_cursor_pool_size)
+    ap.add_argument("--chunk-ms", type=float, default=0.0)
+    ap.add_argument("--rollups", action="store_true", help="keep rollup routing on (off by default so queries hit the base table)")
+    args = ap.parse_args()
+
+    con = duckdb.connect()
+    if SETTINGS.duckdb_threads > 0:
+        con.execute(f"SET threads = {SETTINGS.duckdb_threads}")
+    schema = read_schema(SETTINGS.schema_path, T)
+    rows = build_scaled_table(con, T, args.scale)
+    create_date_view(con, T)
+    finalize_storage(con, T, schema)
+
+    queries = corpus_sql()
+    fake = FakeOllama(chunk_ms=args.chunk_ms, responder=responder(queries)).start()
+    try:
+        agent = AnalyticsAgent(con, schema)
+        agent.llm = OllamaClient(base_url=fake.url, max_in_flight=64)
+        agent.question_cache.enabled = False
+        agent.intents.enabled = False
+        agent.result_cache.max_entries = 0  # re-run every query
+        agent.cursors = CursorPool(con, args.pool_size)
+        if not args.rollups:
+            agent.rollups.route = lambda sql: sql
+
+        print(f"{rows} rows, cursor pool {args.pool_size}, {len(queries)} distinct queries")
+        print(f"{'N':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'answers/s':>10}")
+        for n in [int(x) for x in args.sessions.split(",")]:
+            lat, wall = run(agent, n, args.questions, len(queries))
+            ms = [x * 1000 for x in lat]
+            print(f"{n:>4} {statistics.median(ms):9.1f} {pct(ms, 95):9.1f} {pct(ms, 99):9.1f} {len(lat) / wall:10.1f}")
+    finally:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,435 @@
+"""
+Offline end-to-end benchmark. Replays the scripted conversations in
+benchmarks/questions.json through a real AnalyticsAgent, with a local fake
+Ollama answering from the script, on synthetic data of any size. Reports
+cold start, per-question latency percentiles, DuckDB execution time,
+memory high-water marks and refine/repair counts, and writes them as JSON
+so two runs can be compared.
+
+    python -m benchmarks.e2e --rows 1000000 --passes 3 --out .cache/bench/base.json
+    python -m benchmarks.e2e --rows 1000000 --passes 3 --out .cache/bench/new.json
+    python -m benchmarks.e2e --compare .cache/bench/base.json .cache/bench/new.json
+
+    # re-record the script's responses from a real Ollama (OLLAMA_BASE_URL)
+    python -m benchmarks.e2e --record benchmarks/questions.recorded.json
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+import duckdb
+
+from src.agent import AnalyticsAgent, ChatState
+from src.config import SETTINGS
+from src.data_loader import create_date_view, finalize_storage
+from src.llm_ollama import OllamaClient
+from src.question_cache import QuestionCache
+from src.schema_reader import read_schema
+from src.tracing import TraceLog
+from benchmarks.fake_ollama import FakeOllama
+from benchmarks.synth import build_scaled_table, shape_for_rows
+
+T = SETTINGS.table_name
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "questions.json")
+BASE_ROWS = 3591
+_QUESTION = re.compile(r"User question:\n(.*?)(?:\n\nPrevious SQL:|$)", re.DOTALL)
+
+
+def load_corpus(path: str = CORPUS_PATH) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["conversations"]
+
+
+def _question_of(messages: List[Dict[str, str]]) -> Tuple[str, bool]:
+    """(question text, is a refine call) from the agent's chat messages."""
+    for m in reversed(messages):
+        if m.get("role") != "user":
+            continue
+        hit = _QUESTION.search(m.get("content", ""))
+        if hit:
+            return hit.group(1).strip(), any(x.get("role") == "assistant" or "Previous SQL:" in x.get("content", "") for x in messages)
+    return "", False
+
+
+def _reply(sql: str, question: str) -> str:
+    return json.dumps({
+        "analysis_plan": [f"Answer: {question}", "Aggregate the requested metric"],
+        "sql": sql,
+        "result_interpretation": "Scripted benchmark answer.",
+        "assumptions": [],
+        "followups": [],
+    }, indent=2)
+
+
+class ScriptedResponder:
+    """
+    Fake-model replies from the corpus: the turn's `sql` (or recorded raw
+    `response`) for a question, then its `refine` entries on successive
+    refine calls. Unknown questions get a harmless scalar query.
+    """
+
+    def __init__(self, conversations: List[Dict[str, Any]], view: str):
+        self.view = view
+        self.turns = {t["question"]: t for c in conversations for t in c["turns"]}
+        self._refines: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, messages: List[Dict[str, str]]) -> str:
+        question, refine = _question_of(messages)
+        turn = self.turns.get(question, {})
+        with self._lock:
+            if not refine:
+                self._refines[question] = 0
+                if turn.get("response"):
+                    return turn["response"]
+                sql = turn.get("sql", "SELECT COUNT(*) AS n FROM {view}")
+            else:
+                i = self._refines.get(question, 0)
+                self._refines[question] = i + 1
+                recorded = turn.get("refine_responses") or []
+                if i < len(recorded):
+                    return recorded[i]
+                scripts = turn.get("refine") or [turn.get("sql", "SELECT COUNT(*) AS n FROM {view}")]
+                sql = scripts[min(i, len(scripts) - 1)]
+        return _reply(sql.replace("{view}", self.view), question)
+
+
+class RecordingClient(OllamaClient):
+    """Passes calls through to a real Ollama and keeps the raw replies per question."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.recorded: Dict[str, Dict[str, Any]] = {}
+
+    def _keep(self, messages, text):
+        question, refine = _question_of(messages)
+        entry = self.recorded.setdefault(question, {"response": None, "refine_responses": []})
+        if refine:
+            entry["refine_responses"].append(text)
+        else:
+            entry["response"], entry["refine_responses"] = text, []
+
+    def chat(self, messages, temperature=0.2, usage=None, model=None):
+        text = super().chat(messages, temperature, usage, model)
+        self._keep(messages, text)
+        return text
+
+    def chat_stream(self, messages, temperature=0.2, usage=None, model=None):
+        parts = []
+        for delta in super().chat_stream(messages, temperature, usage, model):
+            parts.append(delta)
+            yield delta
+        self._keep(messages, "".join(parts))
+
+
+def _duckdb_memory_mb(con: duckdb.DuckDBPyConnection) -> float:
+    try:
+        return (con.execute("SELECT SUM(memory_usage_bytes) FROM duckdb_memory()").fetchone()[0] or 0) / 1e6
+    except duckdb.Error:
+        return 0.0
+
+
+def _rss_hwm_mb() -> float:
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return kb / 1024 if sys.platform != "darwin" else kb / 1e6
+
+
+def pct(xs: List[float], p: float) -> float:
+    if not xs:
+        return 0.0
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+
+
+def _dist(xs: List[float]) -> Dict[str, float]:
+    return {
+        "n": len(xs),
+        "mean": statistics.fmean(xs) if xs else 0.0,
+        "p50": pct(xs, 50),
+        "p95": pct(xs, 95),
+        "p99": pct(xs, 99),
+        "max": max(xs, default=0.0),
+    }
+
+
+def _turn_record(trace: Dict[str, Any], latency_ms: float) -> Dict[str, Any]:
+    spans = trace.get("spans", [])
+    execs = [s for s in spans if s["name"] == "execute"]
+    return {
+        "latency_ms": latency_ms,
+        "source": trace.get("source"),
+        "ok": "rows" in trace,
+        "rows": trace.get("rows"),
+        "exec_ms": sum(s["ms"] for s in execs),
+        "duckdb_ms": sum((s.get("profile") or {}).get("duckdb_ms", 0.0) for s in execs),
+        "llm_ms": sum(s["ms"] for s in spans if s["name"] == "llm"),
+        "llm_calls": sum(1 for s in spans if s["name"] == "llm"),
+        "refine_calls": sum(1 for s in spans if s["name"] == "llm" and s.get("kind") == "refine"),
+        "local_repairs": sum(1 for s in spans if s["name"] == "repair" and s.get("fixed")),
+        "prompt_tokens": sum(s.get("prompt_tokens") or 0 for s in spans if s["name"] == "llm"),
+    }
+
+
+def run_corpus(agent: AnalyticsAgent, conversations: List[Dict[str, Any]], passes: int) -> List[Dict[str, Any]]:
+    out = []
+    for p in range(passes):
+        for conv in conversations:
+            state = ChatState()
+            for k, turn in enumerate(conv["turns"]):
+                t0 = time.perf_counter()
+                _, state = agent.answer(turn["question"], state)
+                latency = (time.perf_counter() - t0) * 1000
+                rec = _turn_record(state.last_trace or {}, latency)
+                rec.update(passno=p, conversation=conv["name"], turn=k, question=turn["question"],
+                           duckdb_mem_mb=_duckdb_memory_mb(agent.con))
+                out.append(rec)
+    return out
+
+
+def summarize(turns: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "latency_ms": _dist([t["latency_ms"] for t in turns]),
+        "exec_ms": _dist([t["exec_ms"] for t in turns]),
+        "duckdb_ms": _dist([t["duckdb_ms"] for t in turns]),
+        "llm_ms": _dist([t["llm_ms"] for t in turns]),
+        "answers": len(turns),
+        "failures": sum(1 for t in turns if not t["ok"]),
+        "llm_calls": sum(t["llm_calls"] for t in turns),
+        "refine_calls": sum(t["refine_calls"] for t in turns),
+        "local_repairs": sum(t["local_repairs"] for t in turns),
+        "prompt_tokens": sum(t["prompt_tokens"] for t in turns),
+        "duckdb_mem_hwm_mb": max((t["duckdb_mem_mb"] for t in turns), default=0.0),
+    }
+
+
+def _git_head() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def _open_data(args) -> Tuple[duckdb.DuckDBPyConnection, int, float]:
+    """Connection holding the synthetic table; reuses --db when it already has enough rows."""
+    t0 = time.perf_counter()
+    con = duckdb.connect(args.db or ":memory:")
+    if SETTINGS.duckdb_threads > 0:
+        con.execute(f"SET threads = {SETTINGS.duckdb_threads}")
+    if SETTINGS.duckdb_memory_limit:
+        con.execute(f"SET memory_limit = '{SETTINGS.duckdb_memory_limit}'")
+    try:
+        rows = con.execute(f"SELECT COUNT(*) FROM {T}").fetchone()[0]
+    except duckdb.Error:
+        rows = 0
+    if rows < args.rows:
+        scale, density = shape_for_rows(args.rows, BASE_ROWS)
+        rows = build_scaled_table(con, T, scale, density)
+    create_date_view(con, T)
+    return con, rows, time.perf_counter() - t0
+
+
+def bench(args) -> Dict[str, Any]:
+    conversations = load_corpus(args.corpus)
+    con, rows, build_s = _open_data(args)
+    schema = read_schema(SETTINGS.schema_path, T)
+    responder = ScriptedResponder(conversations, f"{T}_v")
+    fake = FakeOllama(
+        chunk_ms=args.chunk_ms,
+        first_token_ms=args.first_token_ms,
+        prefill_ms_per_token=args.prefill_ms_per_token,
+        responder=responder,
+    ).start()
+    work = tempfile.mkdtemp(prefix="bench_e2e_")
+    try:
+        t0 = time.perf_counter()
+        finalize_storage(con, T, schema)
+        agent = AnalyticsAgent(con, schema)
+        cold_start_s = time.perf_counter() - t0
+
+        agent.llm = OllamaClient(base_url=fake.url)
+        agent.trace_log = TraceLog(args.trace_log)
+        if args.fast_paths:
+            # Fresh question cache so runs stay comparable.
+            agent.question_cache = QuestionCache(
+                os.path.join(work, "qc.sqlite"), agent.question_cache.prompt_version, agent.values
+            )
+        else:
+            agent.intents.enabled = False
+            agent.question_cache.enabled = False
+            agent.result_cache.max_entries = 0
+
+        turns = run_corpus(agent, conversations, args.passes)
+    finally:
+        fake.stop()
+
+    return {
+        "meta": {
+            "git": _git_head(),
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "duckdb": duckdb.__version__,
+            "cpus": os.cpu_count(),
+            "rows": rows,
+            "passes": args.passes,
+            "chunk_ms": args.chunk_ms,
+            "first_token_ms": args.first_token_ms,
+            "prefill_ms_per_token": args.prefill_ms_per_token,
+            "fast_paths": args.fast_paths,
+            "corpus": os.path.basename(args.corpus),
+        },
+        "data_build_s": build_s,
+        "cold_start_s": cold_start_s,
+        "first_answer_ms": turns[0]["latency_ms"] if turns else 0.0,
+        "rss_hwm_mb": _rss_hwm_mb(),
+        "summary": summarize(turns),
+        "turns": turns,
+    }
+
+
+def print_report(res: Dict[str, Any]) -> None:
+    m, s = res["meta"], res["summary"]
+    print(f"{m['rows']:,} rows, {m['passes']} pass(es), {s['answers']} answers, git {m['git'] or '?'}")
+    print(f"data build     : {res['data_build_s']:.2f} s (not part of cold start)")
+    print(f"cold start     : {res['cold_start_s']:.2f} s   first answer {res['first_answer_ms']:.0f} ms")
+    for key in ("latency_ms", "exec_ms", "duckdb_ms", "llm_ms"):
+        d = s[key]
+        print(f"{key:<15}: p50 {d['p50']:8.1f}  p95 {d['p95']:8.1f}  p99 {d['p99']:8.1f}  max {d['max']:8.1f}")
+    print(f"llm calls      : {s['llm_calls']} ({s['refine_calls']} refine), {s['local_repairs']} local repairs, {s['failures']} failures")
+    print(f"prefill tokens : {s['prompt_tokens']} (prompt tokens not served from the model's KV cache)")
+    # RSS includes building the synthetic table unless --db already had it.
+    print(f"memory         : RSS high-water {res['rss_hwm_mb']:.0f} MB, DuckDB peak {s['duckdb_mem_hwm_mb']:.0f} MB")
+    by_q: Dict[str, List[float]] = {}
+    for t in res["turns"]:
+        by_q.setdefault(t["question"], []).append(t["latency_ms"])
+    print("\nper question (median ms):")
+    for q, xs in sorted(by_q.items(), key=lambda kv: -statistics.median(kv[1])):
+        print(f"  {statistics.median(xs):8.1f}  {q[:70]}")
+
+
+# (path into the result, "lower is better" metric name); counts are compared absolutely.
+COMPARED = [
+    (("cold_start_s",), "cold start s"),
+    (("first_answer_ms",), "first answer ms"),
+    (("summary", "latency_ms", "p50"), "latency p50 ms"),
+    (("summary", "latency_ms", "p95"), "latency p95 ms"),
+    (("summary", "latency_ms", "p99"), "latency p99 ms"),
+    (("summary", "duckdb_ms", "p50"), "duckdb p50 ms"),
+    (("summary", "duckdb_ms", "p95"), "duckdb p95 ms"),
+    (("summary", "llm_ms", "p50"), "llm p50 ms"),
+    (("rss_hwm_mb",), "RSS high-water MB"),
+    (("summary", "duckdb_mem_hwm_mb"), "DuckDB peak MB"),
+]
+COUNTS = [("llm_calls", "LLM calls"), ("refine_calls", "refine calls"), ("failures", "failures"), ("prompt_tokens", "prefill tokens")]
+
+
+def _get(d: Dict[str, Any], path) -> float:
+    for k in path:
+        d = d[k]
+    return float(d)
+
+
+def compare(base: Dict[str, Any], new: Dict[str, Any], threshold: float, floor_ms: float) -> int:
+    """Print base vs new; return the number of regressions."""
+    if base["meta"]["rows"] != new["meta"]["rows"] or base["meta"]["corpus"] != new["meta"]["corpus"]:
+        print("warning: runs used different data sizes or corpora")
+    regressions = 0
+    print(f"{'metric':<20} {'base':>10} {'new':>10} {'change':>8}")
+    for path, label in COMPARED:
+        a, b = _get(base, path), _get(new, path)
+        change = (b - a) / a if a else 0.0
+        floor = floor_ms / 1000 if label.endswith(" s") else floor_ms
+        bad = change > threshold and (b - a) > floor
+        regressions += bad
+        print(f"{label:<20} {a:10.1f} {b:10.1f} {change:+8.1%}{'  REGRESSION' if bad else ''}")
+    for key, label in COUNTS:
+        a, b = base["summary"][key], new["summary"][key]
+        bad = b > a
+        regressions += bad
+        print(f"{label:<20} {a:10d} {b:10d} {b - a:+8d}{'  REGRESSION' if bad else ''}")
+
+    def medians(res):
+        by_q: Dict[str, List[float]] = {}
+        for t in res["turns"]:
+            by_q.setdefault(t["question"], []).append(t["latency_ms"])
+        return {q: statistics.median(xs) for q, xs in by_q.items()}
+
+    ma, mb = medians(base), medians(new)
+    worst = sorted(((mb[q] - ma[q], q) for q in ma.keys() & mb.keys()), reverse=True)[:5]
+    print("\nlargest per-question slowdowns (median ms):")
+    for delta, q in worst:
+        print(f"  {ma[q]:8.1f} -> {mb[q]:8.1f}  {q[:60]}")
+    return regressions
+
+
+def record(args) -> None:
+    """Run the corpus against the real Ollama and write it back with the raw replies."""
+    conversations = load_corpus(args.corpus)
+    con, _, _ = _open_data(args)
+    schema = read_schema(SETTINGS.schema_path, T)
+    finalize_storage(con, T, schema)
+    agent = AnalyticsAgent(con, schema)
+    client = RecordingClient()
+    agent.llm = client
+    agent.intents.enabled = False
+    agent.question_cache.enabled = False
+    run_corpus(agent, conversations, 1)
+    for conv in conversations:
+        for turn in conv["turns"]:
+            turn.update({k: v for k, v in client.recorded.get(turn["question"], {}).items() if v})
+    with open(args.record, "w", encoding="utf-8") as f:
+        json.dump({"note": "Recorded from " + client.base_url, "conversations": conversations}, f, indent=2)
+    print(f"recorded {len(client.recorded)} question(s) to {args.record}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--corpus", default=CORPUS_PATH)
+    ap.add_argument("--rows", type=int, default=BASE_ROWS, help="synthetic table size (tens of millions is fine)")
+    ap.add_argument("--db", default="", help="DuckDB file to keep the synthetic table in between runs")
+    ap.add_argument("--passes", type=int, default=3)
+    ap.add_argument("--chunk-ms", type=float, default=5.0, help="fake model delay per streamed chunk")
+    ap.add_argument("--first-token-ms", type=float, default=50.0, help="fake model delay before the first chunk")
+    ap.add_argument("--prefill-ms-per-token", type=float, default=0.0, help="fake model cost per prompt token not in its KV cache")
+    ap.add_argument("--fast-paths", action="store_true", help="keep intent engine, question cache and result cache on")
+    ap.add_argument("--trace-log", default="", help="also write per-answer traces here")
+    ap.add_argument("--out", default="", help="write the results JSON here")
+    ap.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"))
+    ap.add_argument("--threshold", type=float, default=0.10, help="relative slowdown reported as a regression")
+    ap.add_argument("--floor-ms", type=float, default=5.0, help="ignore slowdowns smaller than this")
+    ap.add_argument("--record", default="", help="record real Ollama replies into a new corpus file")
+    args = ap.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            base = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        n = compare(base, new, args.threshold, args.floor_ms)
+        print(f"\n{n} regression(s)")
+        sys.exit(1 if n else 0)
+    if args.record:
+        record(args)
+        return
+
+    res = bench(args)
+    print_report(res)
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(res, f, indent=1, default=str)
+        print(f"\nwrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
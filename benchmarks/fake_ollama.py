@@ -0,0 +1,207 @@
+"""
+Local stand-in for Ollama's /api/chat. Replies with a scripted JSON answer,
+emitted in small chunks with a fixed delay per chunk, in either streaming
+(NDJSON) or non-streaming mode.
+
+    python -m benchmarks.fake_ollama --port 11435 --chunk-ms 20
+    OLLAMA_BASE_URL=http://127.0.0.1:11435 streamlit run app.py
+"""
+from __future__ import annotations
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+DEFAULT_RESPONSE = {
+    "analysis_plan": [
+        "Filter to the last 15 days of data",
+        "Aggregate D0 orders and forms per city",
+        "Pick the city with the highest D0 conversion rate",
+    ],
+    "sql": (
+        "SELECT city, SUM(d0_orders) / NULLIF(SUM(d0_form_filled), 0) AS d0_conversion_rate "
+        "FROM d0_dplus_daily_summary_v "
+        "WHERE date_parsed >= (SELECT MAX(date_parsed) FROM d0_dplus_daily_summary_v) - INTERVAL '15 days' "
+        "AND city IS NOT NULL AND city <> '' "
+        "GROUP BY city ORDER BY d0_conversion_rate DESC LIMIT 1"
+    ),
+    "result_interpretation": "The city above had the best D0 conversion over the last 15 days.",
+    "assumptions": ["'Last 15 days' is measured from the latest date in the data."],
+    "followups": ["How does this compare with Dplus conversion?", "Break this down by platform."],
+}
+
+
+def split_chunks(text: str, size: int = 4) -> List[str]:
+    # Roughly token-sized pieces.
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class FakeOllama:
+    """
+    `responder(messages) -> str` picks the reply text; defaults to
+    DEFAULT_RESPONSE. `chunk_ms` is the delay between streamed chunks (and
+    the per-chunk cost charged to non-streaming replies); `first_token_ms`
+    is charged once per request. Like Ollama, the last prompt and its reply
+    are kept as a KV cache: only the tokens after the prefix a new prompt
+    shares with them are evaluated (reported as prompt_eval_count) and
+    charged `prefill_ms_per_token` each. `parallel_slowdown` stretches each
+    chunk by that fraction per other request in flight, as batched decoding
+    on one GPU does. `chunk_ms_by_model` sets per-model speeds, and a
+    responder with `by_model = True` is called as `responder(messages, model)`.
+    """
+
+    def __init__(
+        self,
+        port: int = 0,
+        chunk_ms: float = 20.0,
+        responder: Optional[Callable[[List[Dict[str, str]]], str]] = None,
+        first_token_ms: float = 0.0,
+        prefill_ms_per_token: float = 0.0,
+        parallel_slowdown: float = 0.0,
+        chunk_ms_by_model: Optional[Dict[str, float]] = None,
+    ):
+        self.chunk_ms = chunk_ms
+        self.first_token_ms = first_token_ms
+        self.prefill_ms_per_token = prefill_ms_per_token
+        self.parallel_slowdown = parallel_slowdown
+        self.chunk_ms_by_model = chunk_ms_by_model or {}
+        self.active = 0
+        self._cached_prompt = ""
+        self._cache_lock = threading.Lock()
+        self.responder = responder or (lambda _messages: json.dumps(DEFAULT_RESPONSE, indent=2))
+        self.requests = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllama":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    @staticmethod
+    def _render(messages: List[Dict[str, str]]) -> str:
+        # Roughly like a chat template.
+        return "".join(f"<|{m.get('role')}|>\n{m.get('content', '')}\n" for m in messages)
+
+    def prefill_tokens(self, messages: List[Dict[str, str]], reply: str) -> int:
+        # ~4 characters per token.
+        prompt = self._render(messages)
+        with self._cache_lock:
+            cached = self._cached_prompt
+            self._cached_prompt = prompt + self._render([{"role": "assistant", "content": reply}])
+        shared = 0
+        for a, b in zip(cached, prompt):
+            if a != b:
+                break
+            shared += 1
+        return (len(prompt) - shared + 3) // 4
+
+    def chunk_delay(self, model: str = "") -> float:
+        chunk_ms = self.chunk_ms_by_model.get(model, self.chunk_ms)
+        return chunk_ms * (1 + self.parallel_slowdown * max(0, self.active - 1)) / 1000
+
+    def respond(self, messages: List[Dict[str, str]], model: str) -> str:
+        if getattr(self.responder, "by_model", False):
+            return self.responder(messages, model)
+        return self.responder(messages)
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                if self.path != "/api/chat":
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                fake.requests += 1
+                with fake._cache_lock:
+                    fake.active += 1
+                try:
+                    self._reply(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client stopped reading (cancelled)
+                finally:
+                    with fake._cache_lock:
+                        fake.active -= 1
+
+            def _reply(self, body):
+                messages = body.get("messages", [])
+                model = body.get("model", "fake")
+                reply = fake.respond(messages, model)
+                chunks = split_chunks(reply)
+                # Rough token counts (~4 chars per token) like Ollama's final object.
+                prefill = fake.prefill_tokens(messages, reply)
+                self.usage = {"prompt_eval_count": prefill, "eval_count": len(chunks)}
+                if fake.first_token_ms or fake.prefill_ms_per_token:
+                    time.sleep((fake.first_token_ms + prefill * fake.prefill_ms_per_token) / 1000)
+                if body.get("stream", True):
+                    self._stream(model, chunks)
+                else:
+                    for _ in chunks:
+                        time.sleep(fake.chunk_delay(model))  # same timer overshoot as streaming
+                    self._send_json({"model": model, "message": {"role": "assistant", "content": "".join(chunks)}, "done": True, **self.usage})
+
+            def _send_json(self, obj):
+                data = json.dumps(obj).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, model, chunks):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                lines = [{"model": model, "message": {"role": "assistant", "content": c}, "done": False} for c in chunks]
+                lines.append({"model": model, "message": {"role": "assistant", "content": ""}, "done": True, **self.usage})
+                for n, obj in enumerate(lines):
+                    if n < len(chunks):
+                        time.sleep(fake.chunk_delay(model))
+                    data = (json.dumps(obj) + "\n").encode()
+                    self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=11435)
+    ap.add_argument("--chunk-ms", type=float, default=20.0)
+    ap.add_argument("--first-token-ms", type=float, default=0.0)
+    ap.add_argument("--prefill-ms-per-token", type=float, default=0.0)
+    ap.add_argument("--parallel-slowdown", type=float, default=0.0)
+    args = ap.parse_args()
+    fake = FakeOllama(
+        args.port, args.chunk_ms, first_token_ms=args.first_token_ms,
+        prefill_ms_per_token=args.prefill_ms_per_token, parallel_slowdown=args.parallel_slowdown,
+    )
+    print(f"Fake Ollama listening on {fake.url}")
+    fake.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Load test for the HTTP API (src/http_api.py). Starts the API in-process
+on synthetic data with a fake Ollama answering from the scripted corpus,
+then runs concurrent clients. Each client plays whole conversations
+through one session, some of them streamed (NDJSON). A few "slow" clients ask
+questions the fake model takes --slow-ms to answer, to show that a slow
+generation only holds its own slot. Reports throughput, latency and
+time-to-first-event per group, 503 rejections (admission control), and
+checks every answer carries SQL, columns and rows.
+
+    python -m benchmarks.http_load --clients 8 --conversations 3 --max-concurrent 4
+
+    # against a running server (python server.py) and fake model:
+    python -m benchmarks.fake_ollama --port 11435 &
+    OLLAMA_BASE_URL=http://127.0.0.1:11435 python server.py &
+    python -m benchmarks.http_load --url http://127.0.0.1:8080
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import duckdb
+import requests
+
+from benchmarks.e2e import ScriptedResponder, _question_of, load_corpus
+from benchmarks.fake_ollama import FakeOllama
+from benchmarks.speculative import _pct
+from benchmarks.synth import build_scaled_table, shape_for_rows
+
+BASE_ROWS = 3591
+SLOW = "[slow]"
+
+
+class SlowResponder:
+    """Scripted replies; questions tagged [slow] are held for `slow_ms` first."""
+
+    def __init__(self, inner: ScriptedResponder, slow_ms: float):
+        self.inner = inner
+        self.slow_ms = slow_ms
+
+    def __call__(self, messages: List[Dict[str, str]]) -> str:
+        question, _ = _question_of(messages)
+        if SLOW in question:
+            time.sleep(self.slow_ms / 1000)
+        return self.inner(messages)
+
+
+def start_local(args) -> str:
+    from src.agent import AnalyticsAgent
+    from src.config import SETTINGS
+    from src.data_loader import create_date_view, finalize_storage
+    from src.http_api import ApiServer
+    from src.llm_ollama import OllamaClient
+    from src.schema_reader import read_schema
+
+    con = duckdb.connect()
+    scale, density = shape_for_rows(args.rows, BASE_ROWS)
+    rows = build_scaled_table(con, SETTINGS.table_name, scale, density)
+    create_date_view(con, SETTINGS.table_name)
+    schema = read_schema(SETTINGS.schema_path, SETTINGS.table_name)
+    finalize_storage(con, SETTINGS.table_name, schema)
+    agent = AnalyticsAgent(con, schema)
+    fake = FakeOllama(chunk_ms=args.chunk_ms).start()
+    fake.responder = SlowResponder(ScriptedResponder(load_corpus(), agent.table_view), args.slow_ms)
+    agent.llm = OllamaClient(base_url=fake.url, max_in_flight=args.max_concurrent * 2)
+    if not args.keep_caches:
+        agent.question_cache.enabled = False
+        agent.result_cache.max_entries = 0
+    print(f"{rows:,} rows; API max_concurrent={args.max_concurrent}, max_queue={args.max_queue}; "
+          f"fake model chunk {args.chunk_ms} ms, slow questions {args.slow_ms:.0f} ms")
+
+    ready = threading.Event()
+    bound: Dict[str, Any] = {}
+
+    def run():
+        async def main():
+            server = ApiServer(agent, args.max_concurrent, args.max_queue, args.queue_timeout)
+            bound["addr"] = await server.start("127.0.0.1", 0)
+            ready.set()
+            await server.serve_forever()
+        asyncio.run(main())
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait(30)
+    host, port = bound["addr"]
+    return f"http://{host}:{port}"
+
+
+def ask(http: requests.Session, url: str, question: str, session_id: Optional[str], stream: bool) -> Dict[str, Any]:
+    body = {"question": question, "stream": stream}
+    if session_id:
+        body["session_id"] = session_id
+    t0 = time.perf_counter()
+    out: Dict[str, Any] = {"stream": stream, "first_ms": None}
+    resp = http.post(f"{url}/v1/query", json=body, stream=stream, timeout=300)
+    out["status"] = resp.status_code
+    if resp.status_code != 200:
+        resp.close()
+        out["ms"] = (time.perf_counter() - t0) * 1000
+        return out
+    if stream:
+        answer = None
+        for line in resp.iter_lines():
+            if not line:
+                continue
+            if out["first_ms"] is None:
+                out["first_ms"] = (time.perf_counter() - t0) * 1000
+            event = json.loads(line)
+            if event["event"] == "answer":
+                answer = event
+            elif event["event"] == "error":
+                out["error"] = event["error"]
+    else:
+        answer = resp.json()
+    out["ms"] = (time.perf_counter() - t0) * 1000
+    out["answer"] = answer
+    return out
+
+
+def client(url: str, conversations: List[List[str]], stream_ratio: float, seed: int, tag: str, results: List[Dict[str, Any]]):
+    rng = random.Random(seed)
+    http = requests.Session()
+    for turns in conversations:
+        session_id = None
+        for q in turns:
+            r = ask(http, url, q, session_id, rng.random() < stream_ratio)
+            r["group"] = tag
+            answer = r.get("answer") or {}
+            session_id = answer.get("session_id", session_id)
+            r["valid"] = r["status"] != 200 or bool(answer.get("sql") and "rows" in answer and answer.get("columns"))
+            results.append(r)
+        if session_id:
+            http.delete(f"{url}/v1/sessions/{session_id}", timeout=30)
+
+
+def summarize(name: str, rs: List[Dict[str, Any]], wall_s: float) -> None:
+    ok = [r for r in rs if r["status"] == 200]
+    if not ok:
+        print(f"{name:<8} no successful requests")
+        return
+    ms = [r["ms"] for r in ok]
+    first = [r["first_ms"] for r in ok if r["first_ms"] is not None]
+    print(f"{name:<8} {len(rs):5d} req {len(ok) / wall_s:6.1f}/s  p50 {_pct(ms, 0.5):7.0f}  p95 {_pct(ms, 0.95):7.0f}  "
+          f"max {max(ms):7.0f} ms  first event p50 {statistics.median(first) if first else 0:6.0f} ms  "
+          f"503s {sum(r['status'] == 503 for r in rs)}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="", help="load-test a running server instead of starting one")
+    ap.add_argument("--rows", type=int, default=200_000)
+    ap.add_argument("--clients", type=int, default=8)
+    ap.add_argument("--conversations", type=int, default=2, help="conversations per client")
+    ap.add_argument("--stream-ratio", type=float, default=0.5)
+    ap.add_argument("--slow-clients", type=int, default=1)
+    ap.add_argument("--slow-ms", type=float, default=4000)
+    ap.add_argument("--chunk-ms", type=float, default=4.0)
+    ap.add_argument("--max-concurrent", type=int, default=4)
+    ap.add_argument("--max-queue", type=int, default=32)
+    ap.add_argument("--queue-timeout", type=float, default=30)
+    ap.add_argument("--keep-caches", action="store_true", help="leave the question and result caches on")
+    args = ap.parse_args()
+
+    url = args.url.rstrip("/") or start_local(args)
+    corpus = [[t["question"] for t in c["turns"]] for c in load_corpus()]
+    results: List[Dict[str, Any]] = []
+    threads = []
+    for i in range(args.clients):
+        convs = [corpus[(i + k) % len(corpus)] for k in range(args.conversations)]
+        threads.append(threading.Thread(target=client, args=(url, convs, args.stream_ratio, i, "normal", results)))
+    for i in range(args.slow_clients):
+        convs = [[f"{SLOW} Total D0 orders", f"{SLOW} Only web"]]
+        threads.append(threading.Thread(target=client, args=(url, convs, 0.0, 1000 + i, "slow", results)))
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+
+    print(f"{args.clients} clients x {args.conversations} conversations + {args.slow_clients} slow client(s) in {wall:.1f} s")
+    for group in ("normal", "slow"):
+        summarize(group, [r for r in results if r["group"] == group], wall)
+    for kind in (False, True):
+        summarize("stream" if kind else "json", [r for r in results if r["group"] == "normal" and r["stream"] == kind], wall)
+    metrics = requests.get(f"{url}/metrics", params={"format": "json"}, timeout=30).json()
+    api = metrics["api"]
+    print(f"api: admitted {api['admitted']}, max waiting {api['max_waiting']}, wait max {api['wait_ms_max']:.0f} ms, "
+          f"rejected {api['rejected_full']} full / {api['rejected_timeout']} timeout, responses {api['responses']}")
+    text = requests.get(f"{url}/metrics", timeout=30).text
+    print(f"/metrics: {len(text.splitlines())} lines of Prometheus text")
+    bad = [r for r in results if r["status"] not in (200, 503) or not r["valid"] or r.get("error")]
+    for r in bad[:5]:
+        print("BAD", r)
+    sys.exit(1 if bad else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+"Last N days" latency on a synthetic multi-year dataset: in-database table
+vs hive-partitioned Parquet, with the latest-date subquery as written by the
+LLM and with it inlined from the date bounds table.
+
+    python -m benchmarks.partition_pruning --years 3 --density 20 --runs 10
+"""
+from __future__ import annotations
+import argparse
+import shutil
+import statistics
+import tempfile
+import time
+
+import duckdb
+
+from src.data_loader import (
+    create_date_view, create_parquet_view, export_partitioned_parquet,
+    refresh_date_bounds, get_date_bounds,
+)
+from src.sql_rewrite import inline_date_bounds
+from benchmarks.synth import build_scaled_table
+
+QUERY = """
+    SELECT city, SUM(d0_orders) / NULLIF(SUM(d0_form_filled), 0) AS d0_conversion_rate
+    FROM t_v
+    WHERE date_parsed >= (SELECT MAX(date_parsed) FROM t_v) - INTERVAL '{n} days'
+      AND city IS NOT NULL
+    GROUP BY city
+    ORDER BY d0_conversion_rate DESC
+    LIMIT 1
+"""
+
+
+def _median_ms(con: duckdb.DuckDBPyConnection, sql: str, runs: int) -> float:
+    con.execute(sql).fetchall()
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        con.execute(sql).fetchall()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--years", type=int, default=3)
+    ap.add_argument("--density", type=int, default=1, help="repeat each day's rows N times")
+    ap.add_argument("--runs", type=int, default=10)
+    args = ap.parse_args()
+
+    work = tempfile.mkdtemp(prefix="bench_parquet_")
+    try:
+        con = duckdb.connect()
+        rows = build_scaled_table(con, "t", max(1, args.years * 365 // 31), args.density)
+        create_date_view(con, "t")
+        refresh_date_bounds(con, "t")
+        bounds = get_date_bounds(con, "t")
+        print(f"{rows} rows, {bounds[0]} .. {bounds[1]}")
+
+        t0 = time.perf_counter()
+        export_partitioned_parquet(con, "t", work)
+        print(f"parquet export: {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+        backends = {}
+        backends["duckdb table"] = con
+        pq = duckdb.connect()
+        create_parquet_view(pq, "t", work)
+        backends["parquet"] = pq
+
+        print(f"{'window':>8} {'backend':>14} {'subquery ms':>12} {'inlined ms':>11}")
+        for n in (7, 30, 90):
+            raw = QUERY.format(n=n)
+            inlined = inline_date_bounds(raw, ["t_v"], bounds)
+            for name, c in backends.items():
+                print(f"{n:>6}d {name:>14} {_median_ms(c, raw, args.runs):12.2f} {_median_ms(c, inlined, args.runs):11.2f}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
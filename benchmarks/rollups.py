@@ -0,0 +1,117 @@
+"""
+Rollup routing check + timing. Every corpus query runs against the base view
+and through RollupRouter; routed results must match the base results, and
+queries marked as not routable must be left alone.
+
+    python -m benchmarks.rollups --scale 30
+"""
+from __future__ import annotations
+import argparse
+import math
+import statistics
+import sys
+import time
+
+import duckdb
+
+from src.config import SETTINGS
+from src.data_loader import create_date_view, refresh_date_bounds, get_date_bounds
+from src.rollups import RollupRouter, build_rollups
+from src.schema_reader import read_schema
+from src.sql_rewrite import inline_date_bounds
+from benchmarks.synth import build_scaled_table
+
+V = "t_v"
+LAST = f"(SELECT MAX(date_parsed) FROM {V})"
+
+# (sql, expected to route)
+CORPUS = [
+    (f"SELECT city, SUM(d0_orders) / NULLIF(SUM(d0_form_filled), 0) AS d0_conversion_rate FROM {V} "
+     f"WHERE date_parsed >= {LAST} - INTERVAL '15 days' AND city IS NOT NULL AND city <> '' "
+     f"GROUP BY city ORDER BY d0_conversion_rate DESC LIMIT 1", True),
+    (f"SELECT platform, SUM(dplus_orders) / NULLIF(SUM(dplus_form_filled), 0) AS r FROM {V} GROUP BY platform ORDER BY r DESC LIMIT 200", True),
+    (f"SELECT SUM(total_form_filled) / NULLIF(SUM(total_form_start), 0) AS form_completion_rate FROM {V}", True),
+    (f"SELECT city, platform, SUM(d0_revenue) AS revenue FROM {V} WHERE city = 'Mumbai' GROUP BY 1, 2 ORDER BY revenue DESC LIMIT 200", True),
+    (f"SELECT DATE_TRUNC('week', date_parsed) AS wk, SUM(d0_orders) AS d0 FROM {V} GROUP BY wk ORDER BY wk LIMIT 200", True),
+    (f"SELECT stage, SUM(dplus_orders) AS o FROM {V} WHERE date_parsed >= {LAST} - INTERVAL '7 days' GROUP BY stage HAVING SUM(dplus_orders) > 0 ORDER BY o DESC LIMIT 200", True),
+    (f"WITH w AS (SELECT first_form_utm_source AS src, SUM(d0_orders) AS o, SUM(d0_form_filled) AS f FROM {V} GROUP BY 1) "
+     f"SELECT src, o / NULLIF(f, 0) AS rate FROM w ORDER BY rate DESC LIMIT 200", True),
+    (f"SELECT gender, SUM(d0_orders) FILTER (WHERE platform = 'web') AS web_orders FROM {V} GROUP BY gender ORDER BY 1 LIMIT 200", True),
+    (f"SELECT COUNT(DISTINCT city) AS n_cities, MAX(date_parsed) AS latest FROM {V}", True),
+    (f"SELECT city, RANK() OVER (ORDER BY SUM(d0_revenue) DESC) AS rk FROM {V} GROUP BY city ORDER BY rk LIMIT 200", True),
+    (f"SELECT DISTINCT platform FROM {V} ORDER BY 1 LIMIT 200", True),
+    (f"SELECT order_utm_campaign, SUM(NF_orders) AS nf FROM {V} WHERE order_utm_campaign IS NOT NULL GROUP BY 1 ORDER BY nf DESC LIMIT 200", True),
+    # Not rollup-safe: row counts, averages, row-level metric filters, raw rows, windows over raw rows.
+    (f"SELECT city, COUNT(*) AS n FROM {V} GROUP BY city ORDER BY n DESC LIMIT 200", False),
+    (f"SELECT city, AVG(d0_revenue) AS a FROM {V} GROUP BY city ORDER BY a DESC LIMIT 200", False),
+    (f"SELECT city, SUM(d0_orders) AS o FROM {V} WHERE d0_orders > 0 GROUP BY city ORDER BY o DESC LIMIT 200", False),
+    (f"SELECT * FROM {V} LIMIT 20", False),
+    (f"SELECT city, date_parsed FROM {V} ORDER BY 2 DESC, 1 LIMIT 20", False),
+    (f"SELECT city, SUM(d0_orders) OVER (PARTITION BY city) AS o FROM {V} LIMIT 20", False),
+    (f"SELECT city, SUM(d0_orders + dplus_orders) AS o FROM {V} GROUP BY city ORDER BY o DESC LIMIT 200", False),
+    (f"SELECT city, SUM(DISTINCT d0_orders) AS o FROM {V} GROUP BY city ORDER BY o DESC LIMIT 200", False),
+    (f"SELECT city, gender, stage, SUM(d0_orders) AS o FROM {V} GROUP BY ALL ORDER BY o DESC LIMIT 200", False),
+]
+
+
+def _rows_equal(a, b) -> bool:
+    if len(a) != len(b):
+        return False
+    for ra, rb in zip(sorted(a, key=repr), sorted(b, key=repr)):
+        for x, y in zip(ra, rb):
+            if isinstance(x, float) and isinstance(y, float):
+                if not math.isclose(x, y, rel_tol=1e-9, abs_tol=1e-9):
+                    return False
+            elif str(x) != str(y):
+                return False
+    return True
+
+
+def _median_ms(con, sql, runs) -> float:
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        con.execute(sql).fetchall()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scale", type=int, default=10)
+    ap.add_argument("--runs", type=int, default=10)
+    args = ap.parse_args()
+
+    con = duckdb.connect()
+    schema = read_schema(SETTINGS.schema_path, "t")
+    rows = build_scaled_table(con, "t", args.scale)
+    create_date_view(con, "t")
+    refresh_date_bounds(con, "t")
+    rollups = build_rollups(con, "t", schema, SETTINGS.rollup_dimensions)
+    router = RollupRouter(con, schema, "t", [V, "t"])
+    bounds = get_date_bounds(con, "t")
+    print(f"{rows} base rows, {len(rollups)} rollups")
+
+    failures = 0
+    for i, (sql, should_route) in enumerate(CORPUS):
+        sql = inline_date_bounds(sql, [V], bounds)
+        rollup, _ = router.pick(sql)
+        routed_sql = router.route(sql)
+        base_ms = _median_ms(con, sql, args.runs)
+        if (rollup is not None) != should_route:
+            failures += 1
+            print(f"[{i:2d}] ROUTING MISMATCH expected route={should_route}: {sql[:90]}")
+            continue
+        if rollup is None:
+            print(f"[{i:2d}] base    {base_ms:8.2f} ms")
+            continue
+        same = _rows_equal(con.execute(sql).fetchall(), con.execute(routed_sql).fetchall())
+        failures += not same
+        rolled_ms = _median_ms(con, routed_sql, args.runs)
+        print(f"[{i:2d}] {'ok  ' if same else 'DIFF'}    base {base_ms:8.2f} ms  rollup {rolled_ms:6.2f} ms  ({rollup.name})")
+    print(f"routed={router.stats['routed']} base={router.stats['base']} failures={failures}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
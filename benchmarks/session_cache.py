@@ -0,0 +1,109 @@
+"""
+Follow-up conversations with and without per-session intermediates. Each
+conversation is answered twice by the intent engine, once with the session
+cache off (every turn scans the date view) and once with it on (follow-ups
+run against the cached intermediate); answers must match, and per-turn
+execution times are compared. Intermediates are built in the background
+after an answer; the benchmark waits for that build before the next turn
+(standing in for the user's reading time) and reports it separately. Rollups also shortcut these queries, so run
+with ENABLE_ROLLUPS=0 to see the cost against the base data alone.
+
+    ENABLE_ROLLUPS=0 python -m benchmarks.session_cache --rows 2000000
+"""
+from __future__ import annotations
+import argparse
+import statistics
+import sys
+import time
+from typing import List, Tuple
+
+import duckdb
+
+from src.agent import AnalyticsAgent, ChatState
+from src.config import SETTINGS
+from src.data_loader import create_date_view, finalize_storage
+from src.schema_reader import read_schema
+from benchmarks.synth import build_scaled_table, shape_for_rows
+
+T = SETTINGS.table_name
+BASE_ROWS = 3591
+
+CONVERSATIONS = [
+    [
+        "Which city has the highest D0 conversion rate in the last 15 days?",
+        "What about Mumbai?",
+        "Now split that by platform",
+        "Only app",
+        "What about Dplus conversion rate?",
+    ],
+    [
+        "Top 5 cities by D0 orders in the last 30 days",
+        "Only web",
+        "Now by gender",
+        "What about D0 revenue?",
+    ],
+    [
+        "D0 orders by stage",
+        "Only Female",
+        "Now by age bucket",
+    ],
+]
+
+
+def _run(agent: AnalyticsAgent, conversations: List[List[str]]) -> Tuple[List[Tuple[str, str, float, str]], float]:
+    """(question, answer, execute+intermediate ms, source) per turn, and background build ms."""
+    out, build_ms = [], 0.0
+    for turns in conversations:
+        state = ChatState()
+        for q in turns:
+            ans, state = agent.answer(q, state)
+            trace = state.last_trace or {}
+            ms = sum(s["ms"] for s in trace.get("spans", []) if s["name"] in ("intermediate", "execute"))
+            reused = any(s.get("reused") for s in trace.get("spans", []) if s["name"] == "intermediate")
+            out.append((q, ans, ms, "reuse" if reused else trace.get("source", "?")))
+            t0 = time.perf_counter()
+            agent.session_cache.wait(state.session_id)
+            build_ms += (time.perf_counter() - t0) * 1000
+        agent.end_session(state.session_id)
+    return out, build_ms
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--passes", type=int, default=3)
+    args = ap.parse_args()
+
+    con = duckdb.connect()
+    scale, density = shape_for_rows(args.rows, BASE_ROWS)
+    rows = build_scaled_table(con, T, scale, density)
+    create_date_view(con, T)
+    schema = read_schema(SETTINGS.schema_path, T)
+    finalize_storage(con, T, schema)
+    agent = AnalyticsAgent(con, schema)
+    agent.question_cache.enabled = False
+    agent.result_cache.max_entries = 0
+    print(f"{rows:,} rows, rollups {'on' if SETTINGS.enable_rollups else 'off'}, {args.passes} pass(es)")
+
+    runs, builds = {}, {}
+    for enabled in (False, True):
+        agent.session_cache.enabled = enabled
+        passes = [_run(agent, CONVERSATIONS) for _ in range(args.passes)]
+        runs[enabled] = [(t[0], t[1], statistics.median(p[0][i][2] for p in passes), t[3]) for i, t in enumerate(passes[-1][0])]
+        builds[enabled] = statistics.median(p[1] for p in passes)
+
+    failures = 0
+    print(f"{'question':<70} {'off ms':>8} {'on ms':>8}  source")
+    for (q, off_ans, off_ms, _), (_, on_ans, on_ms, src) in zip(runs[False], runs[True]):
+        same = off_ans == on_ans
+        failures += not same
+        print(f"{q[:70]:<70} {off_ms:8.1f} {on_ms:8.1f}  {src}{'' if same else '  DIFF'}")
+    off_total = sum(t[2] for t in runs[False])
+    on_total = sum(t[2] for t in runs[True])
+    print(f"answer path total {off_total:.1f} ms -> {on_total:.1f} ms; background builds {builds[True]:.1f} ms")
+    print(f"{agent.session_cache.snapshot()}; failures={failures}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Tail latency of sequential refine round trips vs speculative candidates.
+A fake Ollama answers each request with the question's scripted SQL, or,
+with probability --fail-rates, with a broken query: half of them reference
+a column that doesn't exist (caught by EXPLAIN before running), half fail
+only at execution (a bad cast). Refine calls fail the same way, so the
+sequential path needs more round trips as the rate goes up; the
+speculative path draws K candidates at once and falls back to the next
+valid one. Concurrent fake requests slow each other by
+--parallel-slowdown per extra request, as batched decoding does.
+
+    python -m benchmarks.speculative --rows 200000 --fail-rates 0,0.2,0.4 --candidates 3
+"""
+from __future__ import annotations
+import argparse
+import random
+import statistics
+import sys
+import threading
+from typing import Any, Dict, List
+
+import duckdb
+
+from src.agent import AnalyticsAgent, ChatState
+from src.config import SETTINGS
+from src.data_loader import create_date_view, finalize_storage
+from src.llm_ollama import OllamaClient
+from src.schema_reader import read_schema
+from benchmarks.e2e import _question_of, _reply, load_corpus
+from benchmarks.fake_ollama import FakeOllama
+from benchmarks.synth import build_scaled_table, shape_for_rows
+
+T = SETTINGS.table_name
+BASE_ROWS = 3591
+BROKEN = [
+    # binder error: EXPLAIN rejects it
+    "SELECT city, SUM(net_margin_value) AS margin FROM {view} GROUP BY city ORDER BY margin DESC LIMIT 200",
+    # conversion error: only running it finds out
+    "SELECT CAST(city AS INTEGER) AS city_id, SUM(d0_orders) AS d0_orders FROM {view} GROUP BY 1 ORDER BY 2 DESC LIMIT 200",
+]
+
+
+class FlakyResponder:
+    """The scripted SQL, or with probability `fail_rate` a broken query; every request draws independently."""
+
+    def __init__(self, turns: Dict[str, str], view: str, fail_rate: float, seed: int):
+        self.turns = turns
+        self.view = view
+        self.fail_rate = fail_rate
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, messages: List[Dict[str, str]]) -> str:
+        question, _ = _question_of(messages)
+        with self._lock:
+            broken = self.rng.random() < self.fail_rate
+            sql = self.rng.choice(BROKEN) if broken else self.turns.get(question, "SELECT COUNT(*) AS n FROM {view}")
+        return _reply(sql.replace("{view}", self.view), question)
+
+
+def _pct(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def _run(agent: AnalyticsAgent, questions: List[str]) -> List[Dict[str, Any]]:
+    out = []
+    for q in questions:
+        ans, state = agent.answer(q, ChatState())
+        trace = state.last_trace or {}
+        spans = trace.get("spans", [])
+        spec = trace.get("speculative") or {}
+        out.append({
+            "ms": trace.get("total_ms", 0.0),
+            "refines": sum(1 for s in spans if s["name"] == "llm" and s.get("kind") == "refine"),
+            "alternates": max(0, len(spec.get("tried", [])) - 1),
+            "ok": not ans.startswith("I couldn't"),
+        })
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=200_000)
+    ap.add_argument("--fail-rates", default="0,0.2,0.4")
+    ap.add_argument("--candidates", type=int, default=3)
+    ap.add_argument("--repeat", type=int, default=1, help="times through the corpus per rate")
+    ap.add_argument("--chunk-ms", type=float, default=4.0)
+    ap.add_argument("--parallel-slowdown", type=float, default=0.3)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+
+    con = duckdb.connect()
+    scale, density = shape_for_rows(args.rows, BASE_ROWS)
+    rows = build_scaled_table(con, T, scale, density)
+    create_date_view(con, T)
+    schema = read_schema(SETTINGS.schema_path, T)
+    finalize_storage(con, T, schema)
+
+    turns = {t["question"]: t["sql"] for c in load_corpus() for t in c["turns"] if t.get("sql") and not t.get("refine")}
+    questions = list(turns) * args.repeat
+    fake = FakeOllama(chunk_ms=args.chunk_ms, parallel_slowdown=args.parallel_slowdown).start()
+    agent = AnalyticsAgent(con, schema)
+    agent.llm = OllamaClient(base_url=fake.url)
+    agent.question_cache.enabled = False
+    agent.intents.enabled = False
+    agent.session_cache.enabled = False
+    agent.result_cache.max_entries = 0
+    agent.speculative_temperatures = [0.1 + 0.4 * i for i in range(args.candidates)]
+    print(f"{rows:,} rows, {len(questions)} questions per run, K={args.candidates}, "
+          f"chunk {args.chunk_ms} ms, parallel slowdown {args.parallel_slowdown}")
+
+    results = []
+    print(f"{'fail':>5} {'mode':<12} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+          f"{'refines':>8} {'alts':>5} {'llm reqs':>9} {'failed':>6}")
+    for rate in [float(r) for r in args.fail_rates.split(",")]:
+        for mode in ("sequential", "speculative"):
+            agent.speculative = mode == "speculative"
+            fake.responder = FlakyResponder(turns, agent.table_view, rate, args.seed)
+            before = fake.requests
+            runs = _run(agent, questions)
+            ms = [r["ms"] for r in runs]
+            failed = sum(not r["ok"] for r in runs)
+            row = {
+                "fail_rate": rate, "mode": mode, "p50": _pct(ms, 0.5), "p90": _pct(ms, 0.9), "p99": _pct(ms, 0.99),
+                "max": max(ms), "refines": sum(r["refines"] for r in runs), "alternates": sum(r["alternates"] for r in runs),
+                "requests": fake.requests - before, "failed": failed,
+                "by_refines": {n: statistics.median(r["ms"] for r in runs if r["refines"] == n)
+                               for n in sorted({r["refines"] for r in runs})},
+            }
+            results.append(row)
+            print(f"{rate:5.2f} {mode:<12} {row['p50']:8.0f} {row['p90']:8.0f} {row['p99']:8.0f} {row['max']:8.0f} "
+                  f"{row['refines']:8d} {row['alternates']:5d} {row['requests']:9d} {failed:6d}")
+    print("median ms by refine round trips:")
+    for row in results:
+        cells = ", ".join(f"{n}: {v:.0f}" for n, v in row["by_refines"].items())
+        print(f"  {row['fail_rate']:.2f} {row['mode']:<12} {cells}")
+    fake.stop()
+    # Speculation must never answer fewer questions than the sequential path.
+    worse = [r for s, r in zip(results[::2], results[1::2]) if r["failed"] > s["failed"]]
+    sys.exit(1 if worse else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Correctness corpus + micro-benchmark for src/sql_analyzer.py against the
+previous guards (sqlparse safety check, substring LIMIT check, regex
+unknown-identifier check). Every corpus entry carries the expected verdicts;
+the script prints where each implementation is wrong and exits nonzero if
+the analyzer is.
+
+    python -m benchmarks.sql_analyzer --runs 2000
+"""
+from __future__ import annotations
+import argparse
+import sys
+import time
+
+from src.config import SETTINGS
+from src.sql_analyzer import analyze_sql
+from src.sql_guard import _sqlparse_is_safe_select_sql, is_safe_select_sql
+from src.sql_schema_guard import _regex_find_unknown_identifiers
+
+V = f"{SETTINGS.table_name}_v"
+COLUMNS = {
+    "date", "gender", "platform", "city", "first_form_utm_medium", "first_form_utm_campaign",
+    "first_form_utm_source", "stage", "total_form_start", "d0_form_start", "total_form_filled",
+    "d0_form_filled", "dplus_form_filled", "d0_orders", "dplus_orders", "d1_orders", "d7_orders",
+    "d15_orders", "d21_orders", "d30_orders", "d30plus_orders", "nf_orders", "order_utm_medium",
+    "order_utm_campaign", "order_utm_source", "age_bucket", "d0_revenue", "date_parsed",
+}
+VALID = COLUMNS | {SETTINGS.table_name, V}
+LAST = f"(SELECT MAX(date_parsed) FROM {V})"
+
+# (sql, safe, has_limit, unknown identifiers)
+CORPUS = [
+    (f"SELECT city, SUM(d0_orders) / NULLIF(SUM(d0_form_filled), 0) AS d0_conversion_rate FROM {V} "
+     f"WHERE date_parsed >= {LAST} - INTERVAL '15 days' AND city IS NOT NULL AND city <> '' "
+     f"GROUP BY city ORDER BY d0_conversion_rate DESC LIMIT 1", True, True, []),
+    (f"WITH w AS (SELECT first_form_utm_source AS src, SUM(d0_orders) AS o FROM {V} GROUP BY 1) "
+     f"SELECT src, o FROM w ORDER BY o DESC LIMIT 200", True, True, []),
+    (f"SELECT DATE_TRUNC('week', date_parsed) AS wk, SUM(d0_revenue) revenue FROM {V} GROUP BY wk ORDER BY wk", True, False, []),
+    (f"SELECT city FROM (SELECT city FROM {V} LIMIT 5) t", True, False, []),
+    (f"SELECT city, COUNT(*) FILTER (WHERE platform = 'web') AS web_rows FROM {V} GROUP BY city LIMIT 20", True, True, []),
+    (f"SELECT EXTRACT(year FROM date_parsed) AS y, SUM(d0_orders) FROM {V} GROUP BY 1 LIMIT 10", True, True, []),
+    (f"SELECT CAST(d0_orders AS DOUBLE) / 2 AS half, city::VARCHAR AS c FROM {V} LIMIT 5", True, True, []),
+    (f"SELECT x.city, SUM(x.d0_orders) FROM {V} x JOIN {V} y ON x.city = y.city GROUP BY 1 LIMIT 5", True, True, []),
+    (f"SELECT city, SUM(d0_orders) OVER (PARTITION BY city ORDER BY date_parsed ROWS BETWEEN 6 PRECEDING AND CURRENT ROW) AS r7 FROM {V} LIMIT 50", True, True, []),
+    (f"SELECT city, CASE WHEN SUM(d0_orders) > 10 THEN 'high' ELSE 'low' END tier FROM {V} GROUP BY city LIMIT 50", True, True, []),
+    (f"SELECT * FROM {V} WHERE date >= DATE '2026-01-01' LIMIT 10", True, True, []),
+    (f"SELECT city FROM {V} WHERE city IN (SELECT city FROM {V} WHERE platform = 'app' LIMIT 3)", True, False, []),
+    (f"select city, sum(nf_orders) as o from {V} group by city order by o desc limit 3;", True, True, []),
+    # String/comment contents must not trip the guard (old guard: false positives).
+    (f"SELECT 'please delete; then drop' AS note, city FROM {V} LIMIT 1", True, True, []),
+    (f"SELECT city FROM {V} -- update later\nLIMIT 5", True, True, []),
+    # Columns whose names contain LIMIT must not count as a LIMIT clause.
+    (f"SELECT city AS credit_limit FROM {V}", True, False, []),
+    # Unknown names the schema guard should report.
+    (f"SELECT city, SUM(nf_ordrs) FROM {V} GROUP BY city LIMIT 5", True, True, ["nf_ordrs"]),
+    (f"SELECT cty FROM d0_dplus_daily_summry LIMIT 5", True, True, ["cty", "d0_dplus_daily_summry"]),
+    (f"SELECT SUM(d0_orders) total FROM {V} ORDER BY total", True, False, []),
+    # Unsafe.
+    (f"DELETE FROM {V}", False, False, None),
+    (f"DROP TABLE {SETTINGS.table_name}", False, False, None),
+    (f"SELECT 1; DROP TABLE {SETTINGS.table_name}", False, False, None),
+    (f"CREATE TABLE x AS SELECT * FROM {V}", False, False, None),
+    (f"COPY (SELECT * FROM {V}) TO '/tmp/x.csv'", False, False, None),
+    (f"PRAGMA database_list", False, False, None),
+    (f"ATTACH 'other.db'", False, False, None),
+    (f"INSTALL httpfs", False, False, None),
+    (f"SELECT * FROM read_csv('/etc/passwd')", False, False, None),
+    (f"SELECT * FROM read_text('/etc/hosts') LIMIT 1", False, True, None),
+    # Replacement scans: a quoted path in FROM/JOIN reads the file.
+    ("SELECT * FROM 'requests.jsonl' LIMIT 1", False, True, None),
+    ('SELECT * FROM "requests.jsonl" LIMIT 1', False, True, None),
+    (f"SELECT * FROM {V} JOIN 'a.csv' ON true LIMIT 1", False, True, None),
+    (f"SELECT * FROM {V}, '/etc/passwd' LIMIT 1", False, True, None),
+    ('SELECT * FROM "data/x.parquet" t LIMIT 1', False, True, None),
+    # Any table function in FROM other than pure generators: readers and scanners open files.
+    ("SELECT * FROM read_json_objects_auto('/etc/passwd') LIMIT 1", False, True, None),
+    ("SELECT * FROM read_ndjson_objects('/etc/passwd') LIMIT 1", False, True, None),
+    ("SELECT * FROM sqlite_scan('x.db', 't') LIMIT 1", False, True, None),
+    (f"SELECT * FROM {V}, LATERAL read_csv_auto('/etc/hosts') LIMIT 1", False, True, None),
+    (f"SELECT * FROM {V} JOIN duckdb_settings() s ON true LIMIT 1", False, True, None),
+    ("SELECT * FROM range(10) r LIMIT 5", True, True, []),
+    ("", False, False, None),
+]
+# is_safe_select_sql with the agent's relations: only the table and its view may be read.
+RELATIONS = {SETTINGS.table_name, V}
+RELATION_CASES = [
+    (f"SELECT city FROM {V} LIMIT 5", True),
+    (f"SELECT city FROM main.{V} LIMIT 5", True),
+    (f"WITH w AS (SELECT city FROM {V}) SELECT * FROM w LIMIT 5", True),
+    ("SELECT * FROM information_schema.tables LIMIT 5", False),
+    (f"SELECT * FROM {V} JOIN _date_bounds b ON true LIMIT 5", False),
+    ("SELECT * FROM range(10) r LIMIT 5", True),
+]
+
+
+def _old_has_limit(sql: str) -> bool:
+    return "LIMIT" in sql.upper()
+
+
+def _time_us(fn, sqls, runs) -> float:
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        for s in sqls:
+            fn(s)
+    return (time.perf_counter() - t0) / (runs * len(sqls)) * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=500)
+    args = ap.parse_args()
+
+    new_wrong = old_wrong = 0
+    for i, (sql, safe, limit, unknown) in enumerate(CORPUS):
+        a = analyze_sql(sql)
+        new = (a.safe, a.has_limit, a.unknown_identifiers(VALID) if unknown is not None else None)
+        old = (
+            _sqlparse_is_safe_select_sql(sql),
+            _old_has_limit(sql),
+            _regex_find_unknown_identifiers(sql, VALID) if unknown is not None else None,
+        )
+        expected = (safe, limit if safe else new[1], unknown)
+        old_expected = (safe, limit if safe else old[1], unknown)
+        if new != expected:
+            new_wrong += 1
+            print(f"[{i:2d}] ANALYZER WRONG {new} expected {expected}: {sql[:80]!r}")
+        if old != old_expected:
+            old_wrong += 1
+            print(f"[{i:2d}] old guards wrong {old} expected {old_expected}: {sql[:80]!r}")
+    for sql, safe in RELATION_CASES:
+        if is_safe_select_sql(sql, RELATIONS) != safe:
+            new_wrong += 1
+            print(f"RELATIONS WRONG expected safe={safe}: {sql[:80]!r}")
+    print(f"{len(CORPUS) + len(RELATION_CASES)} cases: analyzer wrong on {new_wrong}, old guards wrong on {old_wrong}")
+
+    sqls = [c[0] for c in CORPUS if c[0]]
+
+    def old_all(s):
+        _sqlparse_is_safe_select_sql(s)
+        _sqlparse_is_safe_select_sql(s)  # the agent ran it at least twice
+        _old_has_limit(s)
+        _regex_find_unknown_identifiers(s, VALID)
+
+    def new_all(s):
+        analyze_sql.__wrapped__(s).unknown_identifiers(VALID)  # uncached
+
+    print(f"old guards  : {_time_us(old_all, sqls, args.runs):8.1f} us/query")
+    print(f"analyzer    : {_time_us(new_all, sqls, args.runs):8.1f} us/query (uncached)")
+    print(f"analyzer hit: {_time_us(lambda s: analyze_sql(s).safe, sqls, args.runs):8.1f} us/query (lru cached)")
+    sys.exit(1 if new_wrong else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Cold vs warm boot benchmark for the ingest cache.
+
+    python -m benchmarks.startup --scale 50 --runs 5
+"""
+from __future__ import annotations
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import duckdb
+
+from src.config import SETTINGS
+from src.data_loader import load_with_cache, load_source
+from src.schema_reader import read_schema
+from benchmarks.synth import write_scaled_json
+
+
+def _boot(json_path: str, cache_dir: str, use_cache: bool) -> tuple[float, str]:
+    t0 = time.perf_counter()
+    con = duckdb.connect()
+    schema = read_schema(SETTINGS.schema_path, SETTINGS.table_name)
+    if use_cache:
+        status = load_with_cache(con, SETTINGS.table_name, json_path, schema, cache_dir=cache_dir)
+    else:
+        load_source(con, SETTINGS.table_name, json_path, schema)
+        status = "uncached"
+    con.execute(f"SELECT COUNT(*) FROM {SETTINGS.table_name}_v").fetchone()
+    con.close()
+    return time.perf_counter() - t0, status
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scale", type=int, default=1, help="replicate the bundled data N times")
+    ap.add_argument("--runs", type=int, default=5)
+    args = ap.parse_args()
+
+    work = tempfile.mkdtemp(prefix="bench_startup_")
+    try:
+        json_path = SETTINGS.data_path
+        if args.scale > 1:
+            json_path = os.path.join(work, "scaled.json")
+            rows = write_scaled_json(json_path, args.scale)
+            print(f"synthetic source: {rows} rows, {os.path.getsize(json_path) / 1e6:.1f} MB")
+        cache_dir = os.path.join(work, "cache")
+
+        uncached = [_boot(json_path, cache_dir, use_cache=False)[0] for _ in range(args.runs)]
+        cold, status = _boot(json_path, cache_dir, use_cache=True)
+        assert status == "miss", status
+        warm = []
+        for _ in range(args.runs):
+            t, status = _boot(json_path, cache_dir, use_cache=True)
+            assert status == "hit", status
+            warm.append(t)
+
+        print(f"no cache (parse every boot): {min(uncached) * 1000:8.1f} ms")
+        print(f"cold boot (parse + write):   {cold * 1000:8.1f} ms")
+        print(f"warm boot (attach cache):    {min(warm) * 1000:8.1f} ms")
+
+        if args.scale > 1:
+            # mtime moves but content doesn't: revalidated by hash, still a hit.
+            os.utime(json_path, None)
+            t, status = _boot(json_path, cache_dir, use_cache=True)
+            print(f"touched source:              {t * 1000:8.1f} ms ({status})")
+            # content changes: stale cache is detected and rebuilt.
+            write_scaled_json(json_path, args.scale + 1)
+            t, status = _boot(json_path, cache_dir, use_cache=True)
+            print(f"changed source:              {t * 1000:8.1f} ms ({status})")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Streaming vs blocking answers against the fake Ollama server. Reports time
+to the plan, to the SQL, and to the final answer; the blocking baseline only
+has the last one.
+
+    python -m benchmarks.streaming --chunk-ms 20 --runs 5
+"""
+from __future__ import annotations
+import argparse
+import json
+import statistics
+import time
+
+from src.agent import AnalyticsAgent, ChatState
+from src.data_loader import init_db
+from src.json_stream import IncrementalJSONObject
+from src.llm_ollama import OllamaClient
+from src.schema_reader import read_schema
+from src.config import SETTINGS
+from benchmarks.fake_ollama import FakeOllama, DEFAULT_RESPONSE
+
+QUESTION = "Which city has highest D0 conversion rate last 15 days?"
+
+
+def blocking_answer(agent: AnalyticsAgent) -> float:
+    # Baseline: the same pipeline, but the reply arrives in one piece.
+    llm = agent.llm
+    agent.llm = BlockingClient(llm.base_url)
+    try:
+        t0 = time.perf_counter()
+        agent.answer(QUESTION, ChatState())
+        return time.perf_counter() - t0
+    finally:
+        agent.llm = llm
+
+
+class BlockingClient(OllamaClient):
+    def chat_stream(self, messages, temperature=0.2, usage=None, model=None):
+        yield self.chat(messages, temperature, usage, model)
+
+
+def streaming_answer(agent: AnalyticsAgent) -> dict:
+    t0 = time.perf_counter()
+    marks = {}
+    for kind, data in agent.answer_stream(QUESTION, ChatState()):
+        marks.setdefault(kind, time.perf_counter() - t0)
+        if kind == "answer":
+            assert "**Result:**" in data[0], data[0]
+    return marks
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunk-ms", type=float, default=20.0)
+    ap.add_argument("--runs", type=int, default=5)
+    args = ap.parse_args()
+
+    # Sanity check: parser sees the fields in order with arbitrary chunking.
+    text = json.dumps(DEFAULT_RESPONSE, indent=2)
+    parser = IncrementalJSONObject()
+    seen = [k for i in range(0, len(text), 3) for k, _ in parser.feed(text[i:i + 3])]
+    assert seen == list(DEFAULT_RESPONSE), seen
+
+    fake = FakeOllama(chunk_ms=args.chunk_ms).start()
+    try:
+        con = init_db()
+        agent = AnalyticsAgent(con, read_schema(SETTINGS.schema_path, SETTINGS.table_name))
+        agent.llm = OllamaClient(base_url=fake.url)
+        # Cached answers would skip the LLM entirely.
+        agent.question_cache.enabled = False
+        agent.intents.enabled = False
+        agent.result_cache.max_entries = 0  # re-run the query every time
+
+        base = [blocking_answer(agent) for _ in range(args.runs)]
+        runs = [streaming_answer(agent) for _ in range(args.runs)]
+    finally:
+        fake.stop()
+
+    def med(xs):
+        return f"{statistics.median(xs) * 1000:8.1f} ms"
+
+    print(f"chunk delay {args.chunk_ms} ms, {args.runs} runs (median)")
+    print(f"  blocking   answer : {med(base)}")
+    print(f"  streaming  plan   : {med([r['plan'] for r in runs])}")
+    print(f"  streaming  sql    : {med([r['sql'] for r in runs])}")
+    print(f"  streaming  answer : {med([r['answer'] for r in runs])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Synthetic data helpers for benchmarks: scale the bundled daily summary by
+replicating it over shifted date ranges.
+"""
+from __future__ import annotations
+import math
+from typing import Tuple
+
+import duckdb
+
+from src.config import SETTINGS
+
+
+def write_scaled_json(dst_path: str, scale: int, src_path: str = SETTINGS.data_path) -> int:
+    """
+    Write `scale` copies of src_path to dst_path as a JSON array, each copy
+    shifted by the source's date span so dates don't overlap. Returns row count.
+    """
+    con = duckdb.connect()
+    con.execute(f"CREATE TABLE src AS SELECT * FROM read_json_auto('{src_path}', sample_size=-1)")
+    span = con.execute("SELECT (MAX(date) - MIN(date)) + 1 FROM src").fetchone()[0]
+    con.execute(f"""
+        COPY (
+            SELECT * REPLACE (date + (r.range * {span})::INTEGER AS date)
+            FROM src, range({scale}) r
+            ORDER BY r.range
+        ) TO '{dst_path}' (FORMAT JSON, ARRAY true)
+    """)
+    n = con.execute(f"SELECT COUNT(*) * {scale} FROM src").fetchone()[0]
+    con.close()
+    return n
+
+
+def build_scaled_table(
+    con: duckdb.DuckDBPyConnection, table_name: str, scale: int, density: int = 1, src_path: str = SETTINGS.data_path
+) -> int:
+    """
+    Create table_name (typed layout, see data_loader.load_typed_json) holding
+    `scale` date-shifted copies of the bundled data, each day repeated
+    `density` times, without a JSON round trip.
+    """
+    from src.data_loader import load_typed_json
+    from src.schema_reader import read_schema
+
+    schema = read_schema(SETTINGS.schema_path, table_name)
+    load_typed_json(con, "_synth_base", src_path, schema)
+    span = con.execute("SELECT (MAX(date_parsed) - MIN(date_parsed)) + 1 FROM _synth_base").fetchone()[0]
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {table_name} AS
+        SELECT b.* REPLACE (
+            b.date + (r.range * {span})::INTEGER AS date,
+            b.date_parsed + (r.range * {span})::INTEGER AS date_parsed
+        )
+        FROM _synth_base b, range({scale}) r, range({density}) k
+        ORDER BY date_parsed, k.range  -- keep repeats apart so compression doesn't flatter scans
+    """)
+    con.execute("DROP VIEW IF EXISTS _synth_base_v")
+    con.execute("DROP TABLE _synth_base")
+    return con.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+
+
+def shape_for_rows(rows: int, base_rows: int, max_scale: int = 36) -> Tuple[int, int]:
+    """
+    (scale, density) for build_scaled_table giving at least `rows` rows:
+    extend the date range first (up to `max_scale` copies, ~3 years of the
+    bundled month), then repeat rows within each day.
+    """
+    copies = max(1, math.ceil(rows / base_rows))
+    scale = min(copies, max_scale)
+    return scale, math.ceil(copies / scale)
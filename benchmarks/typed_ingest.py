@@ -0,0 +1,92 @@
+"""
+Per-query latency: inferred table + date-parsing view vs schema-typed table
+with ENUM dimensions and a physical, sorted date_parsed column.
+
+    python -m benchmarks.typed_ingest --scale 50 --runs 20
+"""
+from __future__ import annotations
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+import duckdb
+
+from src.config import SETTINGS
+from src.data_loader import load_json_to_duckdb, load_typed_json
+from src.schema_reader import read_schema
+from benchmarks.synth import write_scaled_json
+
+V = "{view}"
+QUERIES = {
+    "latest_date": f"SELECT MAX(date_parsed) FROM {V}",
+    "d0_conv_by_city_15d": f"""
+        SELECT city, SUM(d0_orders) / NULLIF(SUM(d0_form_filled), 0) AS d0_conversion_rate
+        FROM {V}
+        WHERE date_parsed >= (SELECT MAX(date_parsed) FROM {V}) - INTERVAL '15 days'
+          AND city IS NOT NULL AND city <> ''
+        GROUP BY city ORDER BY d0_conversion_rate DESC LIMIT 1""",
+    "revenue_by_platform_7d": f"""
+        SELECT platform, SUM(d0_revenue) AS revenue
+        FROM {V}
+        WHERE date_parsed >= (SELECT MAX(date_parsed) FROM {V}) - INTERVAL '7 days'
+        GROUP BY platform ORDER BY revenue DESC LIMIT 200""",
+    "weekly_orders": f"""
+        SELECT DATE_TRUNC('week', date_parsed) AS wk, SUM(d0_orders) AS d0_orders
+        FROM {V} GROUP BY wk ORDER BY wk LIMIT 200""",
+    "mumbai_campaigns_30d": f"""
+        SELECT first_form_utm_campaign, SUM(dplus_orders) / NULLIF(SUM(dplus_form_filled), 0) AS r
+        FROM {V}
+        WHERE city = 'Mumbai'
+          AND date_parsed >= (SELECT MAX(date_parsed) FROM {V}) - INTERVAL '30 days'
+        GROUP BY 1 ORDER BY r DESC LIMIT 200""",
+}
+
+
+def _time(con: duckdb.DuckDBPyConnection, sql: str, runs: int) -> float:
+    con.execute(sql).fetchall()
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        con.execute(sql).fetchall()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scale", type=int, default=20)
+    ap.add_argument("--runs", type=int, default=20)
+    args = ap.parse_args()
+
+    work = tempfile.mkdtemp(prefix="bench_typed_")
+    try:
+        json_path = os.path.join(work, "scaled.json")
+        rows = write_scaled_json(json_path, args.scale)
+        schema = read_schema(SETTINGS.schema_path, SETTINGS.table_name)
+
+        legacy = duckdb.connect()
+        t0 = time.perf_counter()
+        load_json_to_duckdb(legacy, "t", json_path)
+        legacy_load = time.perf_counter() - t0
+
+        typed = duckdb.connect()
+        t0 = time.perf_counter()
+        load_typed_json(typed, "t", json_path, schema)
+        typed_load = time.perf_counter() - t0
+
+        print(f"{rows} rows")
+        print(f"{'ingest':28s} inferred {legacy_load * 1000:8.1f} ms   typed {typed_load * 1000:8.1f} ms")
+        for name, sql in QUERIES.items():
+            q = sql.replace(V, "t_v")
+            a = _time(legacy, q, args.runs)
+            b = _time(typed, q, args.runs)
+            print(f"{name:28s} view     {a * 1000:8.2f} ms   typed {b * 1000:8.2f} ms   x{a / b:5.1f}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
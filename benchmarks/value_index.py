@@ -0,0 +1,122 @@
+"""
+Correctness corpus + micro-benchmark for src/value_index.py against the
+previous entity matching (the agent's hard-coded city/platform loop for
+follow-up filters, and the regex alternation the fast paths used). Every
+corpus entry carries the filters it should resolve to; the script prints
+where each matcher is wrong and exits nonzero if the index is. Timing
+scales the value set up with synthetic campaign names to show the
+regex's per-value cost.
+
+    python -m benchmarks.value_index --values 20000
+"""
+from __future__ import annotations
+import argparse
+import re
+import sys
+import time
+from typing import Any, Dict, List
+
+from src.config import SETTINGS
+from src.intent import VOCABULARY
+from src.value_index import ValueIndex, parse_aliases
+
+ENTITIES: Dict[str, List[str]] = {
+    "gender": ["Female", "Male"],
+    "platform": ["app", "web"],
+    "city": ["Ahmedabad", "Bangalore", "Chandigarh", "Chennai", "Coimbatore", "Delhi", "Hyderabad", "Indore",
+             "Jaipur", "Kochi", "Kolkata", "Lucknow", "Mumbai", "Nagpur", "Pune"],
+    "stage": ["Stage 1", "Stage 2", "Stage 3", "Stage 4", "Stage 5", "Unknown"],
+    "age_bucket": ["18-25", "26-35", "36-45", "46-55", "55+"],
+    "first_form_utm_source": ["bing", "direct", "facebook", "google", "instagram", "twitter", "whatsapp", "youtube"],
+    "first_form_utm_campaign": ["brand_awareness", "discount_20off", "generic_search", "winter_sale"],
+    "order_utm_source": ["bing", "direct", "facebook", "google", "instagram", "twitter", "whatsapp", "youtube"],
+    "order_utm_campaign": ["brand_awareness", "discount_20off", "generic_search", "winter_sale"],
+}
+
+# (question, expected unambiguous filters)
+CORPUS = [
+    ("What about Mumbai?", {"city": "Mumbai"}),
+    ("D0 orders in Bengaluru on the app", {"city": "Bangalore", "platform": "app"}),
+    ("Compare web vs app", {"platform": ["web", "app"]}),
+    ("Only Stage 3 users aged 55+", {"stage": "Stage 3", "age_bucket": "55+"}),
+    ("Revenue for females in Hyderbad", {"gender": "Female", "city": "Hyderabad"}),
+    ("how about kolkatta", {"city": "Kolkata"}),
+    ("New Delhi conversion by platform", {"city": "Delhi"}),
+    ("Bombay, 26-35, web", {"city": "Mumbai", "age_bucket": "26-35", "platform": "web"}),
+    ("Which application flow converts best?", {}),
+    ("Show the webinar signups", {}),
+    ("Orders during stage 10", {}),
+    ("Pune and Chennai revenue", {"city": ["Pune", "Chennai"]}),
+    ("male users in Indore", {"gender": "Male", "city": "Indore"}),
+    ("D0 conversion for Stage 2 in Jaipur last 7 days", {"stage": "Stage 2", "city": "Jaipur"}),
+    # utm values repeat across first-form and order columns: left to the LLM
+    ("orders from google", {}),
+    ("winter sale results", {}),
+    ("show completion rate by city", {}),
+    ("top cities by revenue", {}),
+]
+
+
+def old_filters(question: str) -> Dict[str, Any]:
+    # The agent's follow-up filter extraction before the value index.
+    out: Dict[str, Any] = {}
+    qlow = question.lower()
+    for city in ["mumbai", "delhi", "bangalore", "bengaluru", "pune", "hyderabad", "chennai", "kolkata", "ahmedabad"]:
+        if city in qlow:
+            out["city"] = city.title().replace("Bengaluru", "Bangalore")
+    for plat in ["web", "app"]:
+        if f" {plat}" in qlow or qlow.endswith(plat):
+            out["platform"] = plat
+    return out
+
+
+def old_regex(entities: Dict[str, List[str]]) -> re.Pattern:
+    # The fast paths' alternation of every value, longest first.
+    names = sorted({v.lower() for vs in entities.values() for v in vs}, key=len, reverse=True)
+    return re.compile(r"(?<![\w])(?:" + "|".join(re.escape(n) for n in names) + r")(?![\w])")
+
+
+def _per_call_us(fn, texts: List[str], runs: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        for t in texts:
+            fn(t)
+    return (time.perf_counter() - t0) / (runs * len(texts)) * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--values", type=int, default=20000, help="synthetic campaign values added for the timing run")
+    ap.add_argument("--runs", type=int, default=200)
+    args = ap.parse_args()
+
+    aliases = parse_aliases(SETTINGS.value_aliases)
+    index = ValueIndex(ENTITIES, aliases, VOCABULARY)
+    wrong_new = wrong_old = 0
+    for question, expected in CORPUS:
+        got, old = index.filters(question), old_filters(question)
+        wrong_new += got != expected
+        wrong_old += old != expected
+        flag = "ok  " if got == expected else "FAIL"
+        print(f"{flag} {question[:48]:<48} index={got}  old={'=' if old == expected else old}")
+    print(f"wrong: index {wrong_new}/{len(CORPUS)}, old {wrong_old}/{len(CORPUS)}")
+
+    big = dict(ENTITIES)
+    big["order_utm_content"] = [f"campaign_{i:06d}_{i % 97}" for i in range(args.values)]
+    t0 = time.perf_counter()
+    big_index = ValueIndex(big, aliases, VOCABULARY)
+    build_index = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    rx = old_regex(big)
+    build_rx = time.perf_counter() - t0
+    texts = [q.lower() for q, _ in CORPUS]
+    us_index = _per_call_us(big_index.matches, texts, args.runs)
+    us_rx = _per_call_us(lambda t: list(rx.finditer(t)), texts, args.runs)
+    n = sum(len(v) for v in big.values())
+    print(f"{n} values: build index {build_index:.2f} s, regex {build_rx:.2f} s; "
+          f"per question index {us_index:.1f} us, regex {us_rx:.1f} us")
+    sys.exit(1 if wrong_new else 0)
+
+
+if __name__ == "__main__":
+    main()
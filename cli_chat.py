@@ -2,6 +2,7 @@ from src.data_loader import init_db
 from src.schema_reader import read_schema
 from src.agent import AnalyticsAgent, ChatState
 from src.config import SETTINGS
+from src.formatting import format_approx
 
 def main():
     con = init_db()
@@ -13,9 +14,24 @@ def main():
     while True:
         q = input("\nYou: ").strip()
         if q.lower() in {"exit", "quit"}:
+            agent.end_session(state.session_id)
             break
-        ans, state = agent.answer(q, state)
-        print("\nAssistant:\n", ans)
+        if q.lower() == "reload" and SETTINGS.data_dir:
+            stats = agent.ingest_partitions()
+            print(f"\nLoaded {len(stats['loaded'])} file(s), {stats['rows']} rows; {stats['skipped']} unchanged.")
+            continue
+        for kind, data in agent.answer_stream(q, state):
+            if kind == "plan":
+                print("\nPlan:\n" + "\n".join(f"  - {p}" for p in data), flush=True)
+            elif kind == "sql":
+                print(f"\nSQL:\n{data}", flush=True)
+            elif kind == "status":
+                print(f"\n[{data}]", flush=True)
+            elif kind == "approx":
+                print("\n" + format_approx(data), flush=True)
+            elif kind == "answer":
+                ans, state = data
+                print("\nAssistant:\n", ans)
 
 if __name__ == "__main__":
     main()
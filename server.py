@@ -0,0 +1,21 @@
+import asyncio
+
+from src.data_loader import init_db
+from src.schema_reader import read_schema
+from src.agent import AnalyticsAgent
+from src.config import SETTINGS
+from src.http_api import serve
+
+
+def main():
+    con = init_db()
+    schema = read_schema(SETTINGS.schema_path, SETTINGS.table_name)
+    agent = AnalyticsAgent(con, schema)
+    try:
+        asyncio.run(serve(agent, SETTINGS.api_host, SETTINGS.api_port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
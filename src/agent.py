@@ -1,20 +1,42 @@
 from __future__ import annotations
+import hashlib
 import json
-from dataclasses import dataclass, field
-from typing import Dict, Any, List, Optional, Tuple
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field, replace
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 
 import duckdb
-import pandas as pd
 # from .sql_schema_guard import find_unknown_columns
 from .sql_schema_guard import find_unknown_identifiers
-from .data_loader import get_table_columns
+from .data_loader import get_table_columns, load_partitions, finalize_storage, get_date_bounds, get_data_version, dimension_values
+from .sql_rewrite import inline_date_bounds
+from .rollups import RollupRouter
+from .sampling import Approximation, Approximator
+from .result_cache import ResultCache
+from .question_cache import QuestionCache, prompt_version
+from .json_stream import IncrementalJSONObject
+from .db_pool import CursorPool
+from .query_guard import QueryRejected, check_plan, run_with_timeout
+from .intent import VOCABULARY, Intent, IntentEngine
+from .value_index import ValueIndex, parse_aliases
+from .session_cache import COMPONENTS, Intermediate, Lineage, SessionCache
+from .sql_repair import SqlRepairer
+from .speculative import SpeculativeRun, parse_temperatures
+from .model_router import ModelRouter
+from .tracing import METRICS, Trace, TraceLog, profiled
+from .arrow_result import QueryResult, export_query, fetch_bounded
 
 
 
 from .llm_ollama import OllamaClient
 from .sql_guard import is_safe_select_sql
+from .sql_analyzer import analyze_sql
 from .formatting import format_answer
-from .prompts import system_prompt, REFINE_PROMPT
+from .prompt_builder import Prompt, PromptBuilder
 from .schema_reader import TableSchema
 from .config import SETTINGS
 
@@ -33,6 +55,12 @@ class ChatState:
 
     # NEW: store resolved entities
     top_city: Optional[str] = None
+    # Slots of the last fast-path answer, for follow-ups ("what about web?")
+    last_intent: Optional[Dict[str, Any]] = None
+    # Stage timings of the last answer (Trace.to_dict()), for the UI.
+    last_trace: Optional[Dict[str, Any]] = None
+    # Owns this conversation's cached intermediates (AnalyticsAgent.end_session).
+    session_id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
 
 
 class AnalyticsAgent:
@@ -44,36 +72,94 @@ class AnalyticsAgent:
         self.table_view = f"{SETTINGS.table_name}_v"
         db_cols = get_table_columns(self.con, self.table_view)
         self.valid_identifiers = {c.lower() for c in db_cols} | {SETTINGS.table_name.lower(), self.table_view.lower()}
+        # What generated SQL may read (see _guarded); rollups and the sample are swapped in after the guard.
+        self.relations = {SETTINGS.table_name.lower(), self.table_view.lower()}
 
         self.valid_columns = {c.name.lower() for c in self.schema.columns}
+        self.rollups = RollupRouter(self.con, self.schema, SETTINGS.table_name, [self.table_view, SETTINGS.table_name])
+        self.approx = Approximator(self.con, self.schema, SETTINGS.table_name, self.rollups, enabled=SETTINGS.enable_approx_answers)
+        self.result_cache = ResultCache(reserved=self.valid_identifiers)
+        self.repairer = SqlRepairer(self.valid_identifiers, SETTINGS.table_name, self.table_view)
+        # Queries run on pooled per-request cursors; the executor runs SQL while
+        # the LLM is still streaming the rest of its answer.
+        self.cursors = CursorPool(self.con, SETTINGS.db_cursor_pool_size)
+        self._sql_pool = ThreadPoolExecutor(max_workers=SETTINGS.db_cursor_pool_size, thread_name_prefix="sql")
         # self.valid_identifiers = set(self.valid_columns) | {SETTINGS.table_name.lower(), self.table_view.lower()}
 
-        self.sys = system_prompt(
-            # schema_text=self.schema.to_prompt_text(),
-            schema_text=self.schema.to_compact_prompt_text(),
-
-            table_view=self.table_view,
-            max_rows=SETTINGS.max_rows_returned
+        # One value index for every entity lookup: fast paths, question cache and follow-up filters.
+        self.values = self._value_index(dimension_values(self.con, self.table_view))
+        self.prompts = PromptBuilder(
+            self.schema, self.table_view, SETTINGS.max_rows_returned, self.values, SETTINGS.prompt_token_budget
         )
-
-    def _messages(self, user_question: str, state: ChatState) -> List[Dict[str, str]]:
-        # We lightly inject context: last filters + last question
-        context = {
-            "last_question": state.last_question,
-            "last_filters": state.last_filters,
-            "note": "If the new question is a follow-up like 'what about Mumbai?', apply those filters on top of last_filters."
-        }
-        return [
-            {"role": "system", "content": self.sys},
-            {"role": "user", "content": f"Conversation context JSON:\n{json.dumps(context)}\n\nUser question:\n{user_question}"}
-        ]
-
-    def _refine_messages(self, user_question: str, prev_sql: str, error: str) -> List[Dict[str, str]]:
-        return [
-            {"role": "system", "content": self.sys},
-            {"role": "user", "content": REFINE_PROMPT.strip()},
-            {"role": "user", "content": f"User question:\n{user_question}\n\nPrevious SQL:\n{prev_sql}\n\nError/Issue:\n{error}"}
-        ]
+        self.sys = self.prompts.system
+        self.question_cache = QuestionCache(
+            SETTINGS.question_cache_path,
+            prompt_version(
+                self.sys, self.schema.to_prompt_text(), self.prompts.template,
+                SETTINGS.ollama_model, SETTINGS.ollama_small_model,
+            ),
+            self.values,
+            enabled=SETTINGS.enable_question_cache,
+        )
+        self.router = ModelRouter(SETTINGS.ollama_model, SETTINGS.ollama_small_model, SETTINGS.cascade_threshold, self.values)
+        self.intents = IntentEngine(self.table_view, self.values, SETTINGS.max_rows_returned, enabled=SETTINGS.enable_intent_engine)
+        self.session_cache = SessionCache(
+            self.con,
+            self.table_view,
+            self.values.entities,
+            [d.strip() for d in SETTINGS.session_cache_dims.split(",") if d.strip()],
+            SETTINGS.session_cache_entries,
+            SETTINGS.session_cache_max_rows,
+            SETTINGS.session_cache_total_rows,
+            enabled=SETTINGS.enable_session_cache,
+        )
+        # Speculative mode: K candidate answers per LLM call instead of one (see speculative.py).
+        temps = parse_temperatures(SETTINGS.speculative_temperatures)
+        self.speculative_temperatures = [temps[i % len(temps)] for i in range(max(1, SETTINGS.speculative_candidates))]
+        self.speculative = SETTINGS.enable_speculative_sql and len(self.speculative_temperatures) > 1
+        self.metrics = METRICS
+        self.trace_log = TraceLog(SETTINGS.trace_log_path)
+        self._profile_dir = os.path.join(SETTINGS.cache_dir, "profiles") if SETTINGS.enable_query_profiling else ""
+        if self._profile_dir:
+            os.makedirs(self._profile_dir, exist_ok=True)
+
+    @staticmethod
+    def _value_index(entities: Dict[str, List[str]]) -> ValueIndex:
+        return ValueIndex(entities, parse_aliases(SETTINGS.value_aliases), VOCABULARY, typos=SETTINGS.value_typo_tolerance)
+
+    def ingest_partitions(self, data_dir: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Pick up new/changed per-day files into the live database. Runs on its
+        own cursor so in-flight queries keep reading their snapshot.
+        """
+        cur = self.con.cursor()
+        try:
+            stats = load_partitions(cur, SETTINGS.table_name, data_dir or SETTINGS.data_dir, self.schema)
+            if stats["loaded"]:
+                finalize_storage(cur, SETTINGS.table_name, self.schema, stats["dates"])
+                self.rollups.reload()
+                self.approx.reload()
+                self.values = self._value_index(dimension_values(cur, self.table_view))
+                self.question_cache.values = self.intents.values = self.prompts.values = self.router.values = self.values
+                self.session_cache.set_entities(self.values.entities)
+                self.session_cache.clear()
+            return stats
+        finally:
+            cur.close()
+
+    def _prompt(self, user_question: str, state: ChatState) -> Prompt:
+        # We lightly inject context: last filters + last question (the rules
+        # for using them are in the static system prompt). Empty keys are left out.
+        context: Dict[str, Any] = {}
+        if state.last_question:
+            context["last_question"] = state.last_question
+        if state.last_filters:
+            context["last_filters"] = state.last_filters
+        # Values the question mentions, resolved to exact column literals.
+        mentioned = self.values.describe(user_question)
+        if mentioned:
+            context["question_values"] = mentioned
+        return self.prompts.build(user_question, context, state.last_sql)
 
     def _parse_llm_json(self, text: str) -> Dict[str, Any]:
         # Strict JSON parsing with small cleanup
@@ -83,22 +169,310 @@ class AnalyticsAgent:
     def _apply_default_limit_if_missing(self, sql: str) -> str:
         # If user query results likely multi-row and LIMIT missing, LLM should add it.
         # We'll trust the LLM; but as safety, if no LIMIT found, append one.
-        up = sql.upper()
-        if "LIMIT" not in up:
-            return sql.rstrip() + f"\nLIMIT {SETTINGS.max_rows_returned}"
+        if not analyze_sql(sql).has_limit:
+            return sql.rstrip().rstrip(";").rstrip() + f"\nLIMIT {SETTINGS.max_rows_returned}"
         return sql
 
-    def _execute(self, sql: str) -> pd.DataFrame:
-        return self.con.execute(sql).df()
+    def _guarded(self, sql: str) -> Optional[str]:
+        """
+        `sql` if it is a read-only SELECT over the data's own relations (the
+        table, its date view, this process's session intermediates), with
+        misspelled table names fixed; None otherwise. Table functions and
+        other catalog tables could read files or internals.
+        """
+        relations = self.relations | self.session_cache.relations()
+        if is_safe_select_sql(sql, relations):
+            return sql
+        fixed = self.repairer.fix_relations(sql, relations)
+        return fixed if fixed is not None and is_safe_select_sql(fixed, relations) else None
+
+    def _unusable(self, payload: Dict[str, Any]) -> Optional[str]:
+        """Why a model answer can't be used as is ("parse" or "guard"), or None."""
+        sql = payload.get("sql")
+        if not sql or not isinstance(sql, str):
+            return "parse"
+        if self._guarded(self._apply_default_limit_if_missing(sql)) is None:
+            return "guard"
+        return None
+
+    def _validate_sql(self, sql: str) -> Optional[str]:
+        """Why `sql` would fail before running (guard, binder or cost check), or None."""
+        if self._guarded(sql) != sql:
+            return "Not a read-only SELECT."
+        try:
+            with self.cursors.acquire() as cur:
+                run_sql, _ = self._physical_sql(cur, sql)
+                check_plan(cur, run_sql, SETTINGS.max_estimated_rows)
+        except (QueryRejected, duckdb.Error) as e:
+            return str(e)
+        return None
+
+    def _profile_path(self) -> Optional[str]:
+        # One file per worker thread; a cursor is only used by one thread at a time.
+        if not self._profile_dir:
+            return None
+        return os.path.join(self._profile_dir, f"{threading.get_ident()}.json")
+
+    def _physical_sql(self, cur: duckdb.DuckDBPyConnection, sql: str) -> Tuple[str, bool]:
+        # Date bounds inlined as literals, then routed to a rollup when one covers the query.
+        bounds = get_date_bounds(cur, SETTINGS.table_name)
+        run_sql = inline_date_bounds(sql, [self.table_view, SETTINGS.table_name], bounds)
+        routed = False
+        if SETTINGS.enable_rollups:
+            rolled = self.rollups.route(run_sql)
+            routed, run_sql = rolled != run_sql, rolled
+        return run_sql.strip().rstrip(";"), routed
+
+    def _execute(self, sql: str, trace: Optional[Trace] = None, attempt: int = 1) -> QueryResult:
+        """
+        Run on a pooled cursor and fetch as Arrow batches, keeping only the
+        preview rows plus an exact row count.
+        """
+        trace = trace or Trace(sql)
+        with trace.span("execute", attempt=attempt) as span:
+            with self.cursors.acquire() as cur:
+                version = get_data_version(cur, SETTINGS.table_name)
+            cached = self.result_cache.get(sql, version)
+            if cached is not None:
+                span.attrs.update(cached=True, rows=cached.total_rows)
+                return cached
+
+            def run() -> QueryResult:
+                with self.cursors.acquire() as cur:
+                    run_sql, span.attrs["rollup"] = self._physical_sql(cur, sql)
+                    with trace.span("plan_check"):
+                        check_plan(cur, run_sql, SETTINGS.max_estimated_rows)
+                    with profiled(cur, self._profile_path()) as profile:
+                        result = run_with_timeout(
+                            cur, run_sql, SETTINGS.query_timeout_s,
+                            fetch=lambda c: fetch_bounded(c, SETTINGS.result_preview_rows, run_sql),
+                        )
+                span.attrs.update(preview_bytes=result.nbytes, profile=profile)
+                self.result_cache.put(sql, version, result)
+                return result
+
+            # The same query already running for another session: wait for it, don't run it twice.
+            result, shared = self.result_cache.single_flight(sql, version, run)
+            span.attrs.update(cached=False, shared=shared, rows=result.total_rows)
+        return result
+
+    def _approximate(self, sql: str, pending: Future, trace: Trace) -> Optional[Approximation]:
+        """
+        If `pending` (the exact query) is still running after APPROX_AFTER_MS,
+        estimate `sql` from the sample (see sampling.py). None when the exact
+        result came first or the query can't be estimated.
+        """
+        try:
+            pending.result(timeout=SETTINGS.approx_after_ms / 1000)
+            return None
+        except FutureTimeout:
+            pass
+        except Exception:
+            return None  # the caller gets the error from pending
+        self.approx.maybe_redraw(self._sql_pool.submit)
+        with trace.span("approx") as span, self.cursors.acquire() as cur:
+            run_sql = inline_date_bounds(sql, [self.table_view, SETTINGS.table_name], get_date_bounds(cur, SETTINGS.table_name))
+            if SETTINGS.enable_rollups and self.rollups.pick(run_sql)[0] is not None:
+                span.attrs["used"] = False  # a rollup answers it exactly, about as fast
+                return None
+            approx = self.approx.run(cur, run_sql, SETTINGS.query_timeout_s)
+            span.attrs["used"] = approx is not None
+            if approx is not None:
+                span.attrs.update(rows=approx.result.total_rows, sample_rows=approx.sample_rows, replicates=approx.replicates)
+        if approx is None or pending.done():
+            return None
+        self.metrics.incr("approx_answers")
+        return approx
+
+    def export_result(self, sql: str, fmt: str = "csv") -> str:
+        """
+        Write the full result of `sql` (as last answered) to a CSV or Parquet
+        file under CACHE_DIR/exports, streamed by DuckDB. Returns the path.
+        """
+        with self.cursors.acquire() as cur:
+            version = get_data_version(cur, SETTINGS.table_name)
+            run_sql, _ = self._physical_sql(cur, sql)
+            name = hashlib.sha256(f"{version}\n{run_sql}".encode("utf-8")).hexdigest()[:16]
+            path = os.path.join(SETTINGS.cache_dir, "exports", f"{name}.{fmt}")
+            if not os.path.exists(path):
+                check_plan(cur, run_sql, SETTINGS.max_estimated_rows)
+                tmp = f"{path}.tmp"
+                run_with_timeout(cur, run_sql, SETTINGS.query_timeout_s, fetch=lambda c: export_query(c, run_sql, tmp, fmt))
+                os.replace(tmp, path)
+        return path
+
+    def _build_intermediate(self, session_id: str, intent: Intent) -> Optional[Intermediate]:
+        """Materialize an intermediate for `intent` in this session (run in the background after answering)."""
+        t0 = time.perf_counter()
+        with self.cursors.acquire() as cur:
+            version = get_data_version(cur, SETTINGS.table_name)
+            if self.session_cache.find(session_id, intent, version, count=False) is not None:
+                return None
+            bounds = get_date_bounds(cur, SETTINGS.table_name)
+            days = intent.window_days or ((bounds[1] - bounds[0]).days + 1 if bounds else 366)
+            plan = self.session_cache.plan(intent, days)
+            if plan is None:
+                return None
+            grain, applied = plan
+            name = self.session_cache.new_name(session_id)
+            run_sql, _ = self._physical_sql(cur, self.session_cache.select_sql(grain, applied, intent.window_days))
+            try:
+                run_with_timeout(cur, f"CREATE TABLE {name} AS {run_sql}", SETTINGS.query_timeout_s, fetch=lambda c: None)
+            except (QueryRejected, duckdb.Error):
+                self.session_cache._drop(cur, [name])
+                return None
+            rows = cur.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+            lineage = Lineage(grain, COMPONENTS, applied, intent.window_days, version)
+            entry = self.session_cache.register(cur, Intermediate(name, session_id, lineage, rows, time.time()))
+        self.metrics.observe("intermediate_build_ms", (time.perf_counter() - t0) * 1000)
+        return entry
+
+    def end_session(self, session_id: str) -> int:
+        """Drop a conversation's cached intermediates (on reset); returns how many."""
+        return self.session_cache.drop_session(session_id)
 
     def answer(self, user_question: str, state: ChatState) -> Tuple[str, ChatState]:
+        result: Tuple[str, ChatState] = ("", state)
+        for kind, data in self.answer_stream(user_question, state):
+            if kind == "answer":
+                result = data
+        return result
+
+    def answer_stream(self, user_question: str, state: ChatState) -> Iterator[Tuple[str, Any]]:
+        """
+        Progressive version of answer(). Yields ("plan", list), ("sql", str) and
+        ("status", str) events while working, ("approx", Approximation) with
+        a sample-based estimate when the query is slow, then ("result", dict)
+        with the structured answer (SQL, exact QueryResult, interpretation)
+        when a query ran, and finally ("answer", (text, state)).
+        The query starts as soon as the streamed `sql` field is complete,
+        while the model is still writing the interpretation and follow-ups.
+        Each answer is traced; the new state carries the trace in `last_trace`.
+        """
+        trace = Trace(user_question)
+        try:
+            for kind, data in self._answer_stream(user_question, state, trace):
+                if kind == "answer":
+                    text, new_state = data
+                    self._finish_trace(trace)
+                    data = (text, replace(new_state, last_trace=trace.to_dict()))
+                yield kind, data
+        except Exception as e:
+            self._finish_trace(trace, error=f"{type(e).__name__}: {e}"[:300])
+            raise
+
+    def _finish_trace(self, trace: Trace, **attrs: Any) -> None:
+        trace.finish(**attrs)
+        trace.record(self.metrics)
+        try:
+            self.trace_log.write(trace)
+        except OSError:
+            pass  # tracing must never fail an answer
+
+    def _answer_stream(self, user_question: str, state: ChatState, trace: Trace) -> Iterator[Tuple[str, Any]]:
         q = user_question
         if isinstance(state.top_city, str) and state.top_city.strip() and "top city" in q.lower():
             q = q.replace("that top city", state.top_city).replace("top city", state.top_city)
 
-        # 1) Ask LLM for plan+SQL
-        llm_text = self.llm.chat(self._messages(user_question, state) ,temperature=0.1)
-        payload = self._parse_llm_json(llm_text)
+        # 1) Ask LLM for plan+SQL, unless the question is a templated metric question
+        # (compiled directly) or has the same shape as a validated earlier answer.
+        with trace.span("route") as span:
+            intent = self.intents.parse(user_question, state.last_intent)
+            if intent is not None:
+                payload = self.intents.payload(intent)
+                no_llm = True
+                span.attrs["source"] = "intent"
+            else:
+                payload = self.question_cache.lookup(user_question, state.last_filters, state.last_question)
+                no_llm = payload is not None
+                span.attrs["source"] = "question_cache" if no_llm else "llm"
+            trace.attrs["source"] = span.attrs["source"]
+        # Fast-path answers run against this session's cached intermediate when
+        # one covers them, so follow-ups don't rescan the base data.
+        base_sql: Optional[str] = None
+        entry: Optional[Intermediate] = None
+        if intent is not None and self.session_cache.enabled:
+            with trace.span("intermediate") as span:
+                with self.cursors.acquire() as cur:
+                    version = get_data_version(cur, SETTINGS.table_name)
+                entry = self.session_cache.find(state.session_id, intent, version)
+                span.attrs["reused"] = entry is not None
+                if entry is not None:
+                    span.attrs.update(table=entry.name, rows=entry.rows)
+                    base_sql = payload["sql"]
+                    payload = {**payload, "sql": self.intents.compile(intent, relation=entry.name, applied=entry.applied)}
+        llm_ms = 0.0
+        prompt: Optional[Prompt] = None
+        reply: Optional[str] = None  # the model's raw text for `prompt`, kept for refine calls
+        early: Optional[Future] = None
+        early_sql: Optional[str] = None
+        spec: Optional[SpeculativeRun] = None
+        model: Optional[str] = None  # the model whose SQL is being run
+        if payload is None:
+            with trace.span("prompt") as span:
+                prompt = self._prompt(user_question, state)
+                span.attrs.update(prompt.usage())
+            messages = prompt.messages
+            route = self.router.route(user_question, follow_up=bool(state.last_sql))
+            model = route.model
+            trace.attrs.update(model=model, complexity=route.score)
+            while True:
+                t0 = time.perf_counter()
+                if self.speculative:
+                    # K candidates at once, each validated with EXPLAIN as it completes;
+                    # the first valid one runs and the others stand by in place of refine calls.
+                    yield ("status", f"Drafting {len(self.speculative_temperatures)} candidate queries…")
+                    with trace.span("llm", kind="speculate") as span:
+                        spec = SpeculativeRun(
+                            self.llm, messages, self.speculative_temperatures, SETTINGS.speculative_concurrency,
+                            self._apply_default_limit_if_missing, self._validate_sql, model=model,
+                        )
+                        chosen = spec.next_valid() or spec.first_reply()
+                        if chosen is not None:
+                            span.attrs.update(chosen.usage, candidate=chosen.index, temperature=chosen.temperature)
+                    payload = chosen.payload if chosen is not None and isinstance(chosen.payload, dict) else {}
+                    reply = chosen.reply if chosen is not None else None
+                    yield ("plan", payload.get("analysis_plan", []))
+                    yield ("sql", payload.get("sql", ""))
+                else:
+                    parser = IncrementalJSONObject()
+                    deltas: List[str] = []
+                    with trace.span("llm", kind="generate") as span:
+                        for delta in self.llm.chat_stream(messages, temperature=0.1, usage=span.attrs, model=model):
+                            deltas.append(delta)
+                            for key, value in parser.feed(delta):
+                                if key == "analysis_plan":
+                                    yield ("plan", value)
+                                elif key == "sql" and isinstance(value, str) and value:
+                                    early_sql = self._apply_default_limit_if_missing(value)
+                                    yield ("sql", early_sql)
+                                    if self._guarded(early_sql) == early_sql:
+                                        early = self._sql_pool.submit(self._execute, early_sql, trace)
+                                        yield ("status", "Running query…")
+                    reply = "".join(deltas)
+                    try:
+                        payload = parser.result()
+                    except ValueError:
+                        if route.fallback is None or model == route.fallback:
+                            raise
+                        payload = {}
+                ms = (time.perf_counter() - t0) * 1000
+                llm_ms += ms
+                self.router.record_call(model, ms)
+                problem = self._unusable(payload)
+                if problem is None or route.fallback is None or model == route.fallback:
+                    break
+                # Cascade: the small model's answer can't be used; ask the large one.
+                self.router.record_outcome(model, False, problem, escalated=True)
+                if spec is not None:
+                    spec.cancel()
+                early = early_sql = None
+                model = route.fallback
+                trace.attrs["escalated"] = problem
+                yield ("status", f"Escalating to {model}…")
+        else:
+            yield ("plan", payload.get("analysis_plan", []))
+            yield ("sql", payload.get("sql", ""))
 
         plan = payload.get("analysis_plan", [])
         sql = payload.get("sql", "")
@@ -107,13 +481,25 @@ class AnalyticsAgent:
         followups = payload.get("followups", [])
 
         if not sql or not isinstance(sql, str):
-            return ("I couldn't generate SQL for that. Try rephrasing your question with a specific metric/dimension.", state)
+            if model is not None:
+                self.router.record_outcome(model, False, "parse")
+            yield ("answer", ("I couldn't generate SQL for that. Try rephrasing your question with a specific metric/dimension.", state))
+            return
 
         sql = self._apply_default_limit_if_missing(sql)
+        if sql != early_sql:
+            early = None
 
         # 2) Guardrail: read-only SQL
-        if not is_safe_select_sql(sql):
-            return ("I generated unsafe SQL (non-SELECT). Please rephrase your request as a read-only analytics question.", state)
+        with trace.span("guard"):
+            guarded = self._guarded(sql)
+        if guarded is None:
+            if model is not None:
+                self.router.record_outcome(model, False, "guard")
+            if no_llm and intent is None:
+                self.question_cache.discard(user_question, state.last_filters, state.last_question)
+            yield ("answer", ("I generated unsafe SQL (non-SELECT). Please rephrase your request as a read-only analytics question.", state))
+            return
         
         # 2.5) Schema guard: prevent hallucinated columns
         # unknown = find_unknown_columns(sql, self.valid_identifiers)
@@ -140,23 +526,96 @@ class AnalyticsAgent:
         #     if unknown2:
         #         return (f"I couldn't generate valid SQL. Unknown identifiers still present: {unknown2}", state)
 
-        if not is_safe_select_sql(sql):
-            return ("I generated unsafe SQL (non-SELECT). Please rephrase.", state)
+        if guarded != sql:
+            sql = guarded
+            yield ("sql", sql)
 
         # 3) Execute + reflect retry if needed
         tries = 0
         last_err = None
-        df: pd.DataFrame | None = None
+        df: QueryResult | None = None
+        repaired: set = set()
 
         while tries < 3:
             tries += 1
             try:
-                df = self._execute(sql)
+                if early is not None:
+                    pending, early = early, None
+                elif self.approx.available:
+                    pending = self._sql_pool.submit(self._execute, sql, trace, tries)
+                else:
+                    pending = None
+                if pending is not None:
+                    # Slow query: show an estimate from the sample while the exact one runs.
+                    approx = self._approximate(sql, pending, trace) if self.approx.available else None
+                    if approx is not None:
+                        trace.attrs["approximate"] = {"ms": round(approx.ms, 1), "sample_rows": approx.sample_rows}
+                        yield ("approx", approx)
+                    df = pending.result()
+                else:
+                    df = self._execute(sql, trace, attempt=tries)
+                if sql in repaired:
+                    self.repairer.record_avoided()
                 break
             except Exception as e:
                 last_err = str(e)
+                if base_sql is not None and sql != base_sql:
+                    # Intermediate gone (evicted or reset meanwhile): use the base query.
+                    sql, tries = base_sql, tries - 1
+                    yield ("sql", sql)
+                    continue
+                alt = spec.next_valid() if spec is not None else None
+                if alt is not None:
+                    # Another candidate already passed EXPLAIN: run it instead of a refine round trip.
+                    sql, reply, tries = alt.sql, alt.reply, tries - 1
+                    plan = alt.payload.get("analysis_plan", plan)
+                    interpretation = alt.payload.get("result_interpretation", interpretation)
+                    assumptions = alt.payload.get("assumptions", assumptions)
+                    followups = alt.payload.get("followups", followups)
+                    self.metrics.incr("speculative_alternates")
+                    yield ("status", "Query failed, running the next candidate…")
+                    yield ("sql", sql)
+                    continue
+                # Mechanical mistakes (typos, dangling clauses, parens) are fixed
+                # locally; only what that can't fix goes back to the LLM.
+                if not isinstance(e, QueryRejected):
+                    with trace.span("repair") as span, self.cursors.acquire() as cur:
+                        fixed = self.repairer.repair(cur, sql, last_err)
+                        span.attrs["fixed"] = fixed is not None
+                    if fixed and fixed not in repaired and self._guarded(fixed) == fixed:
+                        if no_llm and intent is None:
+                            self.question_cache.discard(user_question, state.last_filters, state.last_question)
+                        repaired.add(fixed)
+                        sql = fixed
+                        tries -= 1
+                        yield ("status", "Fixed the query locally, re-running…")
+                        yield ("sql", sql)
+                        continue
+                if isinstance(e, QueryRejected):
+                    yield ("status", f"{e.detail} Asking the model for a cheaper query…")
+                else:
+                    yield ("status", "Query failed, asking the model to fix it…")
+                if no_llm:
+                    if intent is None:
+                        self.question_cache.discard(user_question, state.last_filters, state.last_question)
+                    no_llm = False
+                if model is not None and model != self.router.large_model:
+                    # Cascade: the small model's query failed to run; the large model refines it.
+                    self.router.record_outcome(model, False, "execute", escalated=True)
+                    model = self.router.large_model
+                    trace.attrs["escalated"] = "execute"
                 # refine
-                refine_text = self.llm.chat(self._refine_messages(user_question, sql, last_err))
+                with trace.span("prompt") as span:
+                    # The previous call's messages and reply plus the error: all of it stays cached.
+                    prompt = self.prompts.refine(prompt or self._prompt(user_question, state), reply, sql, last_err)
+                    span.attrs.update(prompt.usage())
+                messages = prompt.messages
+                t0 = time.perf_counter()
+                with trace.span("llm", kind="refine") as span:
+                    refine_text = reply = self.llm.chat(messages, usage=span.attrs, model=model)
+                ms = (time.perf_counter() - t0) * 1000
+                llm_ms += ms
+                self.router.record_call(model or self.router.large_model, ms)
                 refined = self._parse_llm_json(refine_text)
                 sql = self._apply_default_limit_if_missing(refined.get("sql", sql))
                 plan = refined.get("analysis_plan", plan)
@@ -164,11 +623,37 @@ class AnalyticsAgent:
                 assumptions = refined.get("assumptions", assumptions)
                 followups = refined.get("followups", followups)
 
-                if not is_safe_select_sql(sql):
-                    return ("The refined SQL still isn't safe to run. Please ask a read-only question.", state)
-
+                guarded = self._guarded(sql)
+                if guarded is None:
+                    yield ("sql", sql)
+                    yield ("answer", ("The refined SQL still isn't safe to run. Please ask a read-only question.", state))
+                    return
+                sql = guarded
+                yield ("sql", sql)
+
+        if spec is not None:
+            spec.cancel()
+            trace.attrs["speculative"] = spec.summary()
+        if model is not None:
+            self.router.record_outcome(model, df is not None, "execute")
         if df is None:
-            return (f"I couldn't run the query due to an error: {last_err}", state)
+            yield ("answer", (f"I couldn't run the query due to an error: {last_err}", state))
+            return
+
+        if not no_llm and intent is None:
+            self.question_cache.store(
+                user_question,
+                state.last_filters,
+                state.last_question,
+                {
+                    "analysis_plan": plan,
+                    "sql": sql,
+                    "result_interpretation": interpretation,
+                    "assumptions": assumptions,
+                    "followups": followups,
+                },
+                llm_ms,
+            )
 
         # 4) Update conversational state (simple heuristic: store likely filters mentioned)
         # new_state = ChatState(
@@ -178,33 +663,49 @@ class AnalyticsAgent:
         # )
         new_state = ChatState(
             last_question=user_question,
-            last_sql=sql,
+            last_sql=base_sql or sql,
             last_filters=state.last_filters.copy(),
-            top_city=state.top_city)
+            top_city=state.top_city,
+            session_id=state.session_id)
         
         # If result contains exactly one city, remember it
         if df is not None and not df.empty and "city" in df.columns and len(df) == 1:
-            new_state.top_city = str(df.iloc[0]["city"])
+            new_state.top_city = str(df.first("city"))
 
 
 
-        # crude filter extraction from question for follow-ups
-        # (you can improve later with a dedicated LLM extraction step)
-        qlow = user_question.lower()
-        for city in ["mumbai", "delhi", "bangalore", "bengaluru", "pune", "hyderabad", "chennai", "kolkata", "ahmedabad"]:
-            if city in qlow:
-                new_state.last_filters["city"] = city.title().replace("Bengaluru", "Bangalore")
-        for plat in ["web", "app"]:
-            if f" {plat}" in qlow or qlow.endswith(plat):
-                new_state.last_filters["platform"] = plat
+        # Filter values named in the question carry over to follow-ups.
+        for col, value in self.values.filters(user_question).items():
+            if not isinstance(value, list):
+                new_state.last_filters[col] = value
+
+        # Fast-path answers know their filters exactly.
+        if intent is not None and no_llm:
+            new_state.last_intent = intent.to_dict()
+            new_state.last_filters = {c: v for c, v in intent.filters.items() if not isinstance(v, list)}
 
         # 5) Format answer
-        answer_text = format_answer(
-            question=user_question,
-            plan=plan,
-            df=df,
-            interpretation=interpretation,
-            assumptions=assumptions,
-            followups=followups
-        )
-        return answer_text, new_state
+        with trace.span("format"):
+            answer_text = format_answer(
+                question=user_question,
+                plan=plan,
+                df=df,
+                interpretation=interpretation,
+                assumptions=assumptions,
+                followups=followups
+            )
+        trace.attrs.update(sql=sql, rows=len(df), attempts=tries)
+        yield ("result", {
+            "sql": sql,
+            "plan": plan,
+            "result": df,
+            "interpretation": interpretation,
+            "assumptions": assumptions,
+            "followups": followups,
+        })
+        if intent is not None and entry is None and self.session_cache.enabled:
+            # Materialize off the answer path; the user's next follow-up is the payoff.
+            self.session_cache.track(
+                state.session_id, lambda: self._sql_pool.submit(self._build_intermediate, state.session_id, intent)
+            )
+        yield ("answer", (answer_text, new_state))
@@ -0,0 +1,91 @@
+from __future__ import annotations
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+
+BATCH_ROWS = 65536
+EXPORT_FORMATS = {"csv": "(FORMAT CSV, HEADER)", "parquet": "(FORMAT PARQUET)"}
+
+
+@dataclass(frozen=True)
+class QueryResult:
+    """
+    Bounded view of a query result: the first rows as an Arrow table plus
+    the exact total row count. `sql` is the query as executed, so the full
+    result can be re-streamed on demand (see export_query).
+    """
+
+    head: pa.Table
+    total_rows: int
+    sql: str = ""
+
+    @property
+    def columns(self) -> List[str]:
+        return self.head.column_names
+
+    @property
+    def empty(self) -> bool:
+        return self.total_rows == 0
+
+    @property
+    def truncated(self) -> bool:
+        return self.total_rows > self.head.num_rows
+
+    @property
+    def nbytes(self) -> int:
+        return self.head.nbytes
+
+    def __len__(self) -> int:
+        return self.total_rows
+
+    def first(self, column: str) -> Any:
+        return self.head.column(column)[0].as_py()
+
+    def to_pandas(self) -> pd.DataFrame:
+        return self.head.to_pandas()
+
+    def to_rows(self) -> List[List[Any]]:
+        """The preview rows as lists of Python values, in column order."""
+        return [list(r.values()) for r in self.head.to_pylist()]
+
+    def rename(self, mapping: Dict[str, str]) -> "QueryResult":
+        if not mapping:
+            return self
+        head = self.head.rename_columns([mapping.get(c, c) for c in self.head.column_names])
+        return QueryResult(head, self.total_rows, self.sql)
+
+
+def fetch_bounded(cur: duckdb.DuckDBPyConnection, head_rows: int, sql: str = "", batch_rows: int = BATCH_ROWS) -> QueryResult:
+    """
+    Drain the pending result on `cur` as Arrow record batches, keeping only
+    the first `head_rows` rows and counting the rest, so memory stays at
+    one batch regardless of result size.
+    """
+    reader = cur.fetch_record_batch(batch_rows)
+    kept: List[pa.RecordBatch] = []
+    n_kept = total = 0
+    for batch in reader:
+        total += batch.num_rows
+        if n_kept < head_rows:
+            part = batch.slice(0, head_rows - n_kept)
+            kept.append(part)
+            n_kept += part.num_rows
+    head = pa.Table.from_batches(kept, schema=reader.schema)
+    if n_kept and head.num_rows < total:
+        # Slices pin their whole parent batch; copy so only the head stays alive.
+        head = head.take(pa.array(range(head.num_rows)))
+    return QueryResult(head, total, sql)
+
+
+def export_query(cur: duckdb.DuckDBPyConnection, sql: str, path: str, fmt: str) -> str:
+    """Stream the full result of `sql` to `path` with DuckDB's COPY; nothing is held in Python."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format {fmt!r}; use one of {sorted(EXPORT_FORMATS)}.")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    target = path.replace("'", "''")
+    cur.execute(f"COPY ({sql}) TO '{target}' {EXPORT_FORMATS[fmt]}")
+    return path
@@ -0,0 +1,248 @@
+from __future__ import annotations
+import json
+import os
+import statistics
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .agent import AnalyticsAgent, ChatState
+from .db_pool import CursorPool
+from .formatting import json_cell
+from .llm_ollama import InFlightLimiter
+from .result_cache import canonicalize_sql
+
+
+@dataclass
+class BatchItem:
+    id: str
+    question: str
+    turn: int = 0
+
+
+@dataclass
+class BatchThread:
+    """One conversation: turns answered in order, each seeing the previous turn's ChatState."""
+    id: str
+    items: List[BatchItem] = field(default_factory=list)
+
+
+def read_questions(path: str) -> List[BatchThread]:
+    """
+    Parse a JSONL batch. Each line is either one question,
+    {"id": ..., "question": ..., "thread": ...}, where lines sharing a
+    "thread" form a conversation in file order, or a whole conversation,
+    {"id": ..., "turns": ["...", "..."]}. A line without "thread" or
+    "turns" is a conversation of its own. Ids default to the line number.
+    """
+    threads: Dict[str, BatchThread] = {}
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path}:{n}: not JSON ({e})")
+            if isinstance(obj, str):
+                obj = {"question": obj}
+            if not isinstance(obj, dict):
+                raise ValueError(f"{path}:{n}: expected an object or a string")
+            qid = str(obj.get("id", n))
+            if "turns" in obj:
+                turns = obj["turns"]
+                if not isinstance(turns, list) or not all(isinstance(t, str) and t.strip() for t in turns):
+                    raise ValueError(f"{path}:{n}: 'turns' must be a list of questions")
+                thread = threads.setdefault(str(obj.get("thread", qid)), BatchThread(str(obj.get("thread", qid))))
+                for i, q in enumerate(turns):
+                    thread.items.append(BatchItem(f"{qid}.{i + 1}", q.strip()))
+                continue
+            question = obj.get("question")
+            if not isinstance(question, str) or not question.strip():
+                raise ValueError(f"{path}:{n}: missing 'question'")
+            tid = str(obj.get("thread", f"_{n}"))
+            threads.setdefault(tid, BatchThread(tid)).items.append(BatchItem(qid, question.strip()))
+    for thread in threads.values():
+        for i, item in enumerate(thread.items):
+            item.turn = i + 1
+    return list(threads.values())
+
+
+def _pct(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))] if values else 0.0
+
+
+class BatchWriter:
+    """Answer records to JSONL (written as they finish) or Parquet (written on close)."""
+
+    def __init__(self, path: str, fmt: str = ""):
+        self.path = path
+        self.fmt = fmt or ("parquet" if path.endswith(".parquet") else "jsonl")
+        if self.fmt not in ("jsonl", "parquet"):
+            raise ValueError(f"Unknown batch output format: {self.fmt}")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._records: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._f = open(path, "w", encoding="utf-8") if self.fmt == "jsonl" else None
+
+    def write(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            if self._f is not None:
+                self._f.write(json.dumps(record, default=str) + "\n")
+                self._f.flush()
+            else:
+                self._records.append(record)
+
+    def close(self) -> None:
+        if self._f is not None:
+            self._f.close()
+            return
+        # Row values differ in type from question to question: kept as JSON text.
+        rows = [{**r, "rows": json.dumps(r["rows"], default=str)} for r in self._records]
+        pq.write_table(pa.Table.from_pylist(rows), self.path)
+
+
+class BatchRunner:
+    """
+    Answers a batch of questions on one agent. Conversations run
+    concurrently on `concurrency` workers while the turns of one
+    conversation run in order, carrying ChatState. LLM calls are bounded by
+    `llm_parallel` and queries by `db_parallel` cursors (0 keeps the agent's
+    own limits); an identical query already running for another question is
+    waited on rather than run again, and a repeat later in the batch comes
+    from the result cache.
+    """
+
+    def __init__(self, agent: AnalyticsAgent, concurrency: int, llm_parallel: int = 0, db_parallel: int = 0):
+        self.agent = agent
+        self.concurrency = max(1, concurrency)
+        if llm_parallel > 0:
+            # A batch waits for a slot however long it takes instead of failing with OllamaBusy.
+            agent.llm.limiter = InFlightLimiter(llm_parallel, None)
+        if db_parallel > 0:
+            agent.cursors = CursorPool(agent.con, db_parallel)
+        # Nobody watches a batch answer arrive: skip the sample-based preview.
+        agent.approx.enabled = False
+
+    def answer(self, thread: BatchThread, item: BatchItem, state: ChatState) -> Tuple[Dict[str, Any], ChatState]:
+        """One turn: (output record, state for the next turn)."""
+        record: Dict[str, Any] = {"id": item.id, "thread": thread.id, "turn": item.turn, "question": item.question}
+        result, text = None, None
+        t0 = time.perf_counter()
+        try:
+            for kind, data in self.agent.answer_stream(item.question, state):
+                if kind == "result":
+                    result = data
+                elif kind == "answer":
+                    text, state = data
+            record.update(ok=True, error=None, answer=text, sql=state.last_sql)
+        except Exception as e:
+            record.update(ok=False, error=f"{type(e).__name__}: {e}"[:500], answer=None, sql=None)
+        trace = (state.last_trace or {}) if record["ok"] else {}
+        qr = result["result"] if result else None
+        spans = trace.get("spans", [])
+        execute = [s for s in spans if s["name"] == "execute"]
+        record.update(
+            columns=qr.columns if qr is not None else [],
+            rows=[[json_cell(v) for v in row] for row in qr.to_rows()] if qr is not None else [],
+            total_rows=qr.total_rows if qr is not None else None,
+            source=trace.get("source"),
+            model=trace.get("model"),
+            total_ms=round((time.perf_counter() - t0) * 1000, 2),
+            llm_ms=round(sum(s["ms"] for s in spans if s["name"] == "llm"), 2),
+            execute_ms=round(sum(s["ms"] for s in execute), 2),
+            executions=sum(1 for s in execute if not s.get("cached") and not s.get("shared")),
+            cached=any(s.get("cached") for s in execute),
+            shared=any(s.get("shared") for s in execute),
+            trace_id=trace.get("trace_id"),
+        )
+        return record, state
+
+    def _run_thread(self, thread: BatchThread, emit: Callable[[Dict[str, Any]], None]) -> None:
+        state = ChatState()
+        try:
+            for item in thread.items:
+                record, state = self.answer(thread, item, state)
+                emit(record)
+        finally:
+            self.agent.end_session(state.session_id)
+
+    def run(self, threads: List[BatchThread], writer: BatchWriter,
+            progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Answer every thread, writing records as they finish; returns the summary."""
+        records: List[Dict[str, Any]] = []
+        lock = threading.Lock()
+
+        def emit(record: Dict[str, Any]) -> None:
+            writer.write(record)
+            with lock:
+                records.append(record)
+            if progress:
+                progress(record)
+
+        cache_before = self.agent.result_cache.snapshot()
+        t0 = time.perf_counter()
+        # Longest conversations first, so one doesn't start last and trail the rest.
+        ordered = sorted(threads, key=lambda t: -len(t.items))
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix="batch") as pool:
+            for fut in as_completed([pool.submit(self._run_thread, t, emit) for t in ordered]):
+                fut.result()
+        wall = time.perf_counter() - t0
+        writer.close()
+        return summarize(records, wall, self.agent, cache_before, len(threads))
+
+
+def summarize(records: List[Dict[str, Any]], wall_s: float, agent: AnalyticsAgent,
+              cache_before: Dict[str, int], threads: int) -> Dict[str, Any]:
+    ok = [r for r in records if r["ok"]]
+    ms = [r["total_ms"] for r in records]
+    reserved = agent.result_cache.reserved
+    canonical = Counter(canonicalize_sql(r["sql"], reserved)[0] for r in ok if r["sql"])
+    cache = agent.result_cache.snapshot()
+    return {
+        "questions": len(records),
+        "threads": threads,
+        "ok": len(ok),
+        "errors": len(records) - len(ok),
+        "wall_s": round(wall_s, 2),
+        "questions_per_s": round(len(records) / wall_s, 2) if wall_s else None,
+        "latency_ms": {
+            "mean": round(statistics.mean(ms), 1) if ms else 0.0,
+            "p50": round(_pct(ms, 0.5), 1),
+            "p95": round(_pct(ms, 0.95), 1),
+            "p99": round(_pct(ms, 0.99), 1),
+            "max": round(max(ms), 1) if ms else 0.0,
+        },
+        "llm_ms_total": round(sum(r["llm_ms"] for r in records), 1),
+        "execute_ms_total": round(sum(r["execute_ms"] for r in records), 1),
+        "sql": {
+            "answers_with_sql": sum(canonical.values()),
+            "distinct": len(canonical),
+            "duplicates": sum(canonical.values()) - len(canonical),
+            "executed": sum(r["executions"] for r in records),
+            "shared_in_flight": cache["joined"] - cache_before.get("joined", 0),
+            "result_cache_hits": cache["hits"] - cache_before.get("hits", 0),
+        },
+        "by_source": dict(Counter(r["source"] or "error" for r in records)),
+    }
+
+
+def format_summary(s: Dict[str, Any]) -> Iterator[str]:
+    lat, sql = s["latency_ms"], s["sql"]
+    yield (f"{s['questions']} questions in {s['threads']} conversations: {s['ok']} answered, "
+           f"{s['errors']} errors in {s['wall_s']:.1f} s ({s['questions_per_s']} questions/s)")
+    yield (f"latency ms: mean {lat['mean']:.0f}, p50 {lat['p50']:.0f}, p95 {lat['p95']:.0f}, "
+           f"p99 {lat['p99']:.0f}, max {lat['max']:.0f}")
+    yield f"time in LLM {s['llm_ms_total'] / 1000:.1f} s, in DuckDB {s['execute_ms_total'] / 1000:.1f} s (summed over questions)"
+    yield (f"SQL: {sql['answers_with_sql']} answers, {sql['distinct']} distinct ({sql['duplicates']} duplicates); "
+           f"executed {sql['executed']}, shared while running {sql['shared_in_flight']}, "
+           f"result cache hits {sql['result_cache_hits']}")
+    yield "by source: " + ", ".join(f"{k} {v}" for k, v in sorted(s["by_source"].items()))
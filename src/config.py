@@ -4,14 +4,110 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Read first: other on-disk stores default to paths under it.
+_CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+
 @dataclass(frozen=True)
 class Settings:
     ollama_base_url: str = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
     ollama_model: str = os.getenv("OLLAMA_MODEL", "llama3.1:8b")
+    # Optional comma-separated list of Ollama servers, used round-robin (defaults to ollama_base_url).
+    ollama_base_urls: str = os.getenv("OLLAMA_BASE_URLS", "")
+    # Model cascade: questions scoring below CASCADE_THRESHOLD (model_router.py) try this
+    # smaller model first and escalate to OLLAMA_MODEL when its answer fails. Empty disables.
+    ollama_small_model: str = os.getenv("OLLAMA_SMALL_MODEL", "")
+    cascade_threshold: float = float(os.getenv("CASCADE_THRESHOLD", "3"))
+    ollama_keep_alive: str = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+    ollama_max_in_flight: int = int(os.getenv("OLLAMA_MAX_IN_FLIGHT", "4"))
+    ollama_queue_timeout: float = float(os.getenv("OLLAMA_QUEUE_TIMEOUT", "60"))
+    ollama_retries: int = int(os.getenv("OLLAMA_RETRIES", "3"))
+    ollama_timeout: float = float(os.getenv("OLLAMA_TIMEOUT", "120"))
     duckdb_path: str = os.getenv("DUCKDB_PATH", ":memory:")
     data_path: str = os.getenv("DATA_PATH", "data/d0_dplus_daily_summary/d0_dplus_daily_summary.json")
+    # Directory of per-day files (JSON/NDJSON/Parquet); enables partitioned ingest.
+    data_dir: str = os.getenv("DATA_DIR", "")
     schema_path: str = os.getenv("SCHEMA_PATH", "schemas/d0_dplus_daily_summary.schema")
     table_name: str = os.getenv("TABLE_NAME", "d0_dplus_daily_summary")
+    # DuckDB engine settings (0 / "" keep DuckDB's defaults) and cursors for concurrent sessions.
+    duckdb_threads: int = int(os.getenv("DUCKDB_THREADS", "0"))
+    duckdb_memory_limit: str = os.getenv("DUCKDB_MEMORY_LIMIT", "")
+    db_cursor_pool_size: int = int(os.getenv("DB_CURSOR_POOL_SIZE", "8"))
+    # Per-query wall-clock budget (seconds) and EXPLAIN-estimated row cap; 0 disables either.
+    query_timeout_s: float = float(os.getenv("QUERY_TIMEOUT_S", "20"))
+    max_estimated_rows: int = int(os.getenv("MAX_ESTIMATED_ROWS", "500000000"))
     max_rows_returned: int = int(os.getenv("MAX_ROWS_RETURNED", "200"))
+    # Rows kept in memory per result (the rest is only counted); full results
+    # are exported on demand.
+    result_preview_rows: int = int(os.getenv("RESULT_PREVIEW_ROWS", "30"))
+    # "duckdb" (in-database table) or "parquet" (hive-partitioned files under parquet_dir)
+    storage_backend: str = os.getenv("STORAGE_BACKEND", "duckdb")
+    parquet_dir: str = os.getenv("PARQUET_DIR", os.path.join(_CACHE_DIR, "parquet"))
+    # Daily rollups: ';'-separated dimension groups, ',' within a group.
+    enable_rollups: bool = os.getenv("ENABLE_ROLLUPS", "1") == "1"
+    rollup_dimensions: str = os.getenv(
+        "ROLLUP_DIMENSIONS",
+        "city;platform;gender;stage;age_bucket;"
+        "first_form_utm_source;first_form_utm_medium;first_form_utm_campaign;"
+        "order_utm_source;order_utm_medium;order_utm_campaign;"
+        "city,platform;city,gender;city,stage;city,age_bucket;platform,gender;platform,stage;"
+        "platform,first_form_utm_source;platform,order_utm_source",
+    )
+    result_cache_entries: int = int(os.getenv("RESULT_CACHE_ENTRIES", "256"))
+    result_cache_mb: int = int(os.getenv("RESULT_CACHE_MB", "64"))
+    # Rule-based parser that answers templated metric questions without the LLM.
+    enable_intent_engine: bool = os.getenv("ENABLE_INTENT_ENGINE", "1") == "1"
+    enable_question_cache: bool = os.getenv("ENABLE_QUESTION_CACHE", "1") == "1"
+    # Per-session intermediates for follow-ups (see session_cache.py).
+    enable_session_cache: bool = os.getenv("ENABLE_SESSION_CACHE", "1") == "1"
+    session_cache_dims: str = os.getenv("SESSION_CACHE_DIMS", "platform,gender,age_bucket,stage,city")
+    session_cache_entries: int = int(os.getenv("SESSION_CACHE_ENTRIES", "4"))
+    session_cache_max_rows: int = int(os.getenv("SESSION_CACHE_MAX_ROWS", "200000"))
+    session_cache_total_rows: int = int(os.getenv("SESSION_CACHE_TOTAL_ROWS", "2000000"))
+    # Entity matching: "alias=Value" pairs and one-edit typo tolerance (see value_index.py).
+    value_aliases: str = os.getenv(
+        "VALUE_ALIASES", "bengaluru=Bangalore,bombay=Mumbai,new delhi=Delhi,calcutta=Kolkata,madras=Chennai,cochin=Kochi"
+    )
+    value_typo_tolerance: bool = os.getenv("VALUE_TYPO_TOLERANCE", "1") == "1"
+    # Estimated tokens for the per-question part of the prompt (the static prefix is KV-cached).
+    prompt_token_budget: int = int(os.getenv("PROMPT_TOKEN_BUDGET", "160"))
+    # Speculative SQL: K candidates generated concurrently (temperatures cycled),
+    # validated with EXPLAIN; the first valid one runs and the rest are cancelled.
+    enable_speculative_sql: bool = os.getenv("ENABLE_SPECULATIVE_SQL", "0") == "1"
+    speculative_candidates: int = int(os.getenv("SPECULATIVE_CANDIDATES", "3"))
+    speculative_concurrency: int = int(os.getenv("SPECULATIVE_CONCURRENCY", "3"))
+    speculative_temperatures: str = os.getenv("SPECULATIVE_TEMPERATURES", "0.1,0.5,0.9")
+    # HTTP API (server.py): answers run on API_MAX_CONCURRENT worker threads; up to
+    # API_MAX_QUEUE more requests wait (at most API_QUEUE_TIMEOUT s), the rest get 503.
+    api_host: str = os.getenv("API_HOST", "127.0.0.1")
+    api_port: int = int(os.getenv("API_PORT", "8080"))
+    api_max_concurrent: int = int(os.getenv("API_MAX_CONCURRENT", "4"))
+    api_max_queue: int = int(os.getenv("API_MAX_QUEUE", "32"))
+    api_queue_timeout: float = float(os.getenv("API_QUEUE_TIMEOUT", "30"))
+    api_session_ttl_s: float = float(os.getenv("API_SESSION_TTL_S", "1800"))
+    api_max_sessions: int = int(os.getenv("API_MAX_SESSIONS", "1000"))
+    # Batch mode (batch_run.py): conversations answered at once, LLM calls and
+    # DuckDB cursors in use (0 keeps OLLAMA_MAX_IN_FLIGHT / DB_CURSOR_POOL_SIZE).
+    batch_concurrency: int = int(os.getenv("BATCH_CONCURRENCY", "4"))
+    batch_llm_parallel: int = int(os.getenv("BATCH_LLM_PARALLEL", "2"))
+    batch_db_parallel: int = int(os.getenv("BATCH_DB_PARALLEL", "0"))
+    # Progressive answers: a query still running after APPROX_AFTER_MS is first
+    # answered from a stratified (date, city) sample with confidence intervals,
+    # then replaced by the exact result. No sample below APPROX_MIN_ROWS rows.
+    enable_approx_answers: bool = os.getenv("ENABLE_APPROX_ANSWERS", "1") == "1"
+    approx_min_rows: int = int(os.getenv("APPROX_MIN_ROWS", "5000000"))
+    approx_sample_rate: float = float(os.getenv("APPROX_SAMPLE_RATE", "0.02"))
+    approx_min_per_stratum: int = int(os.getenv("APPROX_MIN_PER_STRATUM", "4"))
+    approx_replicates: int = int(os.getenv("APPROX_REPLICATES", "10"))
+    approx_confidence: float = float(os.getenv("APPROX_CONFIDENCE", "0.95"))
+    approx_after_ms: float = float(os.getenv("APPROX_AFTER_MS", "250"))
+    # Full re-draw once the sample is this old (0: only strata of re-ingested dates are re-drawn).
+    approx_sample_refresh_s: float = float(os.getenv("APPROX_SAMPLE_REFRESH_S", "0"))
+    question_cache_path: str = os.getenv("QUESTION_CACHE_PATH", os.path.join(_CACHE_DIR, "question_cache.sqlite"))
+    # Per-answer stage timings go to this JSONL file (empty disables); executed
+    # queries are profiled with DuckDB's JSON profiler.
+    trace_log_path: str = os.getenv("TRACE_LOG_PATH", ".cache/traces.jsonl")
+    enable_query_profiling: bool = os.getenv("ENABLE_QUERY_PROFILING", "1") == "1"
+    cache_dir: str = _CACHE_DIR
+    use_ingest_cache: bool = os.getenv("USE_INGEST_CACHE", "1") == "1"
 
 SETTINGS = Settings()
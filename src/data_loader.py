@@ -1,8 +1,46 @@
 from __future__ import annotations
+import glob
+import hashlib
+import os
+import shutil
+import warnings
 import duckdb
 import pandas as pd
-from typing import Tuple
+from typing import Any, Dict, List, Optional, Tuple
 from .config import SETTINGS
+from .schema_reader import TableSchema, read_schema
+from .rollups import build_rollups, refresh_rollups, load_registry
+from .sampling import build_sample, refresh_sample
+
+# Bump whenever the ingested table layout changes so stale caches get rebuilt.
+LOADER_VERSION = 2
+META_TABLE = "_ingest_meta"
+
+# Schema (BigQuery-style) type -> DuckDB type used for typed ingest.
+DUCKDB_TYPES = {
+    "STRING": "VARCHAR", "VARCHAR": "VARCHAR", "TEXT": "VARCHAR",
+    "FLOAT": "DOUBLE", "FLOAT64": "DOUBLE", "DOUBLE": "DOUBLE", "NUMERIC": "DOUBLE",
+    "INTEGER": "BIGINT", "INT64": "BIGINT", "BIGINT": "BIGINT",
+    "BOOLEAN": "BOOLEAN", "BOOL": "BOOLEAN",
+    "DATE": "DATE", "TIMESTAMP": "TIMESTAMP", "DATETIME": "TIMESTAMP",
+}
+
+# Dimensions stored as ENUMs (dictionary encoded) when their cardinality allows.
+LOW_CARDINALITY_COLUMNS = (
+    "gender", "platform", "city", "stage", "age_bucket",
+    "first_form_utm_medium", "first_form_utm_campaign", "first_form_utm_source",
+    "order_utm_medium", "order_utm_campaign", "order_utm_source",
+)
+MAX_ENUM_VALUES = 4096
+
+# Robust date parsing: handles 'YYYY-MM-DD', 'YYYY/MM/DD', timestamps, etc.
+DATE_PARSE_EXPR = """COALESCE(
+                TRY_CAST(date AS DATE),
+                TRY_STRPTIME(CAST(date AS VARCHAR), '%Y-%m-%d')::DATE,
+                TRY_STRPTIME(CAST(date AS VARCHAR), '%Y/%m/%d')::DATE,
+                TRY_STRPTIME(SUBSTR(CAST(date AS VARCHAR), 1, 10), '%Y-%m-%d')::DATE,
+                TRY_STRPTIME(SUBSTR(CAST(date AS VARCHAR), 1, 10), '%Y/%m/%d')::DATE
+            )"""
 
 
 def debug_date_parse(con: duckdb.DuckDBPyConnection, table_view: str):
@@ -18,38 +56,600 @@ def debug_date_parse(con: duckdb.DuckDBPyConnection, table_view: str):
 
 
 def get_connection() -> duckdb.DuckDBPyConnection:
-    return duckdb.connect(database=SETTINGS.duckdb_path)
+    con = duckdb.connect(database=SETTINGS.duckdb_path)
+    # Database-wide settings; cursors created from this connection share them.
+    if SETTINGS.duckdb_threads > 0:
+        con.execute(f"SET threads = {SETTINGS.duckdb_threads}")
+    if SETTINGS.duckdb_memory_limit:
+        con.execute(f"SET memory_limit = {_sql_str(SETTINGS.duckdb_memory_limit)}")
+    return con
+
+def create_date_view(con: duckdb.DuckDBPyConnection, table_name: str) -> None:
+    # Tables from typed ingest already carry a physical date_parsed column.
+    if "date_parsed" in get_table_columns(con, table_name):
+        con.execute(f"CREATE OR REPLACE VIEW {table_name}_v AS SELECT * FROM {table_name};")
+        return
+    con.execute(f"""
+        CREATE OR REPLACE VIEW {table_name}_v AS
+        SELECT
+            *,
+            {DATE_PARSE_EXPR} AS date_parsed
+        FROM {table_name};
+    """)
 
 def load_json_to_duckdb(con: duckdb.DuckDBPyConnection, table_name: str, json_path: str) -> None:
     con.execute(f"""
         CREATE OR REPLACE TABLE {table_name} AS
         SELECT * FROM read_json_auto('{json_path}', sample_size=-1);
     """)
+    create_date_view(con, table_name)
+
+
+# ---------------------------------------------------------------------------
+# Typed ingest: column names/types come from the schema file instead of a
+# full-scan JSON inference; dimensions become ENUMs, date_parsed is
+# materialized once and rows are sorted by date so zone maps prune scans.
+# ---------------------------------------------------------------------------
+
+def schema_is_usable(schema: Optional[TableSchema]) -> bool:
+    return bool(schema and schema.columns and schema.columns[0].name != "(schema_unavailable)")
+
+def _duckdb_type(dtype: str) -> str:
+    return DUCKDB_TYPES.get(dtype.strip().upper(), "VARCHAR")
+
+def _sql_str(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+def json_columns_spec(schema: TableSchema) -> str:
+    # `date` is read as text and parsed below, so odd formats don't fail the read.
+    cols = []
+    for c in schema.columns:
+        dtype = "VARCHAR" if c.name == "date" else _duckdb_type(c.dtype)
+        cols.append(f"{_sql_str(c.name)}: {_sql_str(dtype)}")
+    return "{" + ", ".join(cols) + "}"
+
+def _enum_type(con: duckdb.DuckDBPyConnection, source: str, column: str) -> Optional[str]:
+    values = [r[0] for r in con.execute(
+        f'SELECT DISTINCT "{column}" FROM {source} WHERE "{column}" IS NOT NULL ORDER BY 1'
+    ).fetchall()]
+    if not values or len(values) > MAX_ENUM_VALUES:
+        return None
+    return "ENUM(" + ", ".join(_sql_str(str(v)) for v in values) + ")"
 
-    # Robust date parsing: handles 'YYYY-MM-DD', 'YYYY/MM/DD', timestamps, etc.
+def typed_select_list(
+    con: duckdb.DuckDBPyConnection, schema: TableSchema, source: str, parse_dates: bool = True
+) -> List[str]:
+    # parse_dates=False when `source` already carries parsed date/date_parsed.
+    exprs: List[str] = []
+    for c in schema.columns:
+        if c.name == "date":
+            exprs.append(f"{DATE_PARSE_EXPR} AS date" if parse_dates else "date")
+            continue
+        enum = _enum_type(con, source, c.name) if c.name in LOW_CARDINALITY_COLUMNS else None
+        exprs.append(f'CAST("{c.name}" AS {enum}) AS "{c.name}"' if enum else f'"{c.name}"')
+    if any(c.name == "date" for c in schema.columns):
+        exprs.append(f"{DATE_PARSE_EXPR} AS date_parsed" if parse_dates else "date_parsed")
+    return exprs
+
+def load_typed_json(con: duckdb.DuckDBPyConnection, table_name: str, json_path: str, schema: TableSchema) -> None:
     con.execute(f"""
-        CREATE OR REPLACE VIEW {table_name}_v AS
+        CREATE OR REPLACE TEMP TABLE _ingest_stage AS
+        SELECT * FROM read_json('{json_path}', columns={json_columns_spec(schema)}, format='auto');
+    """)
+    select_list = ",\n            ".join(typed_select_list(con, schema, "_ingest_stage"))
+    order_by = "ORDER BY date_parsed" if any(c.name == "date" for c in schema.columns) else ""
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {table_name} AS
         SELECT
-            *,
-            COALESCE(
-                TRY_CAST(date AS DATE),
-                TRY_STRPTIME(CAST(date AS VARCHAR), '%Y-%m-%d')::DATE,
-                TRY_STRPTIME(CAST(date AS VARCHAR), '%Y/%m/%d')::DATE,
-                TRY_STRPTIME(SUBSTR(CAST(date AS VARCHAR), 1, 10), '%Y-%m-%d')::DATE,
-                TRY_STRPTIME(SUBSTR(CAST(date AS VARCHAR), 1, 10), '%Y/%m/%d')::DATE
-            ) AS date_parsed
-        FROM {table_name};
+            {select_list}
+        FROM _ingest_stage
+        {order_by};
+    """)
+    con.execute("DROP TABLE _ingest_stage")
+    create_date_view(con, table_name)
+
+def load_source(con: duckdb.DuckDBPyConnection, table_name: str, json_path: str, schema: Optional[TableSchema] = None) -> None:
+    if schema_is_usable(schema):
+        load_typed_json(con, table_name, json_path, schema)
+    else:
+        load_json_to_duckdb(con, table_name, json_path)
+
+
+# ---------------------------------------------------------------------------
+# Ingest cache: the parsed table is snapshotted into a DuckDB file keyed by a
+# fingerprint of the source, so later boots skip JSON parsing/type inference.
+# ---------------------------------------------------------------------------
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _layout_key(schema: Optional[TableSchema]) -> str:
+    # Loader version plus the declared column types: either changing means the
+    # cached table no longer has the layout this loader would produce.
+    spec = json_columns_spec(schema) if schema_is_usable(schema) else "inferred"
+    return f"{LOADER_VERSION}:{hashlib.sha256(spec.encode()).hexdigest()[:16]}"
+
+def source_fingerprint(path: str, with_hash: bool = True, schema: Optional[TableSchema] = None) -> Dict[str, Any]:
+    st = os.stat(path)
+    return {
+        "layout": _layout_key(schema),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha256": _file_sha256(path) if with_hash else None,
+    }
+
+def cache_path_for(table_name: str, cache_dir: str = SETTINGS.cache_dir) -> str:
+    return os.path.join(cache_dir, f"{table_name}.duckdb")
+
+def _read_meta(con: duckdb.DuckDBPyConnection, catalog: str, table_name: str) -> Optional[Dict[str, Any]]:
+    exists = con.execute(
+        "SELECT COUNT(*) FROM duckdb_tables() WHERE database_name = ? AND table_name = ?",
+        [catalog, META_TABLE],
+    ).fetchone()[0]
+    if not exists:
+        return None
+    try:
+        row = con.execute(
+            f"SELECT layout, size, mtime_ns, sha256 FROM {catalog}.{META_TABLE} WHERE table_name = ?",
+            [table_name],
+        ).fetchone()
+    except duckdb.Error:
+        # Written by an older loader with a different meta layout.
+        return None
+    if row is None:
+        return None
+    return {"layout": row[0], "size": row[1], "mtime_ns": row[2], "sha256": row[3]}
+
+def _write_meta(con: duckdb.DuckDBPyConnection, catalog: str, table_name: str, fp: Dict[str, Any]) -> None:
+    cols = {r[0] for r in con.execute(
+        "SELECT column_name FROM duckdb_columns() WHERE database_name = ? AND table_name = ?",
+        [catalog, META_TABLE],
+    ).fetchall()}
+    if cols and "layout" not in cols:
+        con.execute(f"DROP TABLE {catalog}.{META_TABLE}")
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {catalog}.{META_TABLE} (
+            table_name VARCHAR PRIMARY KEY,
+            layout VARCHAR,
+            size BIGINT,
+            mtime_ns BIGINT,
+            sha256 VARCHAR,
+            built_at TIMESTAMP
+        )
     """)
+    con.execute(f"DELETE FROM {catalog}.{META_TABLE} WHERE table_name = ?", [table_name])
+    con.execute(
+        f"INSERT INTO {catalog}.{META_TABLE} VALUES (?, ?, ?, ?, ?, current_timestamp)",
+        [table_name, fp["layout"], fp["size"], fp["mtime_ns"], fp["sha256"]],
+    )
 
+def _meta_matches(meta: Optional[Dict[str, Any]], path: str, fp: Dict[str, Any]) -> bool:
+    # Cheap checks first; only hash the file when size matches but mtime moved
+    # (e.g. the file was touched or re-copied without changing content).
+    if meta is None:
+        return False
+    if meta["layout"] != fp["layout"] or meta["size"] != fp["size"]:
+        return False
+    if meta["mtime_ns"] == fp["mtime_ns"]:
+        return True
+    if fp["sha256"] is None:
+        fp["sha256"] = _file_sha256(path)
+    return meta["sha256"] == fp["sha256"]
+
+def _restore_from_cache(
+    con: duckdb.DuckDBPyConnection, meta_key: str, tables: List[str], cache_file: str, path: str, fp: Dict[str, Any]
+) -> bool:
+    if not os.path.exists(cache_file):
+        return False
+    try:
+        con.execute(f"ATTACH '{cache_file}' AS ingest_cache (READ_ONLY)")
+    except duckdb.Error:
+        return False
+    try:
+        if not _meta_matches(_read_meta(con, "ingest_cache", meta_key), path, fp):
+            return False
+        for t in tables:
+            con.execute(f"CREATE OR REPLACE TABLE {t} AS SELECT * FROM ingest_cache.{t}")
+        return True
+    finally:
+        con.execute("DETACH ingest_cache")
+
+def _write_cache(
+    con: duckdb.DuckDBPyConnection, meta_key: str, tables: List[str], cache_file: str, fp: Dict[str, Any]
+) -> None:
+    # Build into a temp file and rename, so a crashed build never leaves a
+    # half-written cache that a later boot would trust.
+    os.makedirs(os.path.dirname(cache_file) or ".", exist_ok=True)
+    tmp = f"{cache_file}.tmp"
+    for p in (tmp, f"{tmp}.wal"):
+        if os.path.exists(p):
+            os.remove(p)
+    con.execute(f"ATTACH '{tmp}' AS ingest_cache_tmp")
+    try:
+        for t in tables:
+            con.execute(f"CREATE TABLE ingest_cache_tmp.{t} AS SELECT * FROM {t}")
+        _write_meta(con, "ingest_cache_tmp", meta_key, fp)
+    finally:
+        con.execute("DETACH ingest_cache_tmp")
+    os.replace(tmp, cache_file)
+
+def load_with_cache(
+    con: duckdb.DuckDBPyConnection,
+    table_name: str,
+    json_path: str,
+    schema: Optional[TableSchema] = None,
+    cache_dir: str = SETTINGS.cache_dir,
+) -> str:
+    """
+    Load json_path into table_name, reusing a previously built snapshot when
+    the source fingerprint still matches. Returns "hit", "miss" or "disabled".
+    """
+    if not SETTINGS.use_ingest_cache:
+        load_source(con, table_name, json_path, schema)
+        return "disabled"
+
+    fp = source_fingerprint(json_path, with_hash=False, schema=schema)
+
+    # A file-backed database is its own cache: keep the table and its meta row.
+    if SETTINGS.duckdb_path != ":memory:":
+        catalog = con.execute("SELECT current_database()").fetchone()[0]
+        if _meta_matches(_read_meta(con, catalog, table_name), json_path, fp):
+            create_date_view(con, table_name)
+            return "hit"
+        load_source(con, table_name, json_path, schema)
+        if fp["sha256"] is None:
+            fp["sha256"] = _file_sha256(json_path)
+        _write_meta(con, catalog, table_name, fp)
+        return "miss"
+
+    cache_file = cache_path_for(table_name, cache_dir)
+    if _restore_from_cache(con, table_name, [table_name], cache_file, json_path, fp):
+        create_date_view(con, table_name)
+        return "hit"
+
+    load_source(con, table_name, json_path, schema)
+    if fp["sha256"] is None:
+        fp["sha256"] = _file_sha256(json_path)
+    try:
+        _write_cache(con, table_name, [table_name], cache_file, fp)
+    except (OSError, duckdb.Error) as e:
+        warnings.warn(f"Could not write ingest cache {cache_file}: {e}")
+    return "miss"
+
+
+# ---------------------------------------------------------------------------
+# Partitioned ingest: a directory of per-day files, tracked in a manifest so
+# only new or changed files are read and only their dates are replaced.
+# ---------------------------------------------------------------------------
+
+MANIFEST_TABLE = "_ingest_manifest"
+PARTITION_EXTENSIONS = (".json", ".ndjson", ".jsonl", ".parquet")
+
+def list_partition_files(data_dir: str) -> List[str]:
+    return sorted(
+        os.path.join(data_dir, f) for f in os.listdir(data_dir)
+        if f.lower().endswith(PARTITION_EXTENSIONS)
+    )
+
+def _ensure_manifest(con: duckdb.DuckDBPyConnection) -> None:
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (
+            table_name VARCHAR,
+            file_path VARCHAR,
+            size BIGINT,
+            mtime_ns BIGINT,
+            sha256 VARCHAR,
+            dates DATE[],
+            row_count BIGINT,
+            loaded_at TIMESTAMP
+        )
+    """)
+
+def _manifest_entries(con: duckdb.DuckDBPyConnection, table_name: str) -> Dict[str, Dict[str, Any]]:
+    rows = con.execute(
+        f"SELECT file_path, size, mtime_ns, sha256, dates FROM {MANIFEST_TABLE} WHERE table_name = ?",
+        [table_name],
+    ).fetchall()
+    return {r[0]: {"size": r[1], "mtime_ns": r[2], "sha256": r[3], "dates": r[4] or []} for r in rows}
+
+def _partition_changed(entry: Optional[Dict[str, Any]], path: str, fp: Dict[str, Any]) -> bool:
+    if entry is None:
+        return True
+    if entry["size"] != fp["size"]:
+        return True
+    if entry["mtime_ns"] == fp["mtime_ns"]:
+        return False
+    fp["sha256"] = _file_sha256(path)
+    return entry["sha256"] != fp["sha256"]
+
+def _stage_partition(con: duckdb.DuckDBPyConnection, path: str, schema: TableSchema) -> None:
+    if path.lower().endswith(".parquet"):
+        cols = ", ".join(
+            f'"{c.name}"' if c.name == "date" else f'CAST("{c.name}" AS {_duckdb_type(c.dtype)}) AS "{c.name}"'
+            for c in schema.columns
+        )
+        source = f"SELECT {cols} FROM read_parquet('{path}')"
+    else:
+        source = f"SELECT * FROM read_json('{path}', columns={json_columns_spec(schema)}, format='auto')"
+    con.execute(f"CREATE OR REPLACE TEMP TABLE _partition_raw AS {source}")
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE _partition_stage AS
+        SELECT * REPLACE ({DATE_PARSE_EXPR} AS date), {DATE_PARSE_EXPR} AS date_parsed
+        FROM _partition_raw
+        ORDER BY date_parsed
+    """)
+    con.execute("DROP TABLE _partition_raw")
+
+def _column_types(con: duckdb.DuckDBPyConnection, table_name: str) -> Dict[str, str]:
+    return {r[0]: r[1] for r in con.execute(f"DESCRIBE {table_name}").fetchall()}
+
+def _widen_enums(con: duckdb.DuckDBPyConnection, table_name: str, stage: str) -> bool:
+    # New dimension values (a new city, a new campaign) would fail the ENUM
+    # cast on insert; widen the column type first. Rare, and it only costs a
+    # rewrite of that one column.
+    widened = False
+    for col, ctype in _column_types(con, table_name).items():
+        if not ctype.startswith("ENUM("):
+            continue
+        known = set(con.execute(f"SELECT enum_range(NULL::{ctype})").fetchone()[0])
+        incoming = {r[0] for r in con.execute(
+            f'SELECT DISTINCT CAST("{col}" AS VARCHAR) FROM {stage} WHERE "{col}" IS NOT NULL'
+        ).fetchall()}
+        if incoming <= known:
+            continue
+        values = sorted(known | incoming)
+        if len(values) > MAX_ENUM_VALUES:
+            con.execute(f'ALTER TABLE {table_name} ALTER COLUMN "{col}" TYPE VARCHAR')
+        else:
+            enum = "ENUM(" + ", ".join(_sql_str(v) for v in values) + ")"
+            con.execute(f'ALTER TABLE {table_name} ALTER COLUMN "{col}" TYPE {enum}')
+        widened = True
+    return widened
+
+def _table_exists(con: duckdb.DuckDBPyConnection, table_name: str) -> bool:
+    return bool(con.execute(
+        "SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = ? AND NOT temporary", [table_name]
+    ).fetchone()[0])
+
+def _apply_partition(
+    con: duckdb.DuckDBPyConnection, table_name: str, schema: TableSchema,
+    path: str, fp: Dict[str, Any], old_dates: List[Any],
+) -> Tuple[int, List[Any]]:
+    _stage_partition(con, path, schema)
+    stage = "_partition_stage"
+    if not _table_exists(con, table_name):
+        select_list = ", ".join(typed_select_list(con, schema, stage, parse_dates=False))
+        con.execute(f"CREATE TABLE {table_name} AS SELECT {select_list} FROM {stage} ORDER BY date_parsed")
+        create_date_view(con, table_name)
+    elif _widen_enums(con, table_name, stage):
+        create_date_view(con, table_name)
+
+    dates = [r[0] for r in con.execute(f"SELECT DISTINCT date_parsed FROM {stage} WHERE date_parsed IS NOT NULL").fetchall()]
+    rows = con.execute(f"SELECT COUNT(*) FROM {stage}").fetchone()[0]
+    if fp["sha256"] is None:
+        fp["sha256"] = _file_sha256(path)
+    cols = ", ".join(f'"{c}"' for c in _column_types(con, table_name))
+    affected = sorted(set(old_dates) | set(dates))
+
+    # Everything slow (file read, parsing, enum checks) happened above; the
+    # write transaction only swaps the affected dates, so readers keep their
+    # snapshot and aren't held up.
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.execute(
+            f"DELETE FROM {table_name} WHERE list_contains(?, date_parsed)",
+            [affected],
+        )
+        con.execute(f"INSERT INTO {table_name} ({cols}) SELECT {cols} FROM {stage}")
+        con.execute(f"DELETE FROM {MANIFEST_TABLE} WHERE table_name = ? AND file_path = ?", [table_name, path])
+        con.execute(
+            f"INSERT INTO {MANIFEST_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, current_timestamp)",
+            [table_name, path, fp["size"], fp["mtime_ns"], fp["sha256"], dates, rows],
+        )
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    finally:
+        con.execute(f"DROP TABLE IF EXISTS {stage}")
+    return rows, affected
+
+def load_partitions(
+    con: duckdb.DuckDBPyConnection, table_name: str, data_dir: str, schema: TableSchema
+) -> Dict[str, Any]:
+    """
+    Bring table_name up to date with the per-day files in data_dir. Unchanged
+    files (per the manifest) are skipped; new or changed files replace the
+    dates they contain. Work is proportional to the delta, not the history.
+    """
+    if not schema_is_usable(schema):
+        raise ValueError("Partitioned ingest needs a schema file with column types.")
+    _ensure_manifest(con)
+    manifest = _manifest_entries(con, table_name)
+    loaded: List[str] = []
+    dates: set = set()
+    rows = 0
+    skipped = 0
+    for path in list_partition_files(data_dir):
+        fp = source_fingerprint(path, with_hash=False, schema=schema)
+        entry = manifest.get(path)
+        if not _partition_changed(entry, path, fp):
+            skipped += 1
+            continue
+        n, affected = _apply_partition(con, table_name, schema, path, fp, entry["dates"] if entry else [])
+        rows += n
+        dates.update(affected)
+        loaded.append(path)
+    return {"loaded": loaded, "skipped": skipped, "rows": rows, "dates": sorted(dates)}
+
+def load_partitions_with_cache(
+    con: duckdb.DuckDBPyConnection,
+    table_name: str,
+    data_dir: str,
+    schema: TableSchema,
+    cache_dir: str = SETTINGS.cache_dir,
+) -> Dict[str, Any]:
+    # In-memory databases restore table + manifest from the last snapshot and
+    # then only ingest the delta; the manifest handles per-file freshness.
+    if SETTINGS.duckdb_path != ":memory:" or not SETTINGS.use_ingest_cache:
+        return load_partitions(con, table_name, data_dir, schema)
+
+    meta_key = f"{table_name}@partitions"
+    fp = {"layout": _layout_key(schema), "size": 0, "mtime_ns": 0, "sha256": None}
+    cache_file = os.path.join(cache_dir, f"{table_name}.partitions.duckdb")
+    tables = [table_name, MANIFEST_TABLE]
+    if _restore_from_cache(con, meta_key, tables, cache_file, data_dir, fp):
+        create_date_view(con, table_name)
+    stats = load_partitions(con, table_name, data_dir, schema)
+    if stats["loaded"]:
+        try:
+            _write_cache(con, meta_key, tables, cache_file, fp)
+        except (OSError, duckdb.Error) as e:
+            warnings.warn(f"Could not write ingest cache {cache_file}: {e}")
+    return stats
+
+
+# ---------------------------------------------------------------------------
+# Date bounds + optional Parquet storage. The bounds table keeps MIN/MAX
+# date_parsed so "latest date" lookups don't scan, plus a data version token
+# that changes on every ingest. The Parquet backend lays the data out as
+# year=/month=/date_parsed= partitions and points the _v view at them, so
+# date filters prune whole directories and row groups.
+# ---------------------------------------------------------------------------
+
+def date_bounds_table(table_name: str) -> str:
+    return f"{table_name}_date_bounds"
+
+def refresh_date_bounds(con: duckdb.DuckDBPyConnection, table_name: str) -> None:
+    con.execute(f"""
+        CREATE OR REPLACE TABLE {date_bounds_table(table_name)} AS
+        SELECT MIN(date_parsed) AS min_date, MAX(date_parsed) AS max_date, COUNT(*) AS row_count,
+               uuid()::VARCHAR AS data_version
+        FROM {table_name}_v;
+    """)
+
+def get_date_bounds(con: duckdb.DuckDBPyConnection, table_name: str) -> Optional[Tuple[Any, Any]]:
+    try:
+        row = con.execute(f"SELECT min_date, max_date FROM {date_bounds_table(table_name)}").fetchone()
+    except duckdb.CatalogException:
+        return None
+    return (row[0], row[1]) if row and row[1] is not None else None
+
+def get_data_version(con: duckdb.DuckDBPyConnection, table_name: str) -> str:
+    # A fresh token is minted by every ingest (refresh_date_bounds), so result
+    # caches keyed on it never serve rows from before a reload.
+    try:
+        row = con.execute(f"SELECT data_version FROM {date_bounds_table(table_name)}").fetchone()
+    except duckdb.CatalogException:
+        return ""
+    return row[0] if row else ""
+
+def _partition_dir(parquet_dir: str, d: Any) -> str:
+    return os.path.join(parquet_dir, f"year={d.year}", f"month={d.month}", f"date_parsed={d.isoformat()}")
+
+def export_partitioned_parquet(
+    con: duckdb.DuckDBPyConnection, table_name: str, parquet_dir: str, dates: Optional[List[Any]] = None
+) -> None:
+    """
+    Mirror table_name into hive-partitioned Parquet. The day level is keyed by
+    the full date so a filter on date_parsed prunes directories directly. With
+    `dates`, only those days are rewritten. Rows without a parseable date have
+    no partition and are not exported.
+    """
+    if dates is None:
+        shutil.rmtree(parquet_dir, ignore_errors=True)
+        where = "WHERE date_parsed IS NOT NULL"
+    else:
+        if not dates:
+            return
+        for d in dates:
+            shutil.rmtree(_partition_dir(parquet_dir, d), ignore_errors=True)
+        where = "WHERE list_contains([" + ", ".join(f"DATE '{d.isoformat()}'" for d in dates) + "], date_parsed)"
+    os.makedirs(parquet_dir, exist_ok=True)
+    con.execute(f"""
+        COPY (
+            SELECT * EXCLUDE (date_parsed), year(date_parsed) AS year, month(date_parsed) AS month, date_parsed
+            FROM {table_name}
+            {where}
+            ORDER BY date_parsed
+        ) TO '{parquet_dir}' (FORMAT PARQUET, PARTITION_BY (year, month, date_parsed), OVERWRITE_OR_IGNORE true);
+    """)
+
+def create_parquet_view(con: duckdb.DuckDBPyConnection, table_name: str, parquet_dir: str) -> None:
+    # read_parquet fails on a glob that matches nothing (empty ingest, every
+    # date filtered out): serve the table until partitions exist.
+    if not glob.glob(os.path.join(parquet_dir, "*", "*", "*", "*.parquet")):
+        create_date_view(con, table_name)
+        return
+    con.execute(f"""
+        CREATE OR REPLACE VIEW {table_name}_v AS
+        SELECT * EXCLUDE (year, month)
+        FROM read_parquet(
+            '{parquet_dir}/*/*/*/*.parquet',
+            hive_partitioning = true,
+            hive_types = {{'year': INTEGER, 'month': INTEGER, 'date_parsed': DATE}}
+        );
+    """)
+
+def finalize_storage(
+    con: duckdb.DuckDBPyConnection, table_name: str, schema: Optional[TableSchema], dates: Optional[List[Any]] = None
+) -> None:
+    """
+    Run after any ingest with the dates it touched (None = everything):
+    rewrite the affected Parquet partitions on that backend, bring the
+    rollups and the approximate-answer sample up to date and refresh the
+    date bounds.
+    """
+    typed = schema_is_usable(schema)
+    if typed and SETTINGS.storage_backend == "parquet":
+        if dates is not None and not os.path.isdir(SETTINGS.parquet_dir):
+            dates = None
+        export_partitioned_parquet(con, table_name, SETTINGS.parquet_dir, dates)
+        create_parquet_view(con, table_name, SETTINGS.parquet_dir)
+    if typed and SETTINGS.enable_rollups:
+        if dates is None or not load_registry(con, table_name):
+            build_rollups(con, table_name, schema, SETTINGS.rollup_dimensions)
+        else:
+            refresh_rollups(con, table_name, schema, dates)
+    if typed and SETTINGS.enable_approx_answers:
+        if dates is None:
+            build_sample(con, table_name, schema)
+        else:
+            refresh_sample(con, table_name, schema, dates)
+    refresh_date_bounds(con, table_name)
 
 def init_db() -> duckdb.DuckDBPyConnection:
     con = get_connection()
-    load_json_to_duckdb(con, SETTINGS.table_name, SETTINGS.data_path)
+    schema = read_schema(SETTINGS.schema_path, SETTINGS.table_name)
+    if SETTINGS.data_dir:
+        stats = load_partitions_with_cache(con, SETTINGS.table_name, SETTINGS.data_dir, schema)
+        finalize_storage(con, SETTINGS.table_name, schema, stats["dates"])
+    else:
+        status = load_with_cache(con, SETTINGS.table_name, SETTINGS.data_path, schema)
+        # A cache hit means the source is unchanged, so existing partitions stay valid.
+        finalize_storage(con, SETTINGS.table_name, schema, [] if status == "hit" else None)
     return con
 
 def quick_profile(con: duckdb.DuckDBPyConnection, table_name: str) -> pd.DataFrame:
     return con.execute(f"SELECT COUNT(*) AS rows FROM {table_name};").df()
 
+def dimension_values(con: duckdb.DuckDBPyConnection, table_or_view: str, columns=LOW_CARDINALITY_COLUMNS) -> Dict[str, List[str]]:
+    # Distinct non-empty values per categorical column, for entity matching.
+    present = set(get_table_columns(con, table_or_view))
+    out: Dict[str, List[str]] = {}
+    for col in columns:
+        if col not in present:
+            continue
+        rows = con.execute(
+            f'SELECT DISTINCT CAST("{col}" AS VARCHAR) FROM {table_or_view} WHERE "{col}" IS NOT NULL ORDER BY 1'
+        ).fetchall()
+        out[col] = [r[0] for r in rows if r[0]]
+    return out
+
 def get_table_columns(con, table_or_view: str) -> list[str]:
     df = con.execute(f"DESCRIBE {table_or_view}").df()
     # DuckDB DESCRIBE output column name is usually 'column_name'
@@ -0,0 +1,58 @@
+from __future__ import annotations
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+import duckdb
+
+
+class CursorPool:
+    """
+    Fixed-size pool of DuckDB cursors on one shared database. Each request
+    borrows its own cursor, so concurrent sessions run queries in parallel
+    instead of racing on a single connection; beyond `size` they queue.
+    Cursors are created lazily and reused.
+    """
+
+    def __init__(self, con: duckdb.DuckDBPyConnection, size: int):
+        self.con = con
+        self.size = max(1, size)
+        self._idle: "queue.LifoQueue[duckdb.DuckDBPyConnection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self.stats = {"in_use": 0, "acquired": 0, "waited": 0, "wait_ms_total": 0.0}
+
+    def _take(self) -> duckdb.DuckDBPyConnection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return self.con.cursor()
+        t0 = time.perf_counter()
+        cur = self._idle.get()
+        with self._lock:
+            self.stats["waited"] += 1
+            self.stats["wait_ms_total"] += (time.perf_counter() - t0) * 1000
+        return cur
+
+    @contextmanager
+    def acquire(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        cur = self._take()
+        with self._lock:
+            self.stats["in_use"] += 1
+            self.stats["acquired"] += 1
+        try:
+            yield cur
+        finally:
+            with self._lock:
+                self.stats["in_use"] -= 1
+            self._idle.put(cur)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "size": self.size, "created": self._created}
@@ -1,5 +1,25 @@
 from __future__ import annotations
+import math
+from datetime import date, datetime, time as dtime
+from decimal import Decimal
+from typing import Any, Optional, Tuple, Union
+
 import pandas as pd
+import pyarrow as pa
+from tabulate import tabulate
+
+from .arrow_result import QueryResult
+from .sampling import Approximation
+
+def json_cell(v: Any) -> Any:
+    # Result values as plain JSON: NaN/inf become null, decimals floats, dates ISO strings.
+    if isinstance(v, float) and (math.isnan(v) or math.isinf(v)):
+        return None
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, (date, datetime, dtime)):
+        return v.isoformat()
+    return v
 
 def df_to_markdown(df: pd.DataFrame, max_rows: int = 30) -> str:
     if df.empty:
@@ -7,12 +27,49 @@ def df_to_markdown(df: pd.DataFrame, max_rows: int = 30) -> str:
     show = df.head(max_rows).copy()
     return show.to_markdown(index=False)
 
-def format_answer(question: str, plan: list[str], df: pd.DataFrame, interpretation: str, assumptions: list[str], followups: list[str]) -> str:
+def arrow_to_markdown(table: pa.Table, max_rows: int = 30, total_rows: int | None = None) -> str:
+    # Renders straight from Arrow; only the shown rows become Python objects.
+    total = table.num_rows if total_rows is None else total_rows
+    if total == 0:
+        return "_No rows returned._"
+    shown = table.slice(0, max_rows)
+    rows = [list(r.values()) for r in shown.to_pylist()]
+    text = tabulate(rows, headers=shown.column_names, tablefmt="pipe")
+    if total > shown.num_rows:
+        text += f"\n\n_Showing {shown.num_rows:,} of {total:,} rows._"
+    return text
+
+def result_to_markdown(result: Union[QueryResult, pd.DataFrame], max_rows: int = 30) -> str:
+    if isinstance(result, QueryResult):
+        return arrow_to_markdown(result.head, max_rows, result.total_rows)
+    return df_to_markdown(result, max_rows)
+
+def _estimate(value: Any, interval: Optional[Tuple[float, float]]) -> Any:
+    # Decimals follow the interval's half-width: two significant digits of it.
+    if interval is None or value is None:
+        return value
+    half = (interval[1] - interval[0]) / 2
+    digits = min(6, max(0, 1 - math.floor(math.log10(half))))
+    return f"≈{float(value):,.{digits}f} ± {half:,.{digits}f}"
+
+def format_approx(approx: Approximation, max_rows: int = 30) -> str:
+    shown = approx.result.head.slice(0, max_rows)
+    if shown.num_rows == 0:
+        return "_Approximate answer: no rows in the sample._"
+    rows = [
+        [_estimate(v, approx.intervals[c][i]) if c in approx.intervals else v for c, v in row.items()]
+        for i, row in enumerate(shown.to_pylist())
+    ]
+    note = (f"_Approximate, from a {approx.fraction:.1%} sample ({approx.sample_rows:,} of {approx.base_rows:,} rows) "
+            f"with {approx.confidence:.0%} confidence intervals. The exact result replaces it when ready._")
+    return note + "\n\n" + tabulate(rows, headers=shown.column_names, tablefmt="pipe")
+
+def format_answer(question: str, plan: list[str], df: Union[QueryResult, pd.DataFrame], interpretation: str, assumptions: list[str], followups: list[str]) -> str:
     parts = []
     parts.append(f"**Question:** {question}")
     if plan:
         parts.append("**Plan:**\n" + "\n".join([f"- {p}" for p in plan]))
-    parts.append("**Result:**\n" + df_to_markdown(df))
+    parts.append("**Result:**\n" + result_to_markdown(df))
     if interpretation:
         parts.append(f"**Interpretation:** {interpretation}")
     if assumptions:
@@ -0,0 +1,522 @@
+from __future__ import annotations
+import asyncio
+import json
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+from .agent import AnalyticsAgent, ChatState
+from .config import SETTINGS
+from .formatting import json_cell
+from .llm_ollama import OllamaBusy
+from .sampling import Approximation
+from .tracing import prometheus_name
+
+MAX_BODY = 64 * 1024
+MAX_QUESTION = 2000
+SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+    500: "Internal Server Error", 502: "Bad Gateway", 503: "Service Unavailable",
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+def error_for(e: Exception) -> HttpError:
+    """HTTP status for an exception raised while answering."""
+    if isinstance(e, HttpError):
+        return e
+    if isinstance(e, OllamaBusy):
+        return HttpError(503, str(e), {"Retry-After": "2"})
+    if isinstance(e, requests.RequestException):
+        return HttpError(502, f"LLM backend unavailable: {type(e).__name__}")
+    return HttpError(500, f"{type(e).__name__}: {e}"[:300])
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    query: Dict[str, str]
+    headers: Dict[str, str]
+    body: bytes
+
+    @property
+    def keep_alive(self) -> bool:
+        return self.headers.get("connection", "").lower() != "close"
+
+    def json(self) -> Dict[str, Any]:
+        try:
+            data = json.loads(self.body or b"{}")
+        except ValueError:
+            raise HttpError(400, "Body is not valid JSON.")
+        if not isinstance(data, dict):
+            raise HttpError(400, "Body must be a JSON object.")
+        return data
+
+
+def dumps(obj: Any) -> bytes:
+    return json.dumps(obj, default=str, separators=(",", ":")).encode("utf-8")
+
+
+def answer_json(session_id: str, text: str, state: ChatState, result: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """The API's answer object: markdown plus the SQL, rows and the model's notes."""
+    out: Dict[str, Any] = {"session_id": session_id, "answer": text, "sql": state.last_sql}
+    if result is not None:
+        qr = result["result"]
+        out.update(
+            plan=result["plan"],
+            columns=qr.columns,
+            rows=[[json_cell(v) for v in row] for row in qr.to_rows()],
+            total_rows=qr.total_rows,
+            truncated=qr.truncated,
+            interpretation=result["interpretation"],
+            assumptions=result["assumptions"],
+            followups=result["followups"],
+        )
+    trace = state.last_trace or {}
+    out["trace"] = {k: trace.get(k) for k in ("trace_id", "total_ms", "source", "model") if trace.get(k) is not None}
+    return out
+
+
+def approx_json(approx: Approximation) -> Dict[str, Any]:
+    """A streamed estimate: preview rows and, per numeric column, [low, high] per row (null: no interval)."""
+    qr = approx.result
+    return {
+        "columns": qr.columns,
+        "rows": [[json_cell(v) for v in row] for row in qr.to_rows()],
+        "intervals": {c: [list(iv) if iv else None for iv in ivs] for c, ivs in approx.intervals.items()},
+        "confidence": approx.confidence,
+        "sample_rows": approx.sample_rows,
+        "base_rows": approx.base_rows,
+    }
+
+
+@dataclass
+class _Session:
+    state: ChatState
+    # One turn at a time per conversation: the next turn needs this one's state.
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class SessionStore:
+    """ChatState per session id, least recently used first out, expiring after `ttl_s` idle seconds."""
+
+    def __init__(self, ttl_s: float, max_sessions: int):
+        self.ttl_s = ttl_s
+        self.max_sessions = max(1, max_sessions)
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self.stats = {"created": 0, "expired": 0, "evicted": 0}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: Optional[str]) -> Tuple[str, _Session, List[str]]:
+        """The session (created if new) and the ids dropped to make room or for being idle."""
+        now = time.monotonic()
+        dropped = [sid for sid, s in self._sessions.items() if now - s.last_used > self.ttl_s and not s.lock.locked()]
+        for sid in dropped:
+            del self._sessions[sid]
+        self.stats["expired"] += len(dropped)
+        sid = session_id or uuid.uuid4().hex[:12]
+        session = self._sessions.get(sid)
+        if session is None:
+            session = self._sessions[sid] = _Session(ChatState(session_id=sid))
+            self.stats["created"] += 1
+            for old in list(self._sessions):
+                if len(self._sessions) <= self.max_sessions:
+                    break
+                if old != sid and not self._sessions[old].lock.locked():
+                    del self._sessions[old]
+                    dropped.append(old)
+                    self.stats["evicted"] += 1
+        self._sessions.move_to_end(sid)
+        session.last_used = now
+        return sid, session, dropped
+
+    def pop(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+
+class Admission:
+    """
+    At most `max_concurrent` answers run at once; up to `max_queue` more
+    wait for a slot, each for at most `queue_timeout` seconds. Beyond that
+    requests are turned away with 503 and Retry-After, so a burst can't
+    pile up unbounded work behind a slow model.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._sem = asyncio.Semaphore(self.max_concurrent)
+        self.stats = {"in_flight": 0, "waiting": 0, "max_waiting": 0, "admitted": 0,
+                      "rejected_full": 0, "rejected_timeout": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0}
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        st = self.stats
+        if self._sem.locked() and st["waiting"] >= self.max_queue:
+            st["rejected_full"] += 1
+            raise HttpError(503, "Server busy: the request queue is full.", {"Retry-After": "1"})
+        st["waiting"] += 1
+        st["max_waiting"] = max(st["max_waiting"], st["waiting"])
+        t0 = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._sem.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            st["rejected_timeout"] += 1
+            raise HttpError(503, f"Server busy: no free slot after {self.queue_timeout:.0f}s.", {"Retry-After": "2"})
+        finally:
+            st["waiting"] -= 1
+        waited = (time.perf_counter() - t0) * 1000
+        st["admitted"] += 1
+        st["in_flight"] += 1
+        st["wait_ms_total"] += waited
+        st["wait_ms_max"] = max(st["wait_ms_max"], waited)
+        try:
+            yield
+        finally:
+            st["in_flight"] -= 1
+            self._sem.release()
+
+
+class ApiServer:
+    """
+    Asyncio HTTP/1.1 service around AnalyticsAgent (standard library only).
+    Answers run on a thread pool as large as the admission limit, so a slow
+    generation or query holds only its own slot while the event loop keeps
+    accepting, queueing and streaming other requests.
+
+        POST   /v1/query            {"question": ..., "session_id": ..., "stream": false}
+        DELETE /v1/sessions/<id>    end a conversation (drops its intermediates)
+        GET    /healthz
+        GET    /metrics             Prometheus text; ?format=json for JSON
+
+    /v1/query returns the answer as JSON (markdown, SQL, columns, preview
+    rows, total row count and the model's notes). With "stream": true it
+    returns NDJSON instead: plan, sql and status events as they happen,
+    then the same object as an "answer" event (or an "error" event).
+    """
+
+    def __init__(
+        self,
+        agent: AnalyticsAgent,
+        max_concurrent: int = SETTINGS.api_max_concurrent,
+        max_queue: int = SETTINGS.api_max_queue,
+        queue_timeout: float = SETTINGS.api_queue_timeout,
+        session_ttl_s: float = SETTINGS.api_session_ttl_s,
+        max_sessions: int = SETTINGS.api_max_sessions,
+    ):
+        self.agent = agent
+        self.admission = Admission(max_concurrent, max_queue, queue_timeout)
+        self.sessions = SessionStore(session_ttl_s, max_sessions)
+        # One thread per admitted answer plus one for session cleanup.
+        self.executor = ThreadPoolExecutor(max_workers=self.admission.max_concurrent + 1, thread_name_prefix="api")
+        self.responses: Dict[int, int] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    # -- lifecycle --------------------------------------------------------
+
+    async def start(self, host: str = SETTINGS.api_host, port: int = SETTINGS.api_port) -> Tuple[str, int]:
+        self._server = await asyncio.start_server(self._connection, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def serve_forever(self) -> None:
+        assert self._server is not None
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    # -- HTTP -------------------------------------------------------------
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        try:
+            method, target, version = line.decode("latin-1").split()
+        except ValueError:
+            raise HttpError(400, "Malformed request line.")
+        headers: Dict[str, str] = {}
+        while True:
+            h = await reader.readline()
+            if h in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = h.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+        if version == "HTTP/1.0" and headers.get("connection", "").lower() != "keep-alive":
+            headers["connection"] = "close"
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise HttpError(400, "Bad Content-Length.")
+        if length > MAX_BODY:
+            raise HttpError(413, f"Body over {MAX_BODY} bytes.")
+        body = await reader.readexactly(length) if length else b""
+        url = urlsplit(target)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        return Request(method.upper(), url.path.rstrip("/") or "/", query, headers, body)
+
+    async def _connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    req = await self._read_request(reader)
+                except HttpError as e:
+                    await self._send_json(writer, e.status, {"error": e.message}, e.headers, keep_alive=False)
+                    break
+                if req is None:
+                    break
+                try:
+                    await self._dispatch(req, writer)
+                except HttpError as e:
+                    await self._send_json(writer, e.status, {"error": e.message}, e.headers, req.keep_alive)
+                if not req.keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # client went away
+        finally:
+            writer.close()
+
+    def _count(self, status: int) -> None:
+        self.responses[status] = self.responses.get(status, 0) + 1
+
+    async def _send(
+        self, writer: asyncio.StreamWriter, status: int, body: bytes, content_type: str,
+        headers: Optional[Dict[str, str]] = None, keep_alive: bool = True,
+    ) -> None:
+        head = [
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+            *(f"{k}: {v}" for k, v in (headers or {}).items()),
+        ]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+        self._count(status)
+
+    async def _send_json(self, writer, status: int, obj: Any, headers=None, keep_alive: bool = True) -> None:
+        await self._send(writer, status, dumps(obj), "application/json", headers, keep_alive)
+
+    async def _dispatch(self, req: Request, writer: asyncio.StreamWriter) -> None:
+        if req.path == "/v1/query":
+            if req.method != "POST":
+                raise HttpError(405, "Use POST.")
+            await self._query(req, writer)
+        elif req.path.startswith("/v1/sessions/"):
+            if req.method != "DELETE":
+                raise HttpError(405, "Use DELETE.")
+            await self._end_session(req, writer)
+        elif req.path == "/healthz":
+            await self._send_json(writer, 200, {"status": "ok"}, keep_alive=req.keep_alive)
+        elif req.path == "/metrics":
+            if req.query.get("format") == "json":
+                await self._send_json(writer, 200, self.metrics_json(), keep_alive=req.keep_alive)
+            else:
+                body = self.metrics_text().encode("utf-8")
+                await self._send(writer, 200, body, "text/plain; version=0.0.4", keep_alive=req.keep_alive)
+        else:
+            raise HttpError(404, f"No route for {req.path}.")
+
+    # -- endpoints --------------------------------------------------------
+
+    async def _events(self, question: str, state: ChatState) -> AsyncIterator[Tuple[str, Any]]:
+        """answer_stream() run on a worker thread, its events handed to the event loop."""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+        stop = threading.Event()
+
+        def pump():
+            gen = self.agent.answer_stream(question, state)
+            try:
+                for item in gen:
+                    loop.call_soon_threadsafe(queue.put_nowait, item)
+                    if stop.is_set():
+                        break
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                gen.close()
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        worker = loop.run_in_executor(self.executor, pump)
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # The slot stays held until the thread is free again.
+            stop.set()
+            await worker
+
+    async def _query(self, req: Request, writer: asyncio.StreamWriter) -> None:
+        data = req.json()
+        question = str(data.get("question") or "").strip()
+        if not question:
+            raise HttpError(400, "Missing 'question'.")
+        if len(question) > MAX_QUESTION:
+            raise HttpError(400, f"'question' is over {MAX_QUESTION} characters.")
+        session_id = data.get("session_id")
+        if session_id is not None and (not isinstance(session_id, str) or not SESSION_ID.match(session_id)):
+            raise HttpError(400, "'session_id' must be 1-64 letters, digits, '-' or '_'.")
+        stream = bool(data.get("stream")) or req.query.get("stream") == "1"
+
+        loop = asyncio.get_running_loop()
+        sid, session, dropped = self.sessions.get(session_id)
+        for old in dropped:
+            loop.run_in_executor(self.executor, self.agent.end_session, old)
+        t0 = time.perf_counter()
+        async with session.lock, self.admission.slot():
+            result: Optional[Dict[str, Any]] = None
+            events = self._events(question, session.state)
+            if not stream:
+                answer: Optional[Dict[str, Any]] = None
+                try:
+                    async for kind, payload in events:
+                        if kind == "result":
+                            result = payload
+                        elif kind == "answer":
+                            text, session.state = payload
+                            answer = answer_json(sid, text, session.state, result)
+                except Exception as e:
+                    raise error_for(e)
+                finally:
+                    await events.aclose()
+                if answer is None:
+                    raise HttpError(500, "The agent finished without an answer.")
+                await self._send_json(writer, 200, answer, keep_alive=req.keep_alive)
+            else:
+                await self._start_chunked(writer, req.keep_alive)
+                try:
+                    async for kind, payload in events:
+                        if kind == "result":
+                            result = payload
+                        elif kind == "answer":
+                            text, session.state = payload
+                            await self._chunk(writer, {"event": "answer", **answer_json(sid, text, session.state, result)})
+                        elif kind == "approx":
+                            await self._chunk(writer, {"event": "approx", **approx_json(payload)})
+                        else:
+                            await self._chunk(writer, {"event": kind, kind: payload})
+                except (ConnectionError, asyncio.CancelledError):
+                    raise
+                except Exception as e:
+                    err = error_for(e)
+                    await self._chunk(writer, {"event": "error", "status": err.status, "error": err.message})
+                finally:
+                    await events.aclose()
+                await self._end_chunked(writer)
+        self.agent.metrics.observe("api_query_ms", (time.perf_counter() - t0) * 1000)
+
+    async def _start_chunked(self, writer: asyncio.StreamWriter, keep_alive: bool) -> None:
+        head = [
+            "HTTP/1.1 200 OK",
+            "Content-Type: application/x-ndjson",
+            "Transfer-Encoding: chunked",
+            "Cache-Control: no-cache",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+        self._count(200)
+
+    async def _chunk(self, writer: asyncio.StreamWriter, obj: Any) -> None:
+        data = dumps(obj) + b"\n"
+        writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+        await writer.drain()
+
+    async def _end_chunked(self, writer: asyncio.StreamWriter) -> None:
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def _end_session(self, req: Request, writer: asyncio.StreamWriter) -> None:
+        sid = req.path.rsplit("/", 1)[-1]
+        if not SESSION_ID.match(sid):
+            raise HttpError(400, "Bad session id.")
+        existed = self.sessions.pop(sid)
+        dropped = await asyncio.get_running_loop().run_in_executor(self.executor, self.agent.end_session, sid)
+        await self._send_json(writer, 200, {"session_id": sid, "existed": existed, "intermediates_dropped": dropped},
+                              keep_alive=req.keep_alive)
+
+    # -- metrics ----------------------------------------------------------
+
+    def metrics_json(self) -> Dict[str, Any]:
+        a = self.agent
+        return {
+            "api": {**self.admission.stats, "sessions": len(self.sessions), **self.sessions.stats,
+                    "responses": {str(k): v for k, v in sorted(self.responses.items())}},
+            "llm": a.llm.stats(),
+            "models": a.router.stats(),
+            "cursors": a.cursors.snapshot(),
+            "result_cache": a.result_cache.snapshot(),
+            "question_cache": a.question_cache.snapshot(),
+            "session_cache": a.session_cache.snapshot(),
+            "approx": a.approx.snapshot(),
+            **a.metrics.snapshot(),
+        }
+
+    def metrics_text(self) -> str:
+        lines: List[str] = []
+
+        def gauges(group: str, values: Dict[str, Any]) -> None:
+            for key, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    name = prometheus_name("analytics", f"{group}_{key}")
+                    lines.extend([f"# TYPE {name} gauge", f"{name} {value}"])
+
+        a = self.agent
+        gauges("api", {**self.admission.stats, "sessions": len(self.sessions), **self.sessions.stats})
+        name = prometheus_name("analytics", "api_responses_total")
+        lines.append(f"# TYPE {name} counter")
+        lines.extend(f'{name}{{status="{k}"}} {v}' for k, v in sorted(self.responses.items()))
+        gauges("llm", a.llm.stats())
+        gauges("cursors", a.cursors.snapshot())
+        gauges("result_cache", a.result_cache.snapshot())
+        gauges("question_cache", a.question_cache.snapshot())
+        gauges("session_cache", a.session_cache.snapshot())
+        gauges("approx", a.approx.snapshot())
+        for model, st in a.router.stats().items():
+            for key in ("calls", "ok", "failed", "escalated", "latency_p50_ms", "latency_p95_ms"):
+                if st.get(key) is not None:
+                    lines.append(f'{prometheus_name("analytics", "model_" + key)}{{model="{model}"}} {st[key]}')
+        return "\n".join(lines) + "\n" + a.metrics.to_prometheus()
+
+
+async def serve(agent: AnalyticsAgent, host: str = SETTINGS.api_host, port: int = SETTINGS.api_port) -> None:
+    server = ApiServer(agent)
+    bound = await server.start(host, port)
+    print(f"Analytics API listening on http://{bound[0]}:{bound[1]}")
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
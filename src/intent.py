@@ -0,0 +1,311 @@
+from __future__ import annotations
+import re
+import threading
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .value_index import ValueIndex
+
+# Metric catalog: the business definitions from prompts.system_prompt plus
+# plain SUMs. key -> (label, SQL expression, phrase regex)
+METRICS: Dict[str, Tuple[str, str, str]] = {
+    "d0_conversion_rate": (
+        "D0 conversion rate",
+        "SUM(d0_orders) / NULLIF(SUM(d0_form_filled), 0)",
+        r"d0 (?:conversion|conv|cr)(?: rate)?",
+    ),
+    "dplus_conversion_rate": (
+        "Dplus conversion rate",
+        "SUM(dplus_orders) / NULLIF(SUM(dplus_form_filled), 0)",
+        r"(?:dplus|d\+|d plus) (?:conversion|conv|cr)(?: rate)?",
+    ),
+    "form_completion_rate": (
+        "Form completion rate",
+        "SUM(total_form_filled) / NULLIF(SUM(total_form_start), 0)",
+        r"(?:form )?(?:completion|fill) rate",
+    ),
+    "revenue": ("Revenue", "SUM(d0_revenue)", r"(?:d0 )?revenue"),
+    "d0_orders": ("D0 orders", "SUM(d0_orders)", r"d0 orders"),
+    "dplus_orders": ("Dplus orders", "SUM(dplus_orders)", r"(?:dplus|d\+|d plus) orders"),
+    "nf_orders": ("No-form orders", "SUM(NF_orders)", r"(?:nf|no form|no-form) orders"),
+    "form_starts": ("Form starts", "SUM(total_form_start)", r"form starts|forms started"),
+    "forms_filled": ("Forms filled", "SUM(total_form_filled)", r"forms filled|form fills|forms completed"),
+}
+
+# Grouping dimensions. key -> (label, SQL expression, phrase regex). Time
+# grains only count as dimensions when phrased as a grain ("by day", "daily").
+DIMENSIONS: Dict[str, Tuple[str, str, str]] = {
+    "city": ("city", "city", r"cit(?:y|ies)"),
+    "platform": ("platform", "platform", r"platforms?"),
+    "gender": ("gender", "gender", r"genders?"),
+    "stage": ("stage", "stage", r"(?:hair ?loss )?stages?"),
+    "age_bucket": ("age bucket", "age_bucket", r"age(?: groups?| buckets?| bands?)?"),
+    "first_form_utm_source": ("first-form UTM source", "first_form_utm_source", r"first form (?:utm )?sources?"),
+    "first_form_utm_medium": ("first-form UTM medium", "first_form_utm_medium", r"first form (?:utm )?medi(?:um|ums|a)"),
+    "first_form_utm_campaign": ("first-form UTM campaign", "first_form_utm_campaign", r"first form (?:utm )?campaigns?"),
+    "order_utm_source": ("order UTM source", "order_utm_source", r"order (?:utm )?sources?"),
+    "order_utm_medium": ("order UTM medium", "order_utm_medium", r"order (?:utm )?medi(?:um|ums|a)"),
+    "order_utm_campaign": ("order UTM campaign", "order_utm_campaign", r"order (?:utm )?campaigns?"),
+    "day": ("day", "date_parsed", r"(?:by|per|each) (?:day|date)|daily|day wise|over time|trend"),
+    "week": ("week", "DATE_TRUNC('week', date_parsed)", r"(?:by|per|each) week|weekly|week wise"),
+}
+TIME_GRAINS = {"day", "week"}
+
+FOLLOWUP_CUE = re.compile(r"^(?:what about|how about|and|same for|same but|now|only|what if|instead)\b")
+
+# Words that may remain once every slot has been consumed; anything else
+# (e.g. "average", "why", "share", a date) sends the question to the LLM.
+FILLER = set("""
+a about across all an and any are as at be best break breakdown by can that those
+did do does down each for from get give has have highest how i in instead is it last list lowest
+max maximum me metric metrics min minimum most least my now of on only our over overall past
+perform performance performed performing performs please rank ranked ranking same see show sorted split
+tell the their them there to top total value was were what whats
+which who wise with worst bottom
+""".split())
+# Comparison words: only filler when the question names what is compared,
+# i.e. several values of one column ("web vs app") or, for "compare", a
+# dimension ("compare conversion across cities"). Otherwise, e.g. "last 7
+# days vs previous 7 days", the LLM gets it.
+VERSUS = {"vs", "versus", "between"}
+COMPARE = {"compare", "compared", "comparison"}
+
+_WINDOW = re.compile(r"\b(?:in )?(?:the )?(?:last|past|previous) (\d+) (days?|weeks?|months?)\b")
+_WINDOW_UNIT = re.compile(r"\b(?:in )?(?:the )?(?:last|past|previous) (week|month)\b")
+_TOPK = re.compile(r"\b(top|bottom) (\d+)\b")
+_DESC = re.compile(r"\b(?:highest|best|most|max|maximum|top)\b")
+_ASC = re.compile(r"\b(?:lowest|worst|least|min|minimum|bottom)\b")
+_MARK = "§"
+
+# Words of the question grammar; never typo-corrected into a value (see ValueIndex).
+VOCABULARY = FILLER | VERSUS | COMPARE | {
+    w for _, _, phrase in [*METRICS.values(), *DIMENSIONS.values()] for w in re.findall(r"[a-z]{3,}", phrase)
+}
+
+
+@dataclass
+class Intent:
+    metrics: List[str]
+    dimension: Optional[str] = None
+    # column -> value, or list of values for comparisons
+    filters: Dict[str, Any] = field(default_factory=dict)
+    window_days: Optional[int] = None
+    top_k: Optional[int] = None
+    ascending: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _sql_str(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+class IntentEngine:
+    """
+    Deterministic fast path for templated metric questions: parse metric,
+    dimension, filters, time window, top-k and comparison slots, compile
+    straight to SQL, and let everything else fall through to the LLM.
+    """
+
+    def __init__(self, table_view: str, values: ValueIndex, max_rows: int, enabled: bool = True):
+        self.table_view = table_view
+        self.enabled = enabled
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self.stats = {"served": 0, "fallthrough": 0}
+        self.values = values
+
+    # -- parsing ----------------------------------------------------------
+
+    def parse(self, question: str, last_intent: Optional[Dict[str, Any]] = None) -> Optional[Intent]:
+        if not self.enabled:
+            return None
+        text = " ".join(re.sub(r"[^\w\s+\-']", " ", question.lower()).replace("'s", "").split())
+        followup = bool(FOLLOWUP_CUE.match(text)) and last_intent is not None
+
+        def consume(pattern: str, s: str) -> Tuple[List[re.Match], str]:
+            rx = re.compile(pattern) if isinstance(pattern, str) else pattern
+            found = list(rx.finditer(s))
+            return found, rx.sub(f" {_MARK} ", s)
+
+        # Entities first, so "stage 3" or "18-25" aren't read as numbers/dimensions.
+        filters: Dict[str, List[str]] = {}
+        found = self.values.matches(text)
+        for m in found:
+            if m.ambiguous:
+                return self._miss()
+            if m.value not in filters.setdefault(m.column, []):
+                filters[m.column].append(m.value)
+        for m in reversed(found):
+            text = f"{text[:m.start]} {_MARK} {text[m.end:]}"
+
+        window = None
+        windows, text = consume(_WINDOW, text)
+        for m in windows:
+            n, unit = int(m.group(1)), m.group(2)
+            window = n * (7 if unit.startswith("week") else 30 if unit.startswith("month") else 1)
+        found, text = consume(_WINDOW_UNIT, text)
+        for m in found:
+            window = 7 if m.group(1) == "week" else 30
+        if len(windows) + len(found) > 1:
+            return self._miss()  # "last 30 days and last 7 days": two periods, not one
+        if window is not None and window <= 0:
+            return self._miss()  # "last 0 days" is not "all time"
+
+        top_k, ascending = None, None
+        found, text = consume(_TOPK, text)
+        for m in found:
+            top_k, ascending = int(m.group(2)), m.group(1) == "bottom"
+
+        metrics: List[str] = []
+        for key, (_, _, phrase) in METRICS.items():
+            found, text = consume(rf"\b(?:{phrase})\b", text)
+            if found:
+                metrics.append(key)
+
+        dims: List[str] = []
+        plural = False
+        for key in sorted(DIMENSIONS, key=lambda k: k not in TIME_GRAINS):
+            # "per city" groups like "by city"; a bare "per" ("per user") is left over.
+            found, text = consume(rf"\b(?:per )?(?:{DIMENSIONS[key][2]})\b", text)
+            if found:
+                dims.append(key)
+                plural = plural or any(m.group(0).endswith(("s", "media")) for m in found)
+
+        if _DESC.search(text):
+            ascending = False if ascending is None else ascending
+        elif _ASC.search(text):
+            ascending = True if ascending is None else ascending
+        ranked = bool(_DESC.search(text) or _ASC.search(text))
+
+        if len(dims) > 1:
+            return self._miss()
+        dimension = dims[0] if dims else None
+        # "web vs app": several values of one column become a grouped comparison.
+        multi = [c for c, vs in filters.items() if len(vs) > 1]
+        if len(multi) > 1 or (multi and dimension not in (None, multi[0])):
+            return self._miss()
+
+        allowed = FILLER | (VERSUS | COMPARE if multi else COMPARE if dimension else set())
+        if any(w != _MARK and w not in allowed for w in text.split()):
+            return self._miss()
+        if multi:
+            dimension = multi[0]
+
+        if followup:
+            base = Intent(**last_intent)
+            merged = dict(base.filters)
+            merged.update({c: vs if len(vs) > 1 else vs[0] for c, vs in filters.items()})
+            if top_k is None and (ranked or dimension in (None, base.dimension)):
+                top_k = base.top_k  # but "now split that by platform" shows every platform
+            intent = Intent(
+                metrics=metrics or base.metrics,
+                dimension=dimension or base.dimension,
+                filters=merged,
+                window_days=window if window is not None else base.window_days,
+                top_k=top_k,
+                ascending=ascending if ascending is not None else base.ascending,
+            )
+        else:
+            if not metrics:
+                return self._miss()
+            if top_k is None and ranked and dimension and dimension not in TIME_GRAINS and not plural:
+                top_k = 1  # "which city has the highest ..." -> top row only; "top cities" keeps them all
+            intent = Intent(
+                metrics=metrics,
+                dimension=dimension,
+                filters={c: vs if len(vs) > 1 else vs[0] for c, vs in filters.items()},
+                window_days=window,
+                top_k=top_k,
+                ascending=bool(ascending),
+            )
+        if (ranked or intent.top_k) and (intent.dimension is None or intent.dimension in TIME_GRAINS):
+            return self._miss()  # "what was the highest revenue?" asks for a ranking over something unnamed
+        with self._lock:
+            self.stats["served"] += 1
+        return intent
+
+    def _miss(self) -> None:
+        with self._lock:
+            self.stats["fallthrough"] += 1
+        return None
+
+    # -- compilation ------------------------------------------------------
+
+    def compile(self, intent: Intent, relation: Optional[str] = None, applied: Iterable[str] = ()) -> str:
+        """
+        SQL for `intent` over the date view, or over `relation`: a session
+        intermediate (see session_cache) whose dimensions are materialized
+        under their keys and that already has the time window and the
+        filters on the `applied` columns built in.
+        """
+        v = self.table_view
+        source = relation or v
+        select, where, group = [], [], None
+        if intent.dimension:
+            label, expr, _ = DIMENSIONS[intent.dimension]
+            alias = intent.dimension
+            if relation:
+                expr = alias
+            select.append(expr if expr == alias else f"{expr} AS {alias}")
+            group = alias
+            if intent.dimension not in TIME_GRAINS:
+                where.append(f"{expr} IS NOT NULL AND {expr} <> ''")
+        for m in intent.metrics:
+            select.append(f"{METRICS[m][1]} AS {m}")
+        if intent.window_days is not None and not relation:
+            where.append(f"date_parsed >= (SELECT MAX(date_parsed) FROM {v}) - INTERVAL '{intent.window_days} days'")
+        for col, value in intent.filters.items():
+            if col in applied:
+                continue
+            if isinstance(value, list):
+                where.append(f"{col} IN ({', '.join(_sql_str(x) for x in value)})")
+            else:
+                where.append(f"{col} = {_sql_str(value)}")
+
+        sql = f"SELECT {', '.join(select)}\nFROM {source}"
+        if where:
+            sql += "\nWHERE " + "\n  AND ".join(where)
+        if group:
+            sql += f"\nGROUP BY {group}"
+            if intent.dimension in TIME_GRAINS:
+                # The latest periods, oldest first.
+                sql += f"\nORDER BY {group} DESC\nLIMIT {intent.top_k or self.max_rows}"
+                return f"SELECT * FROM (\n{sql}\n) AS latest\nORDER BY {group}"
+            sql += f"\nORDER BY {intent.metrics[0]} {'ASC' if intent.ascending else 'DESC'}"
+            sql += f"\nLIMIT {intent.top_k or self.max_rows}"
+        return sql
+
+    def payload(self, intent: Intent) -> Dict[str, Any]:
+        """Same shape as the LLM's JSON answer, so the rest of the pipeline is unchanged."""
+        metric_text = " and ".join(METRICS[m][0] for m in intent.metrics)
+        scope = []
+        if intent.window_days is not None:
+            scope.append(f"over the last {intent.window_days} days")
+        for col, value in intent.filters.items():
+            scope.append(f"for {col} {' vs '.join(value) if isinstance(value, list) else value}")
+        scope_text = (" " + ", ".join(scope)) if scope else ""
+        plan = [f"Compute {metric_text}{scope_text}"]
+        if intent.dimension:
+            dim_label = DIMENSIONS[intent.dimension][0]
+            if intent.top_k:
+                which = "bottom" if intent.ascending else "top"
+                plan.append(f"Group by {dim_label} and keep the {which} {intent.top_k}")
+            else:
+                plan.append(f"Group by {dim_label}")
+        assumptions = []
+        if intent.window_days is not None:
+            assumptions.append(f"'Last {intent.window_days} days' is measured from the latest date in the data.")
+        return {
+            "analysis_plan": plan,
+            "sql": self.compile(intent),
+            "result_interpretation": f"{metric_text}{' by ' + DIMENSIONS[intent.dimension][0] if intent.dimension else ''}{scope_text}.",
+            "assumptions": assumptions,
+            "followups": [],
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.stats["served"] + self.stats["fallthrough"]
+            return {**self.stats, "served_fraction": self.stats["served"] / total if total else 0.0}
@@ -0,0 +1,116 @@
+from __future__ import annotations
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class IncrementalJSONObject:
+    """
+    Incremental parser for the LLM's top-level JSON object. Feed it text
+    chunks as they stream in; every top-level field is returned from `feed`
+    as soon as its value is complete, so `analysis_plan` and `sql` are
+    available before the rest of the object has been generated.
+
+    Leading noise before the first '{' (e.g. a ```json fence) is skipped.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.fields: Dict[str, Any] = {}
+        self.done = False
+        self._pos = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        # Top-level bookkeeping: current key and where its value starts.
+        self._key: Optional[str] = None
+        self._key_start: Optional[int] = None
+        self._value_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self.text += chunk
+        out: List[Tuple[str, Any]] = []
+        text = self.text
+        i = self._pos
+        while i < len(text) and not self.done:
+            ch = text[i]
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                i += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._close_top_string(i, out)
+                i += 1
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    if self._key is None and self._key_start is None:
+                        self._key_start = i
+                    elif self._key is not None and self._value_start is None:
+                        self._value_start = i
+            elif ch in "[{":
+                if self._depth == 1 and self._key is not None and self._value_start is None:
+                    self._value_start = i
+                self._depth += 1
+            elif ch in "]}":
+                self._depth -= 1
+                if self._depth == 1 and self._value_start is not None:
+                    self._emit(i + 1, out)
+                elif self._depth == 0:
+                    # Bare scalar as the last value (number/true/false/null).
+                    if self._value_start is not None:
+                        self._emit(i, out)
+                    self.done = True
+            elif self._depth == 1:
+                if ch == ",":
+                    if self._value_start is not None:
+                        self._emit(i, out)
+                elif self._key is not None and self._value_start is None and ch not in " \t\r\n:":
+                    self._value_start = i
+            i += 1
+        self._pos = i
+        return out
+
+    def _close_top_string(self, i: int, out: List[Tuple[str, Any]]) -> None:
+        if self._key is None and self._key_start is not None:
+            self._key = json.loads(self.text[self._key_start:i + 1])
+            self._key_start = None
+        elif self._value_start is not None:
+            self._emit(i + 1, out)
+
+    def _emit(self, end: int, out: List[Tuple[str, Any]]) -> None:
+        raw = self.text[self._value_start:end].strip()
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            value = None
+        if value is not None or raw == "null":
+            self.fields[self._key] = value
+            out.append((self._key, value))
+        self._key = None
+        self._value_start = None
+
+    def result(self) -> Dict[str, Any]:
+        """Full object once the stream is finished; falls back to the fields seen so far."""
+        start = self.text.find("{")
+        end = self.text.rfind("}")
+        if start != -1 and end > start:
+            try:
+                return json.loads(self.text[start:end + 1])
+            except json.JSONDecodeError:
+                pass
+        if not self.fields:
+            raise ValueError("LLM response did not contain a JSON object")
+        return dict(self.fields)
@@ -1,25 +1,231 @@
 from __future__ import annotations
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
 import requests
-from typing import List, Dict, Any
+from requests.adapters import HTTPAdapter
+from typing import List, Dict, Any, AsyncIterator, Iterator, Optional
 from .config import SETTINGS
 
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class OllamaBusy(RuntimeError):
+    """Raised when a request waited longer than the queue timeout for a free slot."""
+
+
+class _TransientStatus(requests.HTTPError):
+    pass
+
+
+def _fill_usage(usage: Optional[Dict[str, Any]], data: Dict[str, Any]) -> None:
+    """Copy Ollama's final-response token counts and durations (ns -> ms) into `usage`."""
+    if usage is None:
+        return
+    usage["model"] = data.get("model")
+    usage["prompt_tokens"] = data.get("prompt_eval_count")
+    usage["eval_tokens"] = data.get("eval_count")
+    for key in ("total_duration", "load_duration", "prompt_eval_duration", "eval_duration"):
+        if data.get(key) is not None:
+            usage[key.replace("duration", "ms")] = round(data[key] / 1e6, 2)
+
+
+class InFlightLimiter:
+    """Bounded concurrency with queue metrics (waiting, wait time)."""
+
+    def __init__(self, max_in_flight: int, queue_timeout: float):
+        self._sem = threading.BoundedSemaphore(max(1, max_in_flight))
+        self._lock = threading.Lock()
+        self.queue_timeout = queue_timeout
+        self.stats = {"in_flight": 0, "waiting": 0, "max_waiting": 0, "acquired": 0,
+                      "rejected": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0}
+
+    def __enter__(self):
+        with self._lock:
+            self.stats["waiting"] += 1
+            self.stats["max_waiting"] = max(self.stats["max_waiting"], self.stats["waiting"])
+        t0 = time.perf_counter()
+        ok = self._sem.acquire(timeout=self.queue_timeout)
+        waited = (time.perf_counter() - t0) * 1000
+        with self._lock:
+            self.stats["waiting"] -= 1
+            if not ok:
+                self.stats["rejected"] += 1
+                raise OllamaBusy(f"No free Ollama slot after {self.queue_timeout:.0f}s; try again shortly.")
+            self.stats["in_flight"] += 1
+            self.stats["acquired"] += 1
+            self.stats["wait_ms_total"] += waited
+            self.stats["wait_ms_max"] = max(self.stats["wait_ms_max"], waited)
+        return self
+
+    def __exit__(self, *exc):
+        with self._lock:
+            self.stats["in_flight"] -= 1
+        self._sem.release()
+        return False
+
+
 class OllamaClient:
-    def __init__(self, base_url: str = SETTINGS.ollama_base_url, model: str = SETTINGS.ollama_model):
-        self.base_url = base_url.rstrip("/")
+    """
+    Pooled client for Ollama's /api/chat. A single requests.Session keeps
+    connections alive, calls are bounded by an in-flight limiter (callers
+    queue beyond it), transient failures are retried with jittered
+    exponential backoff, and several base URLs are used round-robin. The
+    async methods run the same pooled calls in worker threads.
+    """
+
+    def __init__(
+        self,
+        base_url: str = SETTINGS.ollama_base_url,
+        model: str = SETTINGS.ollama_model,
+        base_urls: Optional[List[str]] = None,
+        max_in_flight: int = SETTINGS.ollama_max_in_flight,
+        retries: int = SETTINGS.ollama_retries,
+        limiter: Optional[InFlightLimiter] = None,
+    ):
+        urls = base_urls or [u.strip() for u in SETTINGS.ollama_base_urls.split(",") if u.strip()] or [base_url]
+        self.base_urls = [u.rstrip("/") for u in urls]
+        self.base_url = self.base_urls[0]
         self.model = model
+        self.retries = retries
+        self.limiter = limiter or InFlightLimiter(max_in_flight, SETTINGS.ollama_queue_timeout)
+        self._rr = itertools.cycle(self.base_urls)
+        self._rr_lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.base_urls), pool_maxsize=max(4, max_in_flight * 2))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.counters = {"requests": 0, "retries": 0, "errors": 0}
 
-    def chat(self, messages: List[Dict[str, str]], temperature: float = 0.2) -> str:
-        url = f"{self.base_url}/api/chat"
-        payload: Dict[str, Any] = {
-            "model": self.model,
+    def _payload(
+        self, messages: List[Dict[str, str]], temperature: float, stream: bool, model: Optional[str] = None
+    ) -> Dict[str, Any]:
+        return {
+            "model": model or self.model,
             "messages": messages,
             "options": {
                 "temperature": temperature,
-                "num_predict": 1200 
+                "num_predict": 1200
             },
-            "stream": False
+            "stream": stream,
+            "keep_alive": SETTINGS.ollama_keep_alive,
         }
-        resp = requests.post(url, json=payload, timeout=120)
-        resp.raise_for_status()
-        data = resp.json()
+
+    def _next_url(self) -> str:
+        with self._rr_lock:
+            return next(self._rr)
+
+    def _post(self, payload: Dict[str, Any], stream: bool) -> requests.Response:
+        # Connection errors, timeouts and 429/5xx are retried on the next server.
+        attempt = 0
+        while True:
+            url = f"{self._next_url()}/api/chat"
+            self.counters["requests"] += 1
+            try:
+                resp = self.session.post(url, json=payload, stream=stream, timeout=SETTINGS.ollama_timeout)
+                if resp.status_code in RETRY_STATUS:
+                    resp.close()
+                    raise _TransientStatus(f"{resp.status_code} from {url}", response=resp)
+                resp.raise_for_status()
+                return resp
+            except (requests.ConnectionError, requests.Timeout, _TransientStatus):
+                if attempt >= self.retries:
+                    self.counters["errors"] += 1
+                    raise
+                self.counters["retries"] += 1
+                # Full jitter: uniform in [0, 0.25s * 2^attempt], capped at 5s.
+                time.sleep(random.uniform(0, min(5.0, 0.25 * 2 ** attempt)))
+                attempt += 1
+
+    def chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.2,
+        usage: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None,
+    ) -> str:
+        with self.limiter:
+            resp = self._post(self._payload(messages, temperature, False, model), stream=False)
+            data = resp.json()
+        _fill_usage(usage, data)
         return data["message"]["content"]
+
+    def chat_stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.2,
+        usage: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None,
+    ) -> Iterator[str]:
+        """
+        Yield content deltas as Ollama generates them (NDJSON, one object per
+        line). If `usage` is given it is filled from the final object.
+        `model` overrides the client's default for this call.
+        """
+        with self.limiter:
+            with self._post(self._payload(messages, temperature, True, model), stream=True) as resp:
+                for line in resp.iter_lines(chunk_size=None):
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get("error"):
+                        raise RuntimeError(f"Ollama error: {data['error']}")
+                    delta = data.get("message", {}).get("content", "")
+                    if delta:
+                        yield delta
+                    if data.get("done"):
+                        _fill_usage(usage, data)
+                        break
+
+    async def achat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.2,
+        usage: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None,
+    ) -> str:
+        return await asyncio.to_thread(self.chat, messages, temperature, usage, model)
+
+    async def achat_stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.2,
+        usage: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+        stop = threading.Event()
+
+        def pump():
+            gen = self.chat_stream(messages, temperature, usage, model)
+            try:
+                for delta in gen:
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, delta)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                gen.close()
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        worker = loop.run_in_executor(None, pump)
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            await worker
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.limiter.stats, **self.counters, "servers": len(self.base_urls)}
@@ -0,0 +1,130 @@
+from __future__ import annotations
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from .intent import DIMENSIONS, METRICS
+from .tracing import Histogram
+from .value_index import ValueIndex
+
+# Phrases that usually mean several subqueries, windows or self-comparisons.
+HARD_PHRASES = re.compile(
+    r"\b(?:compare|compared|comparison|vs|versus|against|trend|trends|trending|over time|"
+    r"week[- ]over[- ]week|month[- ]over[- ]month|day[- ]over[- ]day|wow|mom|growth|grow|change|changed|"
+    r"improv\w*|declin\w*|cohort\w*|retention|difference|share of|percent(?:age)? of|rank\w*|"
+    r"correlat\w*|distribution|moving average|rolling|cumulative|each|per)\b"
+)
+# Follow-ups that lean on the previous query.
+REFERENCE = re.compile(r"\b(?:that|those|same|it|them|previous|instead)\b")
+
+
+@dataclass
+class Route:
+    model: str
+    score: float
+    features: Dict[str, Any]
+    # Where to go when `model`'s answer fails (None: nowhere, it is the large model).
+    fallback: Optional[str] = None
+
+
+@dataclass
+class ModelStats:
+    calls: int = 0
+    ok: int = 0
+    failed: int = 0
+    escalated: int = 0
+    latency: Histogram = field(default_factory=Histogram)
+    failures: Dict[str, int] = field(default_factory=dict)
+
+
+class ModelRouter:
+    """
+    Picks the model for a question's first LLM call. A cheap complexity
+    score (length, value mentions, metrics and dimensions named,
+    comparison/trend phrasing, follow-up references) below `threshold`
+    sends the question to `small_model`; its route names `large_model` as
+    the fallback the agent escalates to when the small model's answer
+    doesn't parse, fails the guards or fails to run. Per-model latency and
+    outcomes are kept for tuning the threshold. Without a small model
+    every question goes to the large one.
+    """
+
+    def __init__(self, large_model: str, small_model: str, threshold: float, values: ValueIndex):
+        self.large_model = large_model
+        self.small_model = small_model if small_model and small_model != large_model else ""
+        self.threshold = threshold
+        self.values = values
+        self._metric_rx = [re.compile(rf"\b(?:{p})\b") for _, _, p in METRICS.values()]
+        self._dim_rx = [re.compile(rf"\b(?:{p})\b") for _, _, p in DIMENSIONS.values()]
+        self._lock = threading.Lock()
+        self._stats: Dict[str, ModelStats] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.small_model)
+
+    def complexity(self, question: str, follow_up: bool = False) -> Dict[str, Any]:
+        """The score and the features it is made of."""
+        text = " ".join(re.sub(r"[^\w\s+\-]", " ", question.lower()).split())
+        words = len(text.split())
+        values = len(self.values.matches(question))
+        metrics = sum(1 for rx in self._metric_rx if rx.search(text))
+        dims = sum(1 for rx in self._dim_rx if rx.search(text))
+        hard = len(set(HARD_PHRASES.findall(text)))
+        refs = follow_up and bool(REFERENCE.search(text))
+        score = words / 10 + 0.5 * values + max(0, metrics - 1) + max(0, dims - 1) * 0.75 + 1.5 * hard + refs
+        return {"score": round(score, 2), "words": words, "values": values, "metrics": metrics,
+                "dimensions": dims, "hard_phrases": hard, "reference": refs}
+
+    def route(self, question: str, follow_up: bool = False) -> Route:
+        features = self.complexity(question, follow_up)
+        score = features.pop("score")
+        if self.enabled and score < self.threshold:
+            return Route(self.small_model, score, features, fallback=self.large_model)
+        return Route(self.large_model, score, features)
+
+    # -- stats ------------------------------------------------------------
+
+    def _get(self, model: str) -> ModelStats:
+        return self._stats.setdefault(model, ModelStats())
+
+    def record_call(self, model: str, ms: float) -> None:
+        with self._lock:
+            st = self._get(model)
+            st.calls += 1
+            st.latency.observe(ms)
+
+    def record_outcome(self, model: str, ok: bool, stage: str = "", escalated: bool = False) -> None:
+        """How the SQL from `model` fared: ok, or failed at `stage` ("parse", "guard", "execute")."""
+        with self._lock:
+            st = self._get(model)
+            if ok:
+                st.ok += 1
+            else:
+                st.failed += 1
+                st.failures[stage] = st.failures.get(stage, 0) + 1
+            st.escalated += escalated
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            out = {}
+            for model, st in self._stats.items():
+                done = st.ok + st.failed
+                out[model] = {
+                    "calls": st.calls,
+                    "ok": st.ok,
+                    "failed": st.failed,
+                    "success_rate": round(st.ok / done, 3) if done else None,
+                    "escalated": st.escalated,
+                    "failures": dict(st.failures),
+                    **{f"latency_{k}_ms": round(v, 1) for k, v in st.latency.snapshot().items() if k != "count"},
+                }
+            return out
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+    def models(self) -> List[str]:
+        return [m for m in (self.small_model, self.large_model) if m]
@@ -0,0 +1,140 @@
+from __future__ import annotations
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from .intent import DIMENSIONS, METRICS
+from .prompts import REFINE_PROMPT, system_prompt
+from .schema_reader import TableSchema
+from .sql_analyzer import analyze_sql
+from .value_index import ValueIndex
+
+# The rules in the static prefix already explain how to use the dates.
+NO_NOTE = ("date", "date_parsed")
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English/SQL with Llama-style tokenizers.
+    return (len(text) + 3) // 4
+
+
+@dataclass
+class Prompt:
+    messages: List[Dict[str, str]]
+    columns: List[str]
+    static_tokens: int
+    tokens: int
+    trimmed: List[str] = field(default_factory=list)
+
+    def usage(self) -> Dict[str, Any]:
+        return {
+            "prompt_tokens_est": self.tokens,
+            "static_tokens_est": self.static_tokens,
+            "columns": len(self.columns),
+            **({"trimmed": self.trimmed} if self.trimmed else {}),
+        }
+
+
+class PromptBuilder:
+    """
+    Chat messages laid out for Ollama's prompt (KV) cache: a system message
+    that is byte-identical for every call and session (role, output
+    contract, rules, metric definitions and the compact column list), then
+    one user message naming the columns the question refers to, the
+    conversation context and the question. Only that user
+    message has to be prefilled on a cache hit, so it is kept under
+    `token_budget` (estimated) by dropping the least relevant columns,
+    then the previous question. A refine call repeats the previous call's
+    messages and the model's reply unchanged and appends the error, so its
+    prefill starts where the previous generation left off.
+    """
+
+    def __init__(self, schema: TableSchema, table_view: str, max_rows: int, values: ValueIndex, token_budget: int):
+        self.schema = schema
+        self.table_view = table_view
+        self.values = values
+        self.token_budget = token_budget
+        self.system = system_prompt(schema.to_compact_prompt_text(by_type=True), table_view, max_rows)
+        self.static_tokens = estimate_tokens(self.system)
+        self._names = [c.name for c in schema.columns]
+        self._lower = {n.lower(): n for n in self._names}
+        self._metric_rx = [(re.compile(rf"\b(?:{p})\b"), expr) for _, expr, p in METRICS.values()]
+        self._dim_rx = [(re.compile(rf"\b(?:{p})\b"), expr) for _, expr, p in DIMENSIONS.values()]
+
+    # -- column selection -------------------------------------------------
+
+    def _in_schema(self, names) -> List[str]:
+        return [self._lower[n.lower()] for n in names if n.lower() in self._lower]
+
+    def relevant_columns(self, question: str, last_sql: Optional[str] = None) -> List[str]:
+        """Schema columns `question` refers to, most relevant first; none when nothing matches."""
+        text = " ".join(re.sub(r"[^\w\s+\-]", " ", question.lower()).split())
+        required: List[str] = []
+
+        def need(names) -> None:
+            for n in self._in_schema(names):
+                if n not in required:
+                    required.append(n)
+
+        for rx, expr in self._metric_rx + self._dim_rx:
+            if rx.search(text):
+                need(re.findall(r"[a-z_][a-z0-9_]*", expr.lower()))
+        need(c for m in self.values.matches(question) for c, _ in m.candidates)
+        need(n for n in self._names if n.lower().replace("_", " ") in text or n.lower() in text)
+        if last_sql:
+            need(analyze_sql(last_sql).columns)
+        # Then columns sharing a word with the question ("orders" -> every *_orders column).
+        words = set(text.split())
+        related = [n for n in self._names if n not in required and words & set(n.lower().split("_"))]
+        return [n for n in required + related if n.lower() not in NO_NOTE]
+
+    # -- messages ---------------------------------------------------------
+
+    @property
+    def template(self) -> str:
+        """The per-question user message with placeholders, for cache versioning."""
+        return f"budget={self.token_budget}\n" + self._user_message("{question}", ["{columns}"], {"{context}": ""})
+
+    def _user_message(self, question: str, columns: Sequence[str], context: Dict[str, Any]) -> str:
+        parts = []
+        if columns:
+            parts.append("Relevant columns: " + ", ".join(columns))
+        if context:
+            parts.append(f"Conversation context JSON:\n{json.dumps(context)}")
+        parts.append(f"User question:\n{question}")
+        return "\n\n".join(parts)
+
+    def build(self, question: str, context: Dict[str, Any], last_sql: Optional[str] = None) -> Prompt:
+        columns = self.relevant_columns(question, last_sql)
+        context = dict(context)
+        trimmed: List[str] = []
+        user = self._user_message(question, columns, context)
+        while estimate_tokens(user) > self.token_budget:
+            if columns:
+                columns = columns[:-1]
+                if "columns" not in trimmed:
+                    trimmed.append("columns")
+            elif context.pop("last_question", None) is not None:
+                trimmed.append("last_question")
+            else:
+                break
+            user = self._user_message(question, columns, context)
+        messages = [{"role": "system", "content": self.system}, {"role": "user", "content": user}]
+        return Prompt(messages, list(columns), self.static_tokens, self.static_tokens + estimate_tokens(user), trimmed)
+
+    def refine(self, prompt: Prompt, reply: Optional[str], prev_sql: str, error: str) -> Prompt:
+        """
+        `prompt` continued with the model's `reply` and the error. Without a
+        reply (the SQL came from a cache or the fast path) the failed SQL is
+        quoted instead.
+        """
+        if reply:
+            added = [{"role": "assistant", "content": reply}]
+            extra = f"{REFINE_PROMPT.strip()}\n\nError/Issue:\n{error}"
+        else:
+            added = []
+            extra = f"{REFINE_PROMPT.strip()}\n\nPrevious SQL:\n{prev_sql}\n\nError/Issue:\n{error}"
+        added.append({"role": "user", "content": extra})
+        tokens = prompt.tokens + sum(estimate_tokens(m["content"]) for m in added)
+        return Prompt([*prompt.messages, *added], prompt.columns, prompt.static_tokens, tokens, prompt.trimmed)
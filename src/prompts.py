@@ -22,12 +22,16 @@ Rules:
 
 
 def system_prompt(schema_text: str, table_view: str, max_rows: int) -> str:
+    # Identical for every call: per-question parts go in the user message
+    # (see prompt_builder), so Ollama can reuse this prefix from its KV cache.
     return f"""
 You are an expert analytics agent. You answer questions by generating DuckDB SQL and interpreting results.
 
 Available schema:
 {schema_text}
 
+Context: for a follow-up like 'what about Mumbai?', add its filters to last_filters. question_values gives the exact literal for values named in the question ("columns": it occurs in several; pick one).
+
 You MUST follow this output contract:
 {SQL_JSON_SPEC.format(table_view=table_view, max_rows=max_rows, max_days=400)}
 
@@ -58,7 +62,7 @@ The previous SQL failed or returned unusable output.
 
 Given:
 1) The user's question
-2) The previous SQL
+2) The previous SQL (your last answer, or quoted below)
 3) The error message OR why the output is unusable
 
 Return ONLY valid JSON in the same format, with a corrected SQL.
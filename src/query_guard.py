@@ -0,0 +1,144 @@
+from __future__ import annotations
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import duckdb
+
+# Physical operators whose output can be the product of their inputs; DuckDB
+# prints no estimate for them, so one is derived from the children.
+PRODUCT_JOINS = ("CROSS_PRODUCT", "NESTED_LOOP_JOIN", "BLOCKWISE_NL_JOIN", "PIECEWISE_MERGE_JOIN")
+BOX_WIDTH = 29
+_EC = re.compile(r"EC:\s*(\d+)")
+
+
+class QueryRejected(Exception):
+    """
+    Structured execution failure. `kind` is "timeout", "too_expensive" or
+    "out_of_memory"; str() is written for the refine prompt so the LLM knows
+    to produce a cheaper query rather than fix syntax.
+    """
+
+    HINT = ("Rewrite it to be cheaper: filter by date_parsed early, aggregate before joining, "
+            "and avoid self-joins, cross joins and very high-cardinality GROUP BYs.")
+
+    def __init__(self, kind: str, detail: str):
+        self.kind = kind
+        self.detail = detail
+        super().__init__(f"{detail} {self.HINT}")
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"error": self.kind, "detail": self.detail}
+
+
+@dataclass
+class PlanNode:
+    name: str
+    estimate: Optional[int]
+    row: int
+    col: int
+    children: List["PlanNode"] = field(default_factory=list)
+
+
+def parse_explain(text: str) -> Optional[PlanNode]:
+    """
+    Rebuild the operator tree from DuckDB's box-drawing EXPLAIN output.
+    Boxes are BOX_WIDTH columns wide; a node's children are the boxes on the
+    next row from its own column up to where its right-hand neighbour starts.
+    """
+    lines = text.splitlines()
+    boxes: Dict[int, List[PlanNode]] = {}
+    row = -1
+    for i, line in enumerate(lines):
+        starts = [m.start() for m in re.finditer("┌", line)]
+        if not starts:
+            continue
+        row += 1
+        for x in starts:
+            content = []
+            for below in lines[i + 1:]:
+                seg = below[x:x + BOX_WIDTH]
+                if seg.startswith("└"):
+                    break
+                content.append(seg.strip("│ ├┐┤─"))
+            body = " ".join(content)
+            m = _EC.search(body.replace(" ", "").replace("EC:", " EC: "))
+            name = next((c.strip() for c in content if c.strip()), "")
+            boxes.setdefault(row, []).append(PlanNode(name, int(m.group(1)) if m else None, row, x // BOX_WIDTH))
+    if not boxes:
+        return None
+    for r, nodes in boxes.items():
+        below = boxes.get(r + 1, [])
+        for k, node in enumerate(nodes):
+            right = nodes[k + 1].col if k + 1 < len(nodes) else float("inf")
+            node.children = [c for c in below if node.col <= c.col < right]
+    return boxes[0][0]
+
+
+def max_intermediate_rows(node: PlanNode) -> int:
+    """Largest estimated row count anywhere in the plan."""
+    worst = 0
+
+    def est(n: PlanNode) -> int:
+        nonlocal worst
+        kids = [est(c) for c in n.children]
+        if n.estimate is not None:
+            value = n.estimate
+        elif n.name.startswith(PRODUCT_JOINS) and kids:
+            value = 1
+            for k in kids:
+                value *= max(k, 1)
+        else:
+            value = max(kids, default=0)
+        worst = max(worst, value)
+        return value
+
+    est(node)
+    return worst
+
+
+def estimate_rows(cur: duckdb.DuckDBPyConnection, sql: str) -> Optional[int]:
+    rows = cur.execute(f"EXPLAIN {sql}").fetchall()
+    plan = parse_explain(rows[-1][1]) if rows else None
+    return max_intermediate_rows(plan) if plan else None
+
+
+def check_plan(cur: duckdb.DuckDBPyConnection, sql: str, max_rows: int) -> None:
+    if max_rows <= 0:
+        return
+    est = estimate_rows(cur, sql)
+    if est is not None and est > max_rows:
+        raise QueryRejected(
+            "too_expensive",
+            f"Query rejected before running: the plan is estimated to produce ~{est:,} intermediate rows (limit {max_rows:,}).",
+        )
+
+
+def run_with_timeout(
+    cur: duckdb.DuckDBPyConnection,
+    sql: str,
+    timeout_s: float,
+    fetch: Callable[[duckdb.DuckDBPyConnection], Any] = lambda c: c.df(),
+) -> Any:
+    """
+    Execute on `cur` and return what `fetch` makes of the result (a
+    DataFrame by default), interrupting it from a watchdog timer once the
+    wall-clock budget is spent. The budget covers fetching, since streamed
+    results keep executing while they are read. The cursor stays usable
+    after an interrupt.
+    """
+    timer = threading.Timer(timeout_s, cur.interrupt) if timeout_s > 0 else None
+    if timer is not None:
+        timer.daemon = True
+        timer.start()
+    try:
+        cur.execute(sql)
+        return fetch(cur)
+    except duckdb.InterruptException:
+        raise QueryRejected("timeout", f"Query timed out after {timeout_s:g}s and was cancelled.") from None
+    except duckdb.OutOfMemoryException as e:
+        raise QueryRejected("out_of_memory", f"Query ran out of memory ({e}).") from None
+    finally:
+        if timer is not None:
+            timer.cancel()
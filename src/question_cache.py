@@ -0,0 +1,204 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .value_index import ValueIndex
+
+PAYLOAD_FIELDS = ("analysis_plan", "sql", "result_interpretation", "assumptions", "followups")
+_PUNCT = re.compile(r"[^\w\s<>\-]")
+_NUMBER = re.compile(r"(?<![\w<])\d+(?:\.\d+)?(?![\w>])")
+
+
+def _slot(i: int) -> str:
+    return "{{slot:%d}}" % i
+
+
+class QuestionCache:
+    """
+    Persistent (question template, conversation filters) -> validated LLM
+    payload. Questions are normalized (case, punctuation, whitespace) and
+    their numbers and known entity values become typed slots, so "last 15
+    days in Mumbai" and "Last 7 days in Delhi?" share one entry; the stored
+    SQL is re-filled with the new values. Entries are tagged with a hash of
+    the system prompt (schema + rules), the per-question prompt template and
+    the model names, and dropped when any of them changes.
+    """
+
+    def __init__(self, path: str, prompt_version: str, values: ValueIndex, enabled: bool = True):
+        self.prompt_version = prompt_version
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "skipped": 0, "saved_ms": 0.0}
+        self.values = values
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS question_cache (
+                    key TEXT PRIMARY KEY,
+                    prompt_version TEXT,
+                    template TEXT,
+                    payload TEXT,
+                    llm_ms REAL,
+                    hits INTEGER DEFAULT 0,
+                    created_at REAL
+                )
+            """)
+            self.db.execute("DELETE FROM question_cache WHERE prompt_version <> ?", [prompt_version])
+            self.db.commit()
+
+    # -- normalization ----------------------------------------------------
+
+    def normalize(self, question: str) -> Tuple[str, List[Tuple[str, str]]]:
+        """Return (template, slots); slots are (kind, value) in question order."""
+        text = " ".join(question.lower().split())
+        found: List[Tuple[int, int, str, str]] = []
+        for m in self.values.matches(text):
+            found.append((m.start, m.end, m.column, m.value))
+        taken = [(a, b) for a, b, _, _ in found]
+        for m in _NUMBER.finditer(text):
+            if not any(a <= m.start() < b for a, b in taken):
+                found.append((m.start(), m.end(), "n", m.group(0)))
+        found.sort()
+
+        parts, slots, last = [], [], 0
+        for start, end, kind, value in found:
+            parts.append(text[last:start])
+            parts.append(f"<{kind}>")
+            slots.append((kind, value))
+            last = end
+        parts.append(text[last:])
+        template = _PUNCT.sub(" ", "".join(parts))
+        return " ".join(template.split()), slots
+
+    def _key(self, template: str, filters: Dict[str, Any], last_question: Optional[str]) -> str:
+        # The LLM also sees the previous question, so follow-ups ("what about
+        # web?") only share an entry when asked after the same question.
+        prev = " ".join((last_question or "").lower().split())
+        raw = json.dumps([self.prompt_version, template, filters, prev], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    # -- templating -------------------------------------------------------
+
+    @staticmethod
+    def _slot_pattern(kind: str, value: str) -> re.Pattern:
+        if kind == "n":
+            return re.compile(rf"(?<![\w.]){re.escape(value)}(?![\w.])")
+        return re.compile(rf"'{re.escape(value)}'", re.IGNORECASE)
+
+    def _templatize(self, payload: Dict[str, Any], slots: List[Tuple[str, str]]) -> Optional[Dict[str, Any]]:
+        # Only cache when every slot maps unambiguously onto the SQL: each value
+        # is distinct, and numbers occur exactly once (so "last 1 day" can't be
+        # confused with LIMIT 1). Otherwise re-filling could change meaning.
+        values = [v.lower() for _, v in slots]
+        if len(set(values)) != len(values):
+            return None
+        sql = payload["sql"]
+        for i, (kind, value) in enumerate(slots):
+            pat = self._slot_pattern(kind, value)
+            hits = len(pat.findall(sql))
+            if hits == 0 or (kind == "n" and hits != 1):
+                return None
+            repl = _slot(i) if kind == "n" else f"'{_slot(i)}'"
+            sql = pat.sub(lambda _m: repl, sql)
+        out = dict(payload, sql=sql)
+        for field in ("analysis_plan", "result_interpretation", "assumptions", "followups"):
+            out[field] = self._sub_text(payload.get(field), slots)
+        return out
+
+    def _sub_text(self, value: Any, slots: List[Tuple[str, str]]) -> Any:
+        if isinstance(value, list):
+            return [self._sub_text(v, slots) for v in value]
+        if not isinstance(value, str):
+            return value
+        for i, (kind, v) in enumerate(slots):
+            pat = re.compile(rf"(?<![\w.]){re.escape(v)}(?![\w.])", 0 if kind == "n" else re.IGNORECASE)
+            value = pat.sub(lambda _m: _slot(i), value)
+        return value
+
+    @staticmethod
+    def _fill(value: Any, slots: List[Tuple[str, str]]) -> Any:
+        if isinstance(value, list):
+            return [QuestionCache._fill(v, slots) for v in value]
+        if not isinstance(value, str):
+            return value
+        for i, (kind, v) in enumerate(slots):
+            value = value.replace(_slot(i), v.replace("'", "''") if kind != "n" else v)
+        return value
+
+    # -- public API -------------------------------------------------------
+
+    def lookup(self, question: str, filters: Dict[str, Any], last_question: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        template, slots = self.normalize(question)
+        key = self._key(template, filters, last_question)
+        with self._lock:
+            row = self.db.execute(
+                "SELECT payload, llm_ms FROM question_cache WHERE key = ?", [key]
+            ).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self.db.execute("UPDATE question_cache SET hits = hits + 1 WHERE key = ?", [key])
+            self.db.commit()
+            self.stats["hits"] += 1
+            self.stats["saved_ms"] += row[1] or 0.0
+        stored = json.loads(row[0])
+        return {f: self._fill(stored.get(f), slots) for f in PAYLOAD_FIELDS}
+
+    def store(
+        self,
+        question: str,
+        filters: Dict[str, Any],
+        last_question: Optional[str],
+        payload: Dict[str, Any],
+        llm_ms: float,
+    ) -> bool:
+        if not self.enabled:
+            return False
+        template, slots = self.normalize(question)
+        if not isinstance(payload.get("sql"), str):
+            return False
+        stored = self._templatize({f: payload.get(f) for f in PAYLOAD_FIELDS}, slots)
+        if stored is None:
+            with self._lock:
+                self.stats["skipped"] += 1
+            return False
+        with self._lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO question_cache (key, prompt_version, template, payload, llm_ms, hits, created_at) "
+                "VALUES (?, ?, ?, ?, ?, 0, ?)",
+                [self._key(template, filters, last_question), self.prompt_version, template, json.dumps(stored), llm_ms, time.time()],
+            )
+            self.db.commit()
+            self.stats["stores"] += 1
+        return True
+
+    def discard(self, question: str, filters: Dict[str, Any], last_question: Optional[str] = None) -> None:
+        template, _ = self.normalize(question)
+        with self._lock:
+            self.db.execute("DELETE FROM question_cache WHERE key = ?", [self._key(template, filters, last_question)])
+            self.db.commit()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self.db.execute("SELECT COUNT(*) FROM question_cache").fetchone()[0]
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": entries,
+                "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+            }
+
+
+def prompt_version(*parts: str) -> str:
+    """Hash of everything that shapes the model's answer: prompts, schema, model names."""
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()[:16]
@@ -0,0 +1,210 @@
+from __future__ import annotations
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .arrow_result import QueryResult
+from .config import SETTINGS
+
+_TOKEN = re.compile(
+    r"""
+    (?P<ws>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<qident>"(?:[^"]|"")*")
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?)
+  | (?P<op>::|<=|>=|<>|!=|\|\||.)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+# Words that can follow a relation name in FROM/JOIN without being its alias.
+_NOT_AN_ALIAS = {
+    "where", "group", "order", "limit", "having", "join", "left", "right", "inner", "outer",
+    "full", "cross", "natural", "on", "using", "union", "except", "intersect", "window",
+    "qualify", "as", "offset", "using", "tablesample", "positional", "asof", "anti", "semi",
+}
+
+# Words after which the next identifier starts an expression (so it can't be
+# an AS-less column alias), and words that are never aliases themselves.
+_EXPR_LEADERS = {
+    "select", "distinct", "by", "and", "or", "not", "on", "where", "having", "when", "then",
+    "else", "in", "is", "like", "ilike", "between", "case", "interval", "all", "any", "limit",
+    "offset", "from", "join", "with", "over", "partition", "filter", "exists", "as", "using",
+}
+_NEVER_ALIAS = {"desc", "asc", "nulls", "first", "last", "from", "where", "group", "order", "limit", "end"}
+
+
+def canonicalize_sql(sql: str, reserved: Iterable[str] = ()) -> Tuple[str, List[str]]:
+    """
+    Canonical text for cache keys: comments and whitespace dropped, keywords
+    and identifiers lower-cased (DuckDB identifiers are case-insensitive),
+    string literals kept verbatim, and aliases / CTE names renamed to _a0,
+    _a1... in order of definition. Names in `reserved` (schema columns,
+    relations) are never renamed, so two different column references can't
+    collapse to the same key. Returns (canonical, aliases in order).
+    """
+    reserved = {r.lower() for r in reserved}
+    tokens: List[Tuple[str, str]] = []
+    for m in _TOKEN.finditer(sql):
+        kind = m.lastgroup
+        if kind in ("ws", "comment"):
+            continue
+        text = m.group(0)
+        if kind == "qident":
+            kind, text = "ident", text[1:-1].replace('""', '"')
+        if kind == "ident":
+            text = text.lower()
+        tokens.append((kind, text))
+    while tokens and tokens[-1] == ("op", ";"):
+        tokens.pop()
+
+    aliases: List[str] = []
+    optional_as: set = set()  # `x AS alias` and `x alias` are the same query
+    parens: List[str] = []  # token before each open "(", to spot CAST(x AS type)
+    for i, (kind, text) in enumerate(tokens):
+        if text == "(":
+            parens.append(tokens[i - 1][1] if i else "")
+        elif text == ")" and parens:
+            parens.pop()
+        if kind != "ident" or i == 0:
+            continue
+        prev = tokens[i - 1][1]
+        nxt = tokens[i + 1][1] if i + 1 < len(tokens) else ""
+        nxt2 = tokens[i + 2][1] if i + 2 < len(tokens) else ""
+        name = None
+        if prev == "as" and nxt != "(":
+            if not (parens and parens[-1] in ("cast", "try_cast")):
+                name = text  # column or table alias
+                optional_as.add(i - 1)
+        elif prev in ("with", "recursive", ",") and nxt == "as" and nxt2 == "(":
+            name = text  # CTE name
+        elif i >= 2 and tokens[i - 2][1] in ("from", "join") and tokens[i - 1][0] == "ident":
+            if text not in _NOT_AN_ALIAS:
+                name = text  # FROM relation alias without AS
+        elif nxt in (",", "from") and text not in _NEVER_ALIAS and (
+            prev == ")" or (tokens[i - 1][0] in ("ident", "number", "string") and prev not in _EXPR_LEADERS)
+        ):
+            name = text  # column alias without AS: `SUM(x) total,` / `city c FROM`
+        if name and name not in reserved and name not in aliases:
+            aliases.append(name)
+
+    mapping: Dict[str, str] = {a: f"_a{i}" for i, a in enumerate(aliases)}
+    # A name followed by "(" is a function call even when an alias shares it (`SUM(x) AS sum`).
+    out = [
+        mapping.get(t, t) if k == "ident" and (i + 1 == len(tokens) or tokens[i + 1][1] != "(") else t
+        for i, (k, t) in enumerate(tokens) if i not in optional_as
+    ]
+    return " ".join(out), aliases
+
+
+@dataclass
+class _Entry:
+    result: QueryResult
+    aliases: List[str]
+    nbytes: int
+
+
+class ResultCache:
+    """
+    Bounded LRU of query results keyed by (canonical SQL, data version),
+    evicting by entry count and total bytes. Thread-safe; one instance is
+    shared by every session using the agent. Only the bounded head of each
+    result is held (QueryResult), so a large result costs no more than a
+    small one; Arrow tables are immutable, so entries are shared safely.
+    Identical queries arriving while one is still running wait for it
+    instead of running again (single_flight).
+    """
+
+    def __init__(
+        self,
+        reserved: Iterable[str] = (),
+        max_entries: int = SETTINGS.result_cache_entries,
+        max_bytes: int = SETTINGS.result_cache_mb * 1024 * 1024,
+    ):
+        self.reserved = {r.lower() for r in reserved}
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[Tuple[str, str], Future] = {}
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "joined": 0}
+
+    def key(self, sql: str, data_version: str) -> Tuple[Tuple[str, str], List[str]]:
+        canonical, aliases = canonicalize_sql(sql, self.reserved)
+        return (canonical, data_version), aliases
+
+    def get(self, sql: str, data_version: str) -> Optional[QueryResult]:
+        key, aliases = self.key(sql, data_version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+        # Same query with different alias spellings: present the caller's names.
+        rename = {old: new for old, new in zip(entry.aliases, aliases) if old != new}
+        return entry.result.rename(rename)
+
+    def put(self, sql: str, data_version: str, result: QueryResult) -> None:
+        key, aliases = self.key(sql, data_version)
+        nbytes = result.nbytes
+        if nbytes > self.max_bytes or self.max_entries <= 0:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[key] = _Entry(result=result, aliases=aliases, nbytes=nbytes)
+            self._bytes += nbytes
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.stats["evictions"] += 1
+
+    def single_flight(
+        self, sql: str, data_version: str, run: Callable[[], QueryResult]
+    ) -> Tuple[QueryResult, bool]:
+        """
+        run() unless the same (canonical SQL, version) is already running, in
+        which case wait for that run and share its result (or its error).
+        Returns (result, shared).
+        """
+        key, aliases = self.key(sql, data_version)
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = Future()
+            else:
+                self.stats["joined"] += 1
+        if not leader:
+            result, leader_aliases = flight.result()
+            rename = {old: new for old, new in zip(leader_aliases, aliases) if old != new}
+            return result.rename(rename), True
+        try:
+            result = run()
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set_result((result, aliases))
+            return result, False
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries), "bytes": self._bytes, "in_flight": len(self._inflight)}
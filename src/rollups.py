@@ -0,0 +1,297 @@
+from __future__ import annotations
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import duckdb
+
+from .schema_reader import TableSchema
+from .sql_analyzer import parse_sql_tree
+
+ROLLUP_REGISTRY = "_rollups"
+DATE_COLUMNS = ("date_parsed", "date")
+NUMERIC_TYPES = {"FLOAT", "FLOAT64", "DOUBLE", "NUMERIC", "INTEGER", "INT64", "BIGINT"}
+
+
+@dataclass(frozen=True)
+class Rollup:
+    name: str
+    dims: Tuple[str, ...]
+    row_count: int
+
+
+def parse_rollup_spec(spec: str) -> List[Tuple[str, ...]]:
+    # "city;platform;city,platform" -> [("city",), ("platform",), ("city", "platform")]
+    out: List[Tuple[str, ...]] = []
+    for group in spec.split(";"):
+        dims = tuple(sorted(d.strip() for d in group.split(",") if d.strip()))
+        if dims not in out:
+            out.append(dims)
+    if () not in out:
+        out.insert(0, ())  # daily totals, for questions without a dimension
+    return out
+
+def metric_columns(schema: TableSchema) -> List[str]:
+    return [c.name for c in schema.columns if c.dtype.strip().upper() in NUMERIC_TYPES]
+
+def rollup_name(table_name: str, dims: Sequence[str]) -> str:
+    return f"{table_name}_rollup__" + ("__".join(dims) if dims else "daily")
+
+def _select_list(dims: Sequence[str], metrics: Sequence[str]) -> str:
+    # Dimensions are stored as VARCHAR so ENUM widening on the base table
+    # never invalidates a rollup.
+    parts = ["date_parsed", "date"]
+    parts += [f'CAST("{d}" AS VARCHAR) AS "{d}"' for d in dims]
+    parts += [f'SUM("{m}") AS "{m}"' for m in metrics]
+    parts.append("COUNT(*) AS _source_rows")
+    return ", ".join(parts)
+
+def build_rollups(con: duckdb.DuckDBPyConnection, table_name: str, schema: TableSchema, spec: str) -> List[Rollup]:
+    """(Re)build every rollup in spec from the base table and record them in the registry."""
+    metrics = metric_columns(schema)
+    known = {c.name for c in schema.columns}
+    rollups: List[Rollup] = []
+    for dims in parse_rollup_spec(spec):
+        if not set(dims) <= known:
+            continue
+        name = rollup_name(table_name, dims)
+        con.execute(f"""
+            CREATE OR REPLACE TABLE {name} AS
+            SELECT {_select_list(dims, metrics)}
+            FROM {table_name}
+            GROUP BY ALL
+            ORDER BY date_parsed
+        """)
+        rows = con.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+        rollups.append(Rollup(name=name, dims=dims, row_count=rows))
+    con.execute(f"CREATE OR REPLACE TABLE {ROLLUP_REGISTRY} (name VARCHAR, base VARCHAR, dims VARCHAR[], row_count BIGINT)")
+    for r in rollups:
+        con.execute(f"INSERT INTO {ROLLUP_REGISTRY} VALUES (?, ?, ?, ?)", [r.name, table_name, list(r.dims), r.row_count])
+    return rollups
+
+def refresh_rollups(con: duckdb.DuckDBPyConnection, table_name: str, schema: TableSchema, dates: List[Any]) -> None:
+    """Recompute only the given dates in every registered rollup (incremental ingest)."""
+    if not dates:
+        return
+    metrics = metric_columns(schema)
+    for r in load_registry(con, table_name):
+        con.execute("BEGIN TRANSACTION")
+        try:
+            con.execute(f"DELETE FROM {r.name} WHERE list_contains(?, date_parsed)", [dates])
+            con.execute(f"""
+                INSERT INTO {r.name}
+                SELECT {_select_list(r.dims, metrics)}
+                FROM {table_name}
+                WHERE list_contains(?, date_parsed)
+                GROUP BY ALL
+            """, [dates])
+            con.execute(f"UPDATE {ROLLUP_REGISTRY} SET row_count = (SELECT COUNT(*) FROM {r.name}) WHERE name = ?", [r.name])
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+
+def load_registry(con: duckdb.DuckDBPyConnection, table_name: str) -> List[Rollup]:
+    try:
+        rows = con.execute(
+            f"SELECT name, dims, row_count FROM {ROLLUP_REGISTRY} WHERE base = ? ORDER BY row_count",
+            [table_name],
+        ).fetchall()
+    except duckdb.CatalogException:
+        return []
+    return [Rollup(name=r[0], dims=tuple(r[1]), row_count=r[2]) for r in rows]
+
+
+# ---------------------------------------------------------------------------
+# Routing: decide from DuckDB's own parse tree (json_serialize_sql) whether a
+# generated query can be answered from a rollup. Conservative by design:
+# anything we can't prove equivalent goes to the base relation unchanged.
+# ---------------------------------------------------------------------------
+
+# Aggregates whose result changes when raw rows are pre-summed per day/dims.
+UNSAFE_AGGREGATES = {
+    "count_star", "avg", "mean", "median", "mode", "quantile", "quantile_cont", "quantile_disc",
+    "stddev", "stddev_pop", "stddev_samp", "variance", "var_pop", "var_samp", "product",
+    "string_agg", "list", "array_agg", "histogram", "approx_quantile", "approx_count_distinct",
+    "arg_max", "arg_min", "argmax", "argmin", "max_by", "min_by", "first", "last", "any_value",
+    "corr", "covar_pop", "covar_samp", "entropy", "kurtosis", "skewness", "fsum", "sumkahan", "kahan_sum",
+    "favg", "bit_and", "bit_or", "bit_xor", "bool_and", "bool_or", "count_if", "sum_no_overflow",
+}
+
+
+def iter_nodes(obj: Any):
+    if isinstance(obj, dict):
+        yield obj
+        for v in obj.values():
+            yield from iter_nodes(v)
+    elif isinstance(obj, list):
+        for v in obj:
+            yield from iter_nodes(v)
+
+
+class _ScopeCheck:
+    """Validates one SELECT node that reads the base relation."""
+
+    def __init__(self, router: "RollupRouter", aliases: Set[str]):
+        self.router = router
+        self.aliases = aliases
+        self.dims: Set[str] = set()
+        self.ok = True
+        self.has_agg = False
+        self.bare_ref = False
+
+    def expr(self, e: Any, agg: Optional[str] = None, top: bool = False) -> None:
+        if not self.ok:
+            return
+        if isinstance(e, list):
+            for x in e:
+                self.expr(x, agg, top)
+            return
+        if not isinstance(e, dict):
+            return
+        cls = e.get("class")
+        if cls == "SUBQUERY":
+            return  # its own scope, visited separately
+        if cls == "STAR":
+            self.ok = False
+            return
+        if cls == "COLUMN_REF":
+            name = str(e["column_names"][-1]).lower()
+            if name in self.router.metrics:
+                self.ok = agg == "sum"
+            elif name in self.router.dims:
+                self.dims.add(name)
+            elif name not in DATE_COLUMNS and name not in self.aliases:
+                self.ok = False  # unknown: let the base relation raise the real error
+            if agg is None and top:
+                self.bare_ref = True
+            return
+        if cls == "FUNCTION" and agg is None:
+            fname = str(e.get("function_name", "")).lower()
+            if fname in UNSAFE_AGGREGATES:
+                self.ok = False
+                return
+            if fname in ("sum", "min", "max", "count"):
+                self.has_agg = True
+                if fname == "count" and not e.get("distinct"):
+                    self.ok = False
+                    return
+                if fname == "sum" and e.get("distinct"):
+                    self.ok = False  # distinct values of per-day sums are not the raw rows' values
+                    return
+                # SUM(metric) must be applied to the bare column; MIN/MAX/COUNT
+                # DISTINCT only make sense on dimensions and dates.
+                inner = fname
+                children = e.get("children", [])
+                if inner == "sum" and not all(c.get("class") == "COLUMN_REF" for c in children):
+                    inner = "sum_expr"
+                self.expr(children, inner)
+                self.expr(e.get("filter"), None)
+                self.expr(e.get("order_bys"), None)
+                return
+        for v in e.values():
+            if isinstance(v, (dict, list)):
+                self.expr(v, agg if cls != "WINDOW" else None, top)
+
+
+class RollupRouter:
+    def __init__(self, con: duckdb.DuckDBPyConnection, schema: TableSchema, table_name: str, relations: Sequence[str]):
+        self.con = con.cursor()
+        self.table_name = table_name
+        self.relations = {r.lower() for r in relations}
+        self.metrics = {m.lower() for m in metric_columns(schema)}
+        self.dims = {c.name.lower() for c in schema.columns} - self.metrics - set(DATE_COLUMNS)
+        self._lock = threading.Lock()
+        self.rollups: List[Rollup] = []
+        self.stats = {"routed": 0, "base": 0}
+        self.reload()
+
+    def reload(self) -> None:
+        with self._lock:
+            self.rollups = load_registry(self.con, self.table_name)
+
+    def _base_tables(self, from_table: Any) -> Tuple[List[Dict[str, Any]], bool]:
+        # Base-relation refs directly in this FROM (not inside subqueries), and
+        # whether the FROM is anything other than a single plain table.
+        refs: List[Dict[str, Any]] = []
+        complex_from = False
+        stack = [from_table]
+        while stack:
+            t = stack.pop()
+            if not isinstance(t, dict):
+                continue
+            if t.get("type") == "BASE_TABLE":
+                if str(t.get("table_name", "")).lower() in self.relations:
+                    refs.append(t)
+                    if t.get("sample"):
+                        complex_from = True
+            elif t.get("type") == "JOIN":
+                complex_from = True
+                stack += [t.get("left"), t.get("right")]
+        return refs, complex_from
+
+    def analyze(self, sql: str) -> Tuple[Optional[Set[str]], List[int]]:
+        """
+        Return (dimensions touched, byte offsets of base-relation refs), or
+        (None, []) if some scope over the base relation isn't rollup-safe.
+        """
+        with self._lock:
+            tree = parse_sql_tree(self.con, sql)
+        if tree is None or len(tree.get("statements", [])) != 1:
+            return None, []
+        dims: Set[str] = set()
+        locations: List[int] = []
+        for node in iter_nodes(tree):
+            if node.get("type") != "SELECT_NODE":
+                continue
+            refs, complex_from = self._base_tables(node.get("from_table"))
+            if not refs:
+                continue
+            if complex_from:
+                return None, []
+            aliases = {str(x.get("alias", "")).lower() for x in node.get("select_list", []) if x.get("alias")}
+            check = _ScopeCheck(self, aliases)
+            check.expr(node.get("select_list"), top=True)
+            for key in ("where_clause", "group_expressions", "having", "qualify", "modifiers"):
+                check.expr(node.get(key))
+            distinct = any(m.get("type") == "DISTINCT_MODIFIER" for m in node.get("modifiers", []))
+            grouped = bool(node.get("group_expressions"))
+            # Without GROUP BY/DISTINCT the scope must be a pure aggregate,
+            # otherwise row multiplicity differs between base and rollup.
+            if not check.ok or not (grouped or distinct or (check.has_agg and not check.bare_ref)):
+                return None, []
+            dims |= check.dims
+            locations += [r["query_location"] for r in refs]
+        return dims, locations
+
+    def pick(self, sql: str) -> Tuple[Optional[Rollup], List[int]]:
+        dims, locations = self.analyze(sql)
+        if dims is None or not locations:
+            return None, []
+        with self._lock:
+            candidates = [r for r in self.rollups if dims <= set(r.dims)]
+        if not candidates:
+            return None, []
+        return min(candidates, key=lambda r: r.row_count), locations
+
+    def route(self, sql: str) -> str:
+        """Return sql pointed at the smallest rollup that answers it, else sql unchanged."""
+        rollup, locations = self.pick(sql)
+        if rollup is None:
+            self.stats["base"] += 1
+            return sql
+        self.stats["routed"] += 1
+        return replace_relations(sql, locations, rollup.name)
+
+
+_RELATION_AT = re.compile(rb'(?:"?[A-Za-z_][A-Za-z0-9_]*"?\.)*"?[A-Za-z_][A-Za-z0-9_]*"?')
+
+def replace_relations(sql: str, locations: List[int], target: str) -> str:
+    # Parser locations are byte offsets into the UTF-8 text.
+    buf = sql.encode("utf-8")
+    for loc in sorted(locations, reverse=True):
+        m = _RELATION_AT.match(buf, loc)
+        if m:
+            buf = buf[:loc] + target.encode("utf-8") + buf[m.end():]
+    return buf.decode("utf-8")
@@ -0,0 +1,367 @@
+from __future__ import annotations
+import math
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from statistics import NormalDist
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import duckdb
+import pyarrow as pa
+
+from .arrow_result import QueryResult, fetch_bounded
+from .config import SETTINGS
+from .query_guard import run_with_timeout
+from .rollups import DATE_COLUMNS, RollupRouter, iter_nodes, metric_columns, replace_relations
+from .schema_reader import TableSchema
+from .sql_analyzer import parse_sql_tree
+
+SAMPLE_REGISTRY = "_samples"
+STRATA = ("date_parsed", "city")
+# Aggregates that are exact on the sample only over stratum columns (every
+# (date, city) is in it); over anything else they would under-count.
+STRATUM_ONLY = {"min", "max", "count"}
+
+
+@dataclass(frozen=True)
+class Sample:
+    name: str
+    rate: float
+    min_per_stratum: int
+    replicates: int
+    base_rows: int
+    rows: int
+    strata: int
+    built_at: float
+
+    @property
+    def fraction(self) -> float:
+        return self.rows / self.base_rows if self.base_rows else 0.0
+
+
+def sample_name(table_name: str) -> str:
+    return f"{table_name}_sample"
+
+def estimate_view(table_name: str) -> str:
+    return f"{sample_name(table_name)}_est"
+
+def replicate_view(table_name: str, r: int) -> str:
+    return f"{sample_name(table_name)}_rep{r}"
+
+def _strata(schema: TableSchema) -> List[str]:
+    names = {c.name for c in schema.columns} | {"date_parsed"}
+    return [s for s in STRATA if s in names]
+
+def _draw_sql(view: str, strata: List[str], rate: float, min_per_stratum: int, replicates: int, where: str = "") -> str:
+    """
+    Up to max(min_per_stratum, rate * N_h) random rows of every stratum,
+    with the stratum's size N_h and draw n_h (the weight is N_h / n_h).
+    Rows are dealt round-robin into `replicates` groups along the stratum
+    order, so every group spans every part of the data.
+    """
+    part = ", ".join(f'"{s}"' for s in strata)
+    take = f"GREATEST({int(min_per_stratum)}, CEIL(_stratum_rows * {float(rate)!r}))"
+    return f"""
+        WITH ranked AS (
+            SELECT *,
+                   COUNT(*) OVER (PARTITION BY {part}) AS _stratum_rows,
+                   ROW_NUMBER() OVER (PARTITION BY {part} ORDER BY random()) AS _draw
+            FROM {view} {where}
+        )
+        SELECT * EXCLUDE (_draw),
+               LEAST(_stratum_rows, {take})::BIGINT AS _stratum_sample,
+               (ROW_NUMBER() OVER (ORDER BY {part}, _draw) - 1) % {int(replicates)} AS _rep
+        FROM ranked
+        WHERE _draw <= {take}
+    """
+
+def _create_views(con: duckdb.DuckDBPyConnection, table_name: str, schema: TableSchema, replicates: int) -> None:
+    # Metrics pre-multiplied by the row's weight, so SUM(metric) over a view
+    # is the estimate of the full-data SUM. Replicate r drops group r and
+    # scales the rest of its sampled strata by R / (R - 1) (delete-a-group
+    # jackknife); strata taken whole have no sampling error and keep weight 1.
+    name = sample_name(table_name)
+    scaled = ", ".join(f'CAST("{m}" AS DOUBLE) * _w AS "{m}"' for m in metric_columns(schema))
+    views = [(estimate_view(table_name), "1")]
+    views += [
+        (replicate_view(table_name, r),
+         f"CASE WHEN _stratum_sample = _stratum_rows THEN 1 WHEN _rep = {r} THEN 0 ELSE {replicates / (replicates - 1)!r} END")
+        for r in range(replicates)
+    ]
+    for view, factor in views:
+        con.execute(f"""
+            CREATE OR REPLACE VIEW {view} AS
+            SELECT * EXCLUDE (_stratum_rows, _stratum_sample, _rep, _w) REPLACE ({scaled})
+            FROM (SELECT *, _stratum_rows::DOUBLE / _stratum_sample * {factor} AS _w FROM {name})
+        """)
+
+def _register(con: duckdb.DuckDBPyConnection, table_name: str, strata: List[str],
+              rate: float, min_per_stratum: int, replicates: int) -> Sample:
+    name = sample_name(table_name)
+    part = ", ".join(f'"{s}"' for s in strata)
+    base_rows = con.execute(f"SELECT COUNT(*) FROM {table_name}_v").fetchone()[0]
+    rows, n_strata = con.execute(f"SELECT COUNT(*), COUNT(DISTINCT ({part})) FROM {name}").fetchone()
+    sample = Sample(name, rate, min_per_stratum, replicates, base_rows, rows, n_strata, time.time())
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SAMPLE_REGISTRY} (
+            name VARCHAR, base VARCHAR, rate DOUBLE, min_per_stratum INTEGER, replicates INTEGER,
+            base_rows BIGINT, sample_rows BIGINT, strata BIGINT, built_at DOUBLE
+        )
+    """)
+    con.execute(f"DELETE FROM {SAMPLE_REGISTRY} WHERE base = ?", [table_name])
+    con.execute(
+        f"INSERT INTO {SAMPLE_REGISTRY} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [name, table_name, rate, min_per_stratum, replicates, base_rows, rows, n_strata, sample.built_at],
+    )
+    return sample
+
+def load_sample(con: duckdb.DuckDBPyConnection, table_name: str) -> Optional[Sample]:
+    try:
+        row = con.execute(
+            f"SELECT name, rate, min_per_stratum, replicates, base_rows, sample_rows, strata, built_at "
+            f"FROM {SAMPLE_REGISTRY} WHERE base = ?",
+            [table_name],
+        ).fetchone()
+    except duckdb.CatalogException:
+        return None
+    return Sample(*row) if row else None
+
+def drop_sample(con: duckdb.DuckDBPyConnection, table_name: str) -> None:
+    old = load_sample(con, table_name)
+    if old is None:
+        return
+    for r in range(old.replicates):
+        con.execute(f"DROP VIEW IF EXISTS {replicate_view(table_name, r)}")
+    con.execute(f"DROP VIEW IF EXISTS {estimate_view(table_name)}")
+    con.execute(f"DROP TABLE IF EXISTS {old.name}")
+    con.execute(f"DELETE FROM {SAMPLE_REGISTRY} WHERE base = ?", [table_name])
+
+def build_sample(
+    con: duckdb.DuckDBPyConnection,
+    table_name: str,
+    schema: TableSchema,
+    rate: float = SETTINGS.approx_sample_rate,
+    min_per_stratum: int = SETTINGS.approx_min_per_stratum,
+    replicates: int = SETTINGS.approx_replicates,
+    min_rows: int = SETTINGS.approx_min_rows,
+) -> Optional[Sample]:
+    """(Re)draw the whole stratified sample; none below `min_rows` rows, where exact queries are fast anyway."""
+    rows = con.execute(f"SELECT COUNT(*) FROM {table_name}_v").fetchone()[0]
+    if rows < min_rows:
+        drop_sample(con, table_name)
+        return None
+    old = load_sample(con, table_name)
+    strata = _strata(schema)
+    replicates = max(2, replicates)
+    draw = _draw_sql(f"{table_name}_v", strata, rate, min_per_stratum, replicates)
+    con.execute(f"CREATE OR REPLACE TABLE {sample_name(table_name)} AS {draw} ORDER BY date_parsed")
+    _create_views(con, table_name, schema, replicates)
+    for r in range(replicates, old.replicates if old else 0):
+        con.execute(f"DROP VIEW IF EXISTS {replicate_view(table_name, r)}")
+    return _register(con, table_name, strata, rate, min_per_stratum, replicates)
+
+def refresh_sample(con: duckdb.DuckDBPyConnection, table_name: str, schema: TableSchema, dates: List[Any]) -> Optional[Sample]:
+    """Re-draw only the strata of the given dates (incremental ingest); a changed sample spec re-draws everything."""
+    old = load_sample(con, table_name)
+    spec = (SETTINGS.approx_sample_rate, SETTINGS.approx_min_per_stratum, max(2, SETTINGS.approx_replicates))
+    if old is None or (old.rate, old.min_per_stratum, old.replicates) != spec:
+        return build_sample(con, table_name, schema)
+    if not dates:
+        return old
+    strata = _strata(schema)
+    name = sample_name(table_name)
+    draw = _draw_sql(f"{table_name}_v", strata, *spec, where="WHERE list_contains(?, date_parsed)")
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.execute(f"DELETE FROM {name} WHERE list_contains(?, date_parsed)", [dates])
+        con.execute(f"INSERT INTO {name} {draw}", [dates])
+        sample = _register(con, table_name, strata, *spec)
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return sample
+
+
+def _numeric(t: pa.DataType) -> bool:
+    return pa.types.is_integer(t) or pa.types.is_floating(t) or pa.types.is_decimal(t)
+
+def jackknife_intervals(
+    estimate: pa.Table, replicates: List[pa.Table], confidence: float
+) -> Dict[str, List[Optional[Tuple[float, float]]]]:
+    """
+    Per numeric column, the confidence interval of each row's value from the
+    replicate results: var = (R-1)/R * sum((theta_r - theta)^2). Rows are
+    matched on the non-numeric columns (position among equal keys), so a
+    ratio, a share or any other expression of the sums gets its own
+    interval. None where fewer than two replicates have the row, or where the
+    value doesn't vary (it was computed from strata taken whole).
+    """
+    numeric = [f.name for f in estimate.schema if _numeric(f.type)]
+    keys = [c for c in estimate.column_names if c not in numeric]
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    n_rep = len(replicates)
+
+    def keyed(rows: List[Dict[str, Any]]) -> List[Tuple[Any, ...]]:
+        seen: Counter = Counter()
+        out = []
+        for row in rows:
+            k = tuple(row.get(c) for c in keys)
+            out.append((k, seen[k]))
+            seen[k] += 1
+        return out
+
+    reps = []
+    for t in replicates:
+        rows = t.to_pylist()
+        reps.append(dict(zip(keyed(rows), rows)))
+    rows = estimate.to_pylist()
+    out: Dict[str, List[Optional[Tuple[float, float]]]] = {c: [] for c in numeric}
+    for key, row in zip(keyed(rows), rows):
+        for c in numeric:
+            theta = row[c]
+            values = [float(r[key][c]) for r in reps if key in r and r[key].get(c) is not None]
+            if theta is None or len(values) < 2:
+                out[c].append(None)
+                continue
+            theta = float(theta)
+            var = (n_rep - 1) / len(values) * sum((v - theta) ** 2 for v in values)
+            half = z * math.sqrt(var)
+            out[c].append((theta - half, theta + half) if half > 0 else None)
+    return out
+
+
+@dataclass
+class Approximation:
+    """A query answered from the sample: estimates plus confidence intervals for the preview rows."""
+    result: QueryResult
+    intervals: Dict[str, List[Optional[Tuple[float, float]]]]
+    confidence: float
+    sample_rows: int
+    base_rows: int
+    replicates: int
+    ms: float
+
+    @property
+    def fraction(self) -> float:
+        return self.sample_rows / self.base_rows if self.base_rows else 0.0
+
+
+class Approximator:
+    """
+    Runs a generated query against the maintained stratified sample instead
+    of the base relation: once over the weighted estimate view and once per
+    jackknife replicate, giving estimates and confidence intervals in a
+    small fraction of the exact query's time. Only queries the rollup
+    analysis proves are sums over the base relation qualify (ratios,
+    shares, growth of such sums included), since those are what weighted
+    sample rows estimate without bias.
+    """
+
+    def __init__(self, con: duckdb.DuckDBPyConnection, schema: TableSchema, table_name: str, rollups: RollupRouter,
+                 enabled: bool = True):
+        self.con = con
+        self.schema = schema
+        self.table_name = table_name
+        self.rollups = rollups
+        self.enabled = enabled
+        self.confidence = SETTINGS.approx_confidence
+        self.refresh_s = SETTINGS.approx_sample_refresh_s
+        self.sample: Optional[Sample] = None
+        self._lock = threading.Lock()
+        self._redrawing = False
+        self.stats = {"approximated": 0, "not_applicable": 0, "failed": 0, "redrawn": 0}
+        self.reload()
+
+    def reload(self) -> None:
+        cur = self.con.cursor()
+        try:
+            self.sample = load_sample(cur, self.table_name)
+        finally:
+            cur.close()
+
+    @property
+    def available(self) -> bool:
+        return self.enabled and self.sample is not None
+
+    def plan(self, cur: duckdb.DuckDBPyConnection, run_sql: str) -> Optional[List[str]]:
+        """`run_sql` pointed at the estimate view then each replicate view, or None if it can't be estimated."""
+        sample = self.sample
+        if not self.enabled or sample is None:
+            return None
+        dims, locations = self.rollups.analyze(run_sql)
+        if dims is None or not locations:
+            return None
+        tree = parse_sql_tree(cur, run_sql)
+        allowed = set(STRATA) | set(DATE_COLUMNS)
+        for node in iter_nodes(tree):
+            if node.get("class") == "FUNCTION" and str(node.get("function_name", "")).lower() in STRATUM_ONLY:
+                refs = {str(n["column_names"][-1]).lower() for n in iter_nodes(node.get("children")) if n.get("class") == "COLUMN_REF"}
+                if not refs <= allowed:
+                    return None
+        views = [estimate_view(self.table_name)] + [replicate_view(self.table_name, r) for r in range(sample.replicates)]
+        return [replace_relations(run_sql, locations, v) for v in views]
+
+    def run(self, cur: duckdb.DuckDBPyConnection, run_sql: str, timeout_s: float) -> Optional[Approximation]:
+        t0 = time.perf_counter()
+        sample = self.sample
+        plan = self.plan(cur, run_sql)
+        if plan is None or sample is None:
+            with self._lock:
+                self.stats["not_applicable"] += 1
+            return None
+        try:
+            est = run_with_timeout(cur, plan[0], timeout_s, fetch=lambda c: fetch_bounded(c, SETTINGS.result_preview_rows, plan[0]))
+            reps = [
+                run_with_timeout(cur, sql, timeout_s, fetch=lambda c: fetch_bounded(c, SETTINGS.result_preview_rows).head)
+                for sql in plan[1:]
+            ]
+        except Exception:
+            # The exact query is on its way and will report any real error.
+            with self._lock:
+                self.stats["failed"] += 1
+            return None
+        with self._lock:
+            self.stats["approximated"] += 1
+        return Approximation(
+            result=est,
+            intervals=jackknife_intervals(est.head, reps, self.confidence),
+            confidence=self.confidence,
+            sample_rows=sample.rows,
+            base_rows=sample.base_rows,
+            replicates=len(reps),
+            ms=(time.perf_counter() - t0) * 1000,
+        )
+
+    def maybe_redraw(self, submit: Callable[[Callable[[], None]], Any]) -> None:
+        """Re-draw the sample in the background once it is APPROX_SAMPLE_REFRESH_S old (0: only on ingest)."""
+        sample = self.sample
+        if not self.refresh_s or sample is None or time.time() - sample.built_at < self.refresh_s:
+            return
+        with self._lock:
+            if self._redrawing:
+                return
+            self._redrawing = True
+        submit(self._redraw)
+
+    def _redraw(self) -> None:
+        cur = self.con.cursor()
+        old = self.sample
+        try:
+            self.sample = build_sample(cur, self.table_name, self.schema, old.rate, old.min_per_stratum, old.replicates)
+            with self._lock:
+                self.stats["redrawn"] += 1
+        finally:
+            cur.close()
+            with self._lock:
+                self._redrawing = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        sample = self.sample
+        with self._lock:
+            out: Dict[str, Any] = dict(self.stats)
+        if sample is not None:
+            out.update(sample_rows=sample.rows, base_rows=sample.base_rows, strata=sample.strata,
+                       replicates=sample.replicates, age_s=round(time.time() - sample.built_at, 1))
+        return out
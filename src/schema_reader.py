@@ -23,7 +23,7 @@ class TableSchema:
         return "\n".join(lines)
 
     # MUST be inside the class
-    def to_compact_prompt_text(self, important_only: bool = True) -> str:
+    def to_compact_prompt_text(self, important_only: bool = True, by_type: bool = False) -> str:
         important = {
             "date","gender","platform","city","stage","age_bucket",
             "first_form_utm_medium","first_form_utm_campaign","first_form_utm_source",
@@ -36,6 +36,15 @@ class TableSchema:
         if important_only:
             cols = [c for c in self.columns if c.name in important]
 
+        if by_type:
+            # One line per type: about a third fewer tokens than one line per column.
+            groups: Dict[str, List[str]] = {}
+            for c in cols:
+                groups.setdefault(c.dtype, []).append(c.name)
+            lines = [f"Table: {self.table_name}", "Columns by type:"]
+            lines += [f"- {dtype}: {', '.join(names)}" for dtype, names in groups.items()]
+            return "\n".join(lines)
+
         lines = [f"Table: {self.table_name}", "Columns:"]
         for c in cols:
             lines.append(f"- {c.name} ({c.dtype})")
@@ -47,6 +56,16 @@ def _try_parse_json_schema(raw: str) -> Dict[str, Any] | None:
     except Exception:
         return None
 
+def _parse_markdown_row(line: str) -> ColumnInfo | None:
+    # | Column Name | Type | Mode | Description |
+    cells = [c.strip().strip("`") for c in line.strip().strip("|").split("|")]
+    if len(cells) < 2 or not cells[0] or set(cells[0]) <= set("-: "):
+        return None
+    if cells[0].lower() in {"column name", "column", "name"}:
+        return None
+    desc = cells[3] if len(cells) > 3 and cells[3] else None
+    return ColumnInfo(name=cells[0], dtype=cells[1], description=desc)
+
 def read_schema(schema_path: str, table_name: str) -> TableSchema:
     p = Path(schema_path)
     raw = p.read_text(encoding="utf-8")
@@ -71,12 +90,17 @@ def read_schema(schema_path: str, table_name: str) -> TableSchema:
                 cols.append(ColumnInfo(name=str(k), dtype=str(v)))
             return TableSchema(table_name=table_name, columns=cols)
 
-    # Fallback: treat schema as plain text
+    # Fallback: treat schema as plain text (markdown table or "name: type" lines)
     cols: List[ColumnInfo] = []
     for line in raw.splitlines():
         line = line.strip()
         if not line or line.startswith("#"):
             continue
+        if line.startswith("|"):
+            col = _parse_markdown_row(line)
+            if col:
+                cols.append(col)
+            continue
         if ":" in line:
             left, right = line.split(":", 1)
             name = left.strip().strip("`")
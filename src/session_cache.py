@@ -0,0 +1,272 @@
+from __future__ import annotations
+import itertools
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import duckdb
+
+from .intent import DIMENSIONS, METRICS, TIME_GRAINS, Intent
+
+SESSION_DB = "session_cache"
+_SUM = re.compile(r"SUM\((\w+)\)", re.IGNORECASE)
+# Every column the metric catalog sums, so a follow-up may switch metric.
+COMPONENTS: Tuple[str, ...] = tuple(sorted({c.lower() for _, expr, _ in METRICS.values() for c in _SUM.findall(expr)}))
+
+
+def _sql_str(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+@dataclass(frozen=True)
+class Lineage:
+    """What an intermediate holds: SUMs of `components` per `grain`, over `window_days`, with `filters` applied."""
+
+    grain: Tuple[str, ...]
+    components: Tuple[str, ...]
+    filters: Tuple[Tuple[str, Any], ...]
+    window_days: Optional[int]
+    data_version: str
+
+    def answers(self, intent: Intent, data_version: str) -> bool:
+        if data_version != self.data_version or intent.window_days != self.window_days:
+            return False
+        if intent.dimension is not None and intent.dimension not in self.grain:
+            return False
+        if not {c for m in intent.metrics for c in _SUM.findall(METRICS[m][1].lower())} <= set(self.components):
+            return False
+        applied = dict(self.filters)
+        for col, value in applied.items():
+            if _frozen(intent.filters.get(col)) != value:
+                return False
+        return all(col in applied or col in self.grain for col in intent.filters)
+
+
+def _frozen(value: Any) -> Any:
+    return tuple(value) if isinstance(value, list) else value
+
+
+@dataclass
+class Intermediate:
+    name: str
+    session_id: str
+    lineage: Lineage
+    rows: int
+    created: float
+    hits: int = 0
+
+    @property
+    def applied(self) -> List[str]:
+        return [c for c, _ in self.lineage.filters]
+
+
+class SessionCache:
+    """
+    Per-session intermediate results for follow-up questions. A fast-path
+    (intent) answer is computed via a small table of metric SUMs grouped by
+    its dimension, its filter columns and a few extra low-cardinality
+    dimensions; follow-ups that only add a filter, regroup coarser, switch
+    metric or change top-k are then answered from that table instead of
+    the base data. Intermediates are built in the background after the
+    answer that asked for them, one build per session at a time. Tables live in an in-memory attached database shared by
+    all cursors. Bounded per session and in total rows (global LRU);
+    dropped on reset and when the data version changes.
+    """
+
+    def __init__(
+        self,
+        con: duckdb.DuckDBPyConnection,
+        table_view: str,
+        entities: Dict[str, List[str]],
+        extra_dims: Sequence[str],
+        max_entries: int,
+        max_rows: int,
+        max_total_rows: int,
+        enabled: bool = True,
+    ):
+        self.con = con
+        self.table_view = table_view
+        self.extra_dims = [d for d in extra_dims if d in DIMENSIONS and d not in TIME_GRAINS]
+        self.max_entries = max(1, max_entries)
+        self.max_rows = max_rows
+        self.max_total_rows = max_total_rows
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, Intermediate]" = OrderedDict()
+        self._rows = 0
+        self._ids = itertools.count()
+        self._building: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {"built": 0, "reused": 0, "evicted": 0, "skipped": 0}
+        self.set_entities(entities)
+        if enabled:
+            con.execute(f"ATTACH IF NOT EXISTS ':memory:' AS {SESSION_DB}")
+
+    def set_entities(self, entities: Dict[str, List[str]]) -> None:
+        self._cardinality = {col: max(1, len(vals)) for col, vals in entities.items()}
+
+    # -- lookup -----------------------------------------------------------
+
+    def find(self, session_id: str, intent: Intent, data_version: str, count: bool = True) -> Optional[Intermediate]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            for name, entry in reversed(self._entries.items()):
+                if entry.session_id == session_id and entry.lineage.answers(intent, data_version):
+                    if count:
+                        self._entries.move_to_end(name)
+                        entry.hits += 1
+                        self.stats["reused"] += 1
+                    return entry
+        return None
+
+    def relations(self) -> Set[str]:
+        """Names of the intermediates held now; generated SQL may read them."""
+        with self._lock:
+            return set(self._entries)
+
+    # -- background builds --------------------------------------------------
+
+    def track(self, session_id: str, submit: Callable[[], Future]) -> bool:
+        """Start a build via `submit` unless one is already running for the session."""
+        with self._lock:
+            running = self._building.get(session_id)
+            if running is not None and not running.done():
+                return False
+            future = self._building[session_id] = submit()
+        future.add_done_callback(lambda f: self._built(session_id, f))
+        return True
+
+    def _built(self, session_id: str, future: Future) -> None:
+        with self._lock:
+            if self._building.get(session_id) is future:
+                del self._building[session_id]
+
+    def wait(self, session_id: str, timeout: Optional[float] = None) -> None:
+        """Block until the session's pending build (if any) finishes."""
+        with self._lock:
+            future = self._building.get(session_id)
+        if future is not None:
+            try:
+                future.result(timeout)
+            except Exception:
+                pass
+
+    # -- build ------------------------------------------------------------
+
+    def plan(self, intent: Intent, days: int) -> Optional[Tuple[Tuple[str, ...], Tuple[Tuple[str, Any], ...]]]:
+        """
+        (grain, applied filters) for a new intermediate, or None when even
+        the minimal grain would exceed max_rows. Extra dimensions are added
+        while the estimated group count (product of distinct values) fits.
+        """
+        required = [intent.dimension] if intent.dimension else []
+        for col in intent.filters:
+            if col in self.extra_dims and col not in required:
+                required.append(col)
+
+        def estimate(grain: Sequence[str]) -> int:
+            n = 1
+            for d in grain:
+                n *= days if d == "day" else max(1, days // 7 + 1) if d == "week" else self._cardinality.get(d, 50)
+            return n
+
+        if estimate(required) > self.max_rows:
+            return None
+        grain = list(required)
+        for d in sorted(self.extra_dims, key=lambda d: self._cardinality.get(d, 50)):
+            if d not in grain and estimate(grain + [d]) <= self.max_rows:
+                grain.append(d)
+        applied = tuple(sorted((c, _frozen(v)) for c, v in intent.filters.items() if c not in grain))
+        return tuple(grain), applied
+
+    def select_sql(self, grain: Sequence[str], applied: Sequence[Tuple[str, Any]], window_days: Optional[int]) -> str:
+        """The query an intermediate is materialized from (CREATE TABLE name AS ...)."""
+        select = [DIMENSIONS[d][1] if DIMENSIONS[d][1] == d else f"{DIMENSIONS[d][1]} AS {d}" for d in grain]
+        select += [f"SUM({c}) AS {c}" for c in COMPONENTS]
+        where = []
+        if window_days:
+            where.append(f"date_parsed >= (SELECT MAX(date_parsed) FROM {self.table_view}) - INTERVAL '{window_days} days'")
+        for col, value in applied:
+            if isinstance(value, tuple):
+                where.append(f"{col} IN ({', '.join(_sql_str(x) for x in value)})")
+            else:
+                where.append(f"{col} = {_sql_str(value)}")
+        sql = f"SELECT {', '.join(select)}\nFROM {self.table_view}"
+        if where:
+            sql += "\nWHERE " + "\n  AND ".join(where)
+        if grain:
+            sql += "\nGROUP BY " + ", ".join(DIMENSIONS[d][1] for d in grain)
+        return sql
+
+    def new_name(self, session_id: str) -> str:
+        return f"{SESSION_DB}.s_{re.sub(r'[^0-9a-zA-Z]', '', session_id)[:16]}_{next(self._ids)}"
+
+    def register(self, cur: duckdb.DuckDBPyConnection, entry: Intermediate) -> Optional[Intermediate]:
+        """Track a built table, evicting LRU entries over the limits; returns None if it was too big to keep."""
+        drop: List[str] = []
+        with self._lock:
+            self.stats["built"] += 1
+            if entry.rows > self.max_rows:
+                self.stats["skipped"] += 1
+                drop.append(entry.name)
+                entry = None
+            else:
+                self._entries[entry.name] = entry
+                self._rows += entry.rows
+                mine = [e for e in self._entries.values() if e.session_id == entry.session_id]
+                while len(mine) > self.max_entries:
+                    drop.append(self._pop(mine.pop(0).name))
+                while self._rows > self.max_total_rows and len(self._entries) > 1:
+                    oldest = next(iter(self._entries))
+                    if oldest == entry.name:
+                        break
+                    drop.append(self._pop(oldest))
+        self._drop(cur, drop)
+        return entry
+
+    def _pop(self, name: str) -> str:
+        evicted = self._entries.pop(name)
+        self._rows -= evicted.rows
+        self.stats["evicted"] += 1
+        return name
+
+    @staticmethod
+    def _drop(cur: duckdb.DuckDBPyConnection, names: Sequence[str]) -> None:
+        for name in names:
+            try:
+                cur.execute(f"DROP TABLE IF EXISTS {name}")
+            except duckdb.Error:
+                pass
+
+    # -- cleanup ----------------------------------------------------------
+
+    def drop_session(self, session_id: str) -> int:
+        self.wait(session_id)
+        with self._lock:
+            names = [self._pop(n) for n, e in list(self._entries.items()) if e.session_id == session_id]
+            self.stats["evicted"] -= len(names)  # a reset is not an eviction
+        cur = self.con.cursor()
+        try:
+            self._drop(cur, names)
+        finally:
+            cur.close()
+        return len(names)
+
+    def clear(self) -> None:
+        with self._lock:
+            names = list(self._entries)
+            self._entries.clear()
+            self._rows = 0
+        cur = self.con.cursor()
+        try:
+            self._drop(cur, names)
+        finally:
+            cur.close()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            sessions = {e.session_id for e in self._entries.values()}
+            return {**self.stats, "entries": len(self._entries), "rows": self._rows, "sessions": len(sessions)}
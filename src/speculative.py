@@ -0,0 +1,152 @@
+from __future__ import annotations
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from .llm_ollama import OllamaClient
+
+
+@dataclass
+class Candidate:
+    index: int
+    temperature: float
+    reply: str = ""
+    payload: Dict[str, Any] = field(default_factory=dict)
+    sql: str = ""
+    # Why the candidate can't run (parse, guard or EXPLAIN error); None when valid.
+    error: Optional[str] = None
+    llm_ms: float = 0.0
+    validate_ms: float = 0.0
+    usage: Dict[str, Any] = field(default_factory=dict)
+    cancelled: bool = False
+
+    @property
+    def valid(self) -> bool:
+        return not self.cancelled and self.error is None
+
+
+def parse_temperatures(spec: str) -> List[float]:
+    """'0.1,0.4,0.7' -> [0.1, 0.4, 0.7]"""
+    return [float(t) for t in spec.split(",") if t.strip()] or [0.1]
+
+
+class SpeculativeRun:
+    """
+    K candidate answers for one prompt, generated concurrently (at most
+    `concurrency` requests at a time, each with its own temperature) and
+    each validated as soon as its reply is complete: parsed, normalized by
+    `prepare`, then checked by `validate` (guards and EXPLAIN), which
+    returns an error string or None. `next_valid()` hands out valid
+    candidates in the order they become ready, lowest temperature first
+    among those ready together; `cancel()` stops the rest, closing their
+    streams so the server stops generating.
+    """
+
+    def __init__(
+        self,
+        llm: OllamaClient,
+        messages: List[Dict[str, str]],
+        temperatures: List[float],
+        concurrency: int,
+        prepare: Callable[[str], str],
+        validate: Callable[[str], Optional[str]],
+        model: Optional[str] = None,
+    ):
+        self.llm = llm
+        self.messages = messages
+        self.model = model
+        self.prepare = prepare
+        self.validate = validate
+        self._stop = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(temperatures))), thread_name_prefix="spec")
+        self.candidates = [Candidate(i, t) for i, t in enumerate(temperatures)]
+        self._pending: Dict[Future, Candidate] = {self._pool.submit(self._generate, c): c for c in self.candidates}
+        self._ready: List[Candidate] = []
+        self.finished: List[Candidate] = []
+        self.stopped = 0
+        self.handed_out: List[Candidate] = []
+        self._pool.shutdown(wait=False)
+
+    def _generate(self, cand: Candidate) -> Candidate:
+        if self._stop.is_set():
+            cand.cancelled = True
+            return cand
+        t0 = time.perf_counter()
+        parts: List[str] = []
+        stream = self.llm.chat_stream(self.messages, temperature=cand.temperature, usage=cand.usage, model=self.model)
+        try:
+            for delta in stream:
+                if self._stop.is_set():
+                    cand.cancelled = True
+                    break
+                parts.append(delta)
+        except Exception as e:
+            cand.error = f"{type(e).__name__}: {e}"
+        finally:
+            stream.close()
+        cand.llm_ms = (time.perf_counter() - t0) * 1000
+        cand.reply = "".join(parts)
+        if cand.cancelled or cand.error:
+            return cand
+        t0 = time.perf_counter()
+        try:
+            cand.payload = json.loads(cand.reply.strip())
+            sql = cand.payload.get("sql") if isinstance(cand.payload, dict) else None
+            if not sql or not isinstance(sql, str):
+                cand.error = "No SQL in the reply."
+            else:
+                cand.sql = self.prepare(sql)
+                cand.error = self.validate(cand.sql)
+        except ValueError as e:
+            cand.error = f"Reply is not valid JSON: {e}"
+        cand.validate_ms = (time.perf_counter() - t0) * 1000
+        return cand
+
+    def next_valid(self) -> Optional[Candidate]:
+        """Block until another valid candidate (not a duplicate of one handed out) is ready; None when none is left."""
+        seen = {c.sql for c in self.handed_out}
+        while True:
+            self._ready = [c for c in self._ready if c.sql not in seen]
+            if self._ready:
+                cand = self._ready.pop(0)
+                self.handed_out.append(cand)
+                return cand
+            if not self._pending:
+                return None
+            done, _ = wait(list(self._pending), return_when=FIRST_COMPLETED)
+            for fut in done:
+                cand = self._pending.pop(fut)
+                self.finished.append(cand)
+                if cand.valid:
+                    self._ready.append(cand)
+            self._ready.sort(key=lambda c: c.index)
+
+    def first_reply(self) -> Optional[Candidate]:
+        """The lowest-temperature finished candidate with a reply, for the refine fallback."""
+        wait(list(self._pending))
+        self.finished.extend(self._pending.values())
+        self._pending.clear()
+        done = [c for c in self.candidates if c.reply and not c.cancelled]
+        return done[0] if done else None
+
+    def cancel(self) -> int:
+        """Stop candidates still queued or generating; returns how many were stopped."""
+        self._stop.set()
+        for fut, cand in self._pending.items():
+            if fut.cancel():
+                cand.cancelled = True
+        self.stopped += len(self._pending)
+        self._pending.clear()
+        return self.stopped
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "candidates": len(self.candidates),
+            "valid": sum(c.valid for c in self.finished),
+            "invalid": sum(c.error is not None for c in self.finished),
+            "cancelled": self.stopped,
+            "tried": [c.index for c in self.handed_out],
+        }
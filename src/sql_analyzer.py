@@ -0,0 +1,287 @@
+from __future__ import annotations
+import json
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set
+
+import duckdb
+
+# Statements/commands that must never appear in generated SQL.
+DISALLOWED = frozenset({
+    "insert", "update", "delete", "drop", "alter", "truncate", "create", "attach", "detach",
+    "copy", "export", "import", "call", "pragma", "vacuum", "install", "load",
+})
+# Table functions that read files or run nested SQL, wherever they appear.
+DISALLOWED_FUNCTIONS = frozenset({
+    "read_csv", "read_csv_auto", "read_parquet", "parquet_scan", "parquet_metadata", "parquet_schema",
+    "read_json", "read_json_auto", "read_json_objects", "read_ndjson", "read_ndjson_auto",
+    "read_text", "read_blob", "glob", "sniff_csv", "query", "query_table",
+})
+# The only table functions allowed in FROM: generators that touch no files or
+# catalogs. Every other one (readers, scanners, extensions) is unsafe.
+SAFE_TABLE_FUNCTIONS = frozenset({"range", "generate_series", "unnest"})
+
+KEYWORDS = frozenset("""
+select from where group by order limit offset having with recursive as and or not null is in on join
+left right inner outer full cross natural using case when then else end distinct all any some desc asc
+nulls first last union intersect except exists between like ilike similar escape true false interval
+cast try_cast filter over partition rows range groups preceding following unbounded current row window
+qualify lateral values asof semi anti positional pivot unpivot collate at zone within materialized
+year years month months week weeks day days hour hours minute minutes second seconds millisecond
+milliseconds microsecond microseconds quarter quarters decade decades century centuries
+""".split()) | DISALLOWED
+
+_TOKEN = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<str>'(?:[^']|'')*'|\$\$.*?\$\$)
+  | (?P<qident>"(?:[^"]|"")*")
+  | (?P<num>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<op>::|<=|>=|<>|!=|\|\||->>|->|\*\*)
+  | (?P<punct>.)
+""", re.VERBOSE | re.DOTALL)
+
+_CLAUSES = {
+    "select": "select", "from": "from", "join": "from", "where": "where", "group": "group",
+    "having": "having", "order": "order", "limit": "limit", "offset": "limit", "qualify": "where",
+    "window": "window", "on": "where", "using": "where", "union": None, "intersect": None, "except": None,
+}
+
+
+@dataclass(frozen=True)
+class SqlAnalysis:
+    statement_type: str
+    statements: int
+    tables: FrozenSet[str]
+    ctes: FrozenSet[str]
+    aliases: FrozenSet[str]
+    columns: FrozenSet[str]
+    functions: FrozenSet[str]
+    has_limit: bool
+    safe: bool
+    reason: str = ""
+
+    def foreign_tables(self, relations: Iterable[str]) -> List[str]:
+        """Tables read that are not among `relations` (compared by unqualified name)."""
+        allowed = {r.lower().split(".")[-1] for r in relations}
+        return sorted(self.tables - allowed)
+
+    def unknown_identifiers(self, valid: Iterable[str]) -> List[str]:
+        allowed = {v.lower() for v in valid} | self.ctes | self.aliases
+        return sorted((self.columns | self.tables) - allowed)
+
+
+@dataclass
+class _Tok:
+    kind: str
+    text: str
+    low: str
+
+
+def tokenize(sql: str) -> List[_Tok]:
+    out = []
+    for m in _TOKEN.finditer(sql):
+        kind = m.lastgroup
+        if kind in ("ws", "comment"):
+            continue
+        text = m.group(0)
+        if kind == "qident":
+            text = text[1:-1].replace('""', '"')
+        out.append(_Tok(kind, text, text.lower()))
+    return out
+
+
+@lru_cache(maxsize=512)
+def analyze_sql(sql: str) -> SqlAnalysis:
+    """
+    One pass over the token stream: statement type and count, referenced
+    tables/CTEs/aliases/columns/functions, whether the outermost query has a
+    LIMIT, and the read-only safety verdict. Strings, quoted identifiers and
+    comments are lexed as such, so their contents never trip the checks.
+    """
+    toks = tokenize(sql)
+    tables: Set[str] = set()
+    ctes: Set[str] = set()
+    aliases: Set[str] = set()
+    columns: Set[str] = set()
+    functions: Set[str] = set()
+    reason = ""
+
+    statements = 0
+    first_words: List[str] = []
+    at_statement_start = True
+    has_limit = False
+    # Per paren depth: current clause, and what opened the paren ("cast",
+    # "func" for other calls, where FROM is an argument keyword, or "group").
+    clause: List[Optional[str]] = [None]
+    parens: List[str] = ["group"]
+    in_with = False
+    expect_table = False
+    expect_alias = False
+    type_context = False
+
+    for i, t in enumerate(toks):
+        prev = toks[i - 1] if i else None
+        nxt = toks[i + 1] if i + 1 < len(toks) else None
+        depth = len(clause) - 1
+
+        if t.kind == "punct" and t.text == ";":
+            at_statement_start = True
+            clause, parens = [None], ["group"]
+            in_with = expect_table = expect_alias = type_context = False
+            continue
+        if at_statement_start:
+            statements += 1
+            at_statement_start = False
+            first_words.append(t.low if t.kind == "ident" else t.text)
+            has_limit = False
+
+        if t.kind == "punct" and t.text == "(":
+            kind = "group"
+            if prev is not None and prev.kind == "ident":
+                if prev.low in ("cast", "try_cast"):
+                    kind = "cast"
+                elif prev.low not in KEYWORDS:
+                    kind = "func"
+            clause.append(None)
+            parens.append(kind)
+            expect_table = expect_alias = type_context = False
+            continue
+        if t.kind == "punct" and t.text == ")":
+            if len(clause) > 1:
+                clause.pop()
+                parens.pop()
+            type_context = False
+            # "(subquery) alias" in FROM
+            expect_alias = clause[-1] == "from"
+            continue
+        if t.kind == "punct" and t.text == ",":
+            type_context = False
+            expect_alias = False
+            expect_table = clause[-1] == "from"
+            continue
+        if t.kind == "op" and t.text == "::":
+            type_context = True
+            continue
+
+        if t.kind not in ("ident", "qident"):
+            if t.kind == "punct" and t.text == ".":
+                continue
+            if t.kind == "str" and expect_table and not reason:
+                reason = "file path as table"  # replacement scan: FROM 'x.csv' reads the file
+            expect_table = expect_alias = type_context = False
+            continue
+
+        bare = t.kind == "ident"
+        word = t.low
+
+        if type_context:
+            # Type names (possibly several words, e.g. DOUBLE PRECISION) until a keyword or delimiter.
+            if not (bare and word in KEYWORDS):
+                continue
+            type_context = False
+
+        if bare and word in DISALLOWED and not reason:
+            reason = f"disallowed keyword {word.upper()}"
+
+        if bare and word in KEYWORDS:
+            if word == "lateral" and expect_table:
+                continue  # FROM t, LATERAL f(...): the table (function) follows
+            expect_table = expect_alias = False
+            if word == "with" and depth == 0:
+                in_with = True
+            elif word == "as" and parens[-1] == "cast":
+                type_context = True
+            elif word in _CLAUSES and parens[-1] != "func":
+                clause[-1] = _CLAUSES[word]
+                if word in ("from", "join"):
+                    expect_table = True
+                if word == "select" and depth == 0:
+                    in_with = False
+                if word == "limit" and depth == 0:
+                    has_limit = True
+            elif word == "as":
+                expect_alias = True
+            continue
+
+        followed_by_paren = nxt is not None and nxt.kind == "punct" and nxt.text == "("
+        qualified_next = nxt is not None and nxt.kind == "punct" and nxt.text == "."
+        after_dot = prev is not None and prev.kind == "punct" and prev.text == "."
+
+        # WITH name AS (...)
+        if in_with and depth == 0 and nxt is not None and nxt.low == "as":
+            ctes.add(word)
+            continue
+        if expect_alias:
+            aliases.add(word)
+            expect_alias = False
+            continue
+        if expect_table:
+            if qualified_next:
+                continue  # schema/catalog prefix; the table follows the dot
+            if not bare and any(c in word for c in "./\\") and not reason:
+                reason = "file path as table"  # FROM "x.parquet" is a replacement scan too
+            if followed_by_paren:
+                functions.add(word)
+                if word not in SAFE_TABLE_FUNCTIONS and not reason:
+                    reason = f"disallowed table function {word}"
+            elif word not in ctes:
+                tables.add(word)
+            expect_table = False
+            expect_alias = True  # optional bare alias: FROM t x
+            continue
+        if followed_by_paren:
+            functions.add(word)
+            if word in DISALLOWED_FUNCTIONS and not reason:
+                reason = f"disallowed function {word}"
+            continue
+        if bare and nxt is not None and nxt.kind == "str" and not after_dot:
+            continue  # typed literal: DATE '2024-01-01'
+        if qualified_next and not after_dot:
+            continue  # qualifier: x.col
+        # Bare alias without AS: "SUM(x) total", "city c"
+        if (
+            clause[-1] == "select" and prev is not None and not after_dot
+            and (prev.kind in ("ident", "qident", "num", "str") or prev.text == ")")
+            and (prev.kind != "ident" or prev.low not in KEYWORDS or prev.low in ("end",))
+        ):
+            aliases.add(word)
+            continue
+        columns.add(word)
+
+    first = first_words[0] if first_words else ""
+    stmt_type = {"with": "SELECT", "select": "SELECT", "(": "SELECT"}.get(first, first.upper() or "EMPTY")
+    if not reason:
+        if statements == 0:
+            reason = "empty statement"
+        elif statements > 1:
+            reason = "multiple statements"
+        elif stmt_type != "SELECT":
+            reason = f"{stmt_type} statement"
+        elif "select" not in {t.low for t in toks if t.kind == "ident"}:
+            reason = "no SELECT"
+
+    return SqlAnalysis(
+        statement_type=stmt_type,
+        statements=statements,
+        tables=frozenset(tables),
+        ctes=frozenset(ctes),
+        aliases=frozenset(aliases),
+        columns=frozenset(columns),
+        functions=frozenset(functions),
+        has_limit=has_limit,
+        safe=not reason,
+        reason=reason,
+    )
+
+
+def parse_sql_tree(con: duckdb.DuckDBPyConnection, sql: str) -> Optional[Dict[str, Any]]:
+    """DuckDB's own parse tree (json_serialize_sql), for rewrites that need full structure."""
+    try:
+        raw = con.execute("SELECT json_serialize_sql(?::VARCHAR)", [sql]).fetchone()[0]
+    except duckdb.Error:
+        return None
+    tree = json.loads(raw)
+    return None if tree.get("error") else tree
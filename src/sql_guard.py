@@ -1,13 +1,23 @@
 from __future__ import annotations
 import re
+from typing import Iterable, Optional
+
 import sqlparse
 
+from .sql_analyzer import analyze_sql
+
 DISALLOWED = {
     "INSERT", "UPDATE", "DELETE", "DROP", "ALTER", "TRUNCATE", "CREATE", "ATTACH", "DETACH",
     "COPY", "EXPORT", "IMPORT", "CALL", "PRAGMA", "VACUUM"
 }
 
-def is_safe_select_sql(sql: str) -> bool:
+def is_safe_select_sql(sql: str, relations: Optional[Iterable[str]] = None) -> bool:
+    """A single read-only SELECT; with `relations`, one that reads no other table."""
+    a = analyze_sql(sql)
+    return a.safe and (relations is None or not a.foreign_tables(relations))
+
+def _sqlparse_is_safe_select_sql(sql: str) -> bool:
+    # Previous sqlparse-based guard, kept for benchmarks/sql_analyzer.py.
     # Parse statements and ensure only SELECT / WITH queries
     parsed = sqlparse.parse(sql)
     if not parsed:
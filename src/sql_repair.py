@@ -0,0 +1,192 @@
+from __future__ import annotations
+import difflib
+import re
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import duckdb
+
+from .sql_analyzer import analyze_sql
+from .sql_schema_guard import find_unknown_identifiers
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_MISSING_COLUMN = re.compile(r'Referenced column "([^"]+)" not found')
+_MISSING_QUALIFIED = re.compile(r'does not have a column named "([^"]+)"')
+_MISSING_TABLE = re.compile(r'Table with name ([^\s!]+) does not exist')
+_CANDIDATES = re.compile(r'Candidate bindings: (.+?)(?:\n|LINE|$)')
+# Tails a truncated generation can end on that are safe to drop. A dangling
+# WHERE/AND/ON etc. is left for the model: cutting it drops a filter and
+# silently broadens the answer.
+_DANGLING_TAIL = re.compile(r"(?:\b(?:WITH|UNION(?:\s+ALL)?)|,)\s*;?\s*$", re.IGNORECASE)
+_CLAUSE_START = re.compile(r"\b(?:FROM|WHERE|GROUP\s+BY|ORDER\s+BY|HAVING|LIMIT|UNION)\b", re.IGNORECASE)
+
+
+def _outside_strings(sql: str) -> List[Tuple[bool, str]]:
+    """Split into (is_code, text) segments so edits never touch string literals."""
+    out, pos = [], 0
+    for m in _STRING.finditer(sql):
+        out.append((True, sql[pos:m.start()]))
+        out.append((False, m.group(0)))
+        pos = m.end()
+    out.append((True, sql[pos:]))
+    return out
+
+
+def replace_identifier(sql: str, old: str, new: str) -> str:
+    pat = re.compile(rf'(?<![\w"])"?{re.escape(old)}"?(?![\w"])', re.IGNORECASE)
+    return "".join(pat.sub(new, seg) if code else seg for code, seg in _outside_strings(sql))
+
+
+def _paren_balance(sql: str) -> int:
+    return sum(seg.count("(") - seg.count(")") for code, seg in _outside_strings(sql) if code)
+
+
+class SqlRepairer:
+    """
+    Deterministic fixes for mechanical SQL errors, tried before spending an
+    LLM refine round trip: misspelled columns/tables (fuzzy-matched against
+    the known identifiers), the base table instead of the date view, `date`
+    used as a date on the legacy string-typed view, a missing GROUP BY, a
+    dangling trailing comma, WITH or UNION, and unbalanced parentheses. Every candidate is
+    validated with EXPLAIN; up to `max_steps` fixes are chained for queries
+    with several mistakes.
+    """
+
+    def __init__(self, valid_identifiers: Set[str], table_name: str, table_view: str, max_steps: int = 3):
+        self.valid = {v.lower() for v in valid_identifiers}
+        self.table_name = table_name.lower()
+        self.table_view = table_view.lower()
+        self.max_steps = max_steps
+        self._lock = threading.Lock()
+        self.stats = {"attempts": 0, "repaired": 0, "llm_calls_avoided": 0}
+
+    def _closest(self, name: str, hints: List[str] = ()) -> Optional[str]:
+        pool = sorted(self.valid | {h.lower() for h in hints})
+        match = difflib.get_close_matches(name.lower(), pool, n=1, cutoff=0.75)
+        return match[0] if match and match[0] != name.lower() else None
+
+    def fix_relations(self, sql: str, relations: Iterable[str]) -> Optional[str]:
+        """
+        `sql` with misspelled table names swapped for the closest of
+        `relations`, or None when some table matches none of them.
+        """
+        pool = sorted({r.lower().split(".")[-1] for r in relations})
+        for name in analyze_sql(sql).foreign_tables(pool):
+            match = difflib.get_close_matches(name, pool, n=1, cutoff=0.75)
+            if not match:
+                return None
+            sql = replace_identifier(sql, name, self.table_view if match[0] == self.table_name else match[0])
+        return sql
+
+    def _candidates(self, sql: str, error: str) -> Iterator[str]:
+        m = _MISSING_COLUMN.search(error) or _MISSING_QUALIFIED.search(error)
+        if m:
+            name = m.group(1)
+            hints = []
+            cm = _CANDIDATES.search(error)
+            if cm:
+                hints = [h.strip().strip('"').split(".")[-1] for h in cm.group(1).split(",")]
+            fixed = self._closest(name, hints)
+            if fixed:
+                yield replace_identifier(sql, name, fixed)
+            if name.lower() == "date_parsed":
+                # Legacy base table has no date_parsed; the view does.
+                yield replace_identifier(sql, self.table_name, self.table_view)
+
+        m = _MISSING_TABLE.search(error)
+        if m:
+            name = m.group(1).strip('"')
+            fixed = self._closest(name)
+            if fixed == self.table_name:
+                fixed = self.table_view
+            if fixed:
+                yield replace_identifier(sql, name, fixed)
+
+        low = error.lower()
+        if ("conversion" in low or "cannot compare" in low or "no function matches" in low) and re.search(r"\bdate\b", sql, re.I):
+            # On the string-typed legacy view only date_parsed is a DATE.
+            yield "".join(
+                re.sub(r"(?<![\w.'])date(?!\s*\(|\s*')(?![\w])", "date_parsed", seg, flags=re.I) if code else seg
+                for code, seg in _outside_strings(sql)
+            )
+
+        if "must appear in the group by clause" in low and not re.search(r"\bGROUP\s+BY\b", sql, re.I):
+            body = sql.rstrip().rstrip(";")
+            tail = list(re.finditer(r"\b(?:ORDER\s+BY|LIMIT)\b", body, re.I))
+            cut = tail[0].start() if tail else len(body)
+            yield body[:cut].rstrip() + " GROUP BY ALL " + body[cut:]
+
+        if "parser error" in low or "syntax error" in low:
+            trimmed = sql.rstrip().rstrip(";")
+            while _DANGLING_TAIL.search(trimmed):
+                trimmed = _DANGLING_TAIL.sub("", trimmed).rstrip()
+            if trimmed != sql.rstrip().rstrip(";"):
+                yield trimmed
+            yield from self._balance_parens(sql)
+
+        # Fall back to the schema guard's view of unknown names.
+        for name in find_unknown_identifiers(sql, self.valid):
+            fixed = self._closest(name)
+            if fixed:
+                yield replace_identifier(sql, name, fixed)
+
+    def _balance_parens(self, sql: str) -> Iterator[str]:
+        balance = _paren_balance(sql)
+        if balance > 0:
+            # Close the innermost open group before each later clause, or at the end.
+            body = sql.rstrip().rstrip(";")
+            opened = body.rfind("(")
+            for m in _CLAUSE_START.finditer(body, opened + 1):
+                yield body[:m.start()].rstrip() + ")" * balance + " " + body[m.start():]
+            yield body + ")" * balance
+        elif balance < 0:
+            # Drop the first ')' that closes nothing, or the last one.
+            depth = 0
+            for i, ch in enumerate(sql):
+                if ch == "(":
+                    depth += 1
+                elif ch == ")":
+                    depth -= 1
+                    if depth < 0:
+                        yield sql[:i] + sql[i + 1:]
+                        break
+            j = sql.rfind(")")
+            yield sql[:j] + sql[j + 1:]
+
+    @staticmethod
+    def _explain_error(cur: duckdb.DuckDBPyConnection, sql: str) -> Optional[str]:
+        try:
+            cur.execute(f"EXPLAIN {sql}")
+            return None
+        except duckdb.Error as e:
+            return str(e)
+
+    def repair(self, cur: duckdb.DuckDBPyConnection, sql: str, error: str) -> Optional[str]:
+        """Return a fixed query that passes EXPLAIN, or None."""
+        with self._lock:
+            self.stats["attempts"] += 1
+        frontier = [(sql, error)]
+        seen = {sql}
+        for _ in range(self.max_steps):
+            nxt = []
+            for base, err in frontier:
+                for cand in self._candidates(base, err):
+                    if cand in seen:
+                        continue
+                    seen.add(cand)
+                    cand_err = self._explain_error(cur, cand)
+                    if cand_err is None:
+                        with self._lock:
+                            self.stats["repaired"] += 1
+                        return cand
+                    nxt.append((cand, cand_err))
+            frontier = nxt[:8]
+        return None
+
+    def record_avoided(self) -> None:
+        with self._lock:
+            self.stats["llm_calls_avoided"] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats)
@@ -0,0 +1,28 @@
+from __future__ import annotations
+import re
+from typing import Any, Iterable, Optional, Tuple
+
+
+def _bound_pattern(relations: Iterable[str]) -> re.Pattern:
+    names = "|".join(re.escape(r) for r in relations)
+    return re.compile(
+        rf"\(\s*SELECT\s+(MAX|MIN)\s*\(\s*date_parsed\s*\)(?:\s+AS\s+\w+)?\s+FROM\s+(?:{names})\s*\)",
+        flags=re.IGNORECASE,
+    )
+
+def inline_date_bounds(sql: str, relations: Iterable[str], bounds: Optional[Tuple[Any, Any]]) -> str:
+    """
+    Replace `(SELECT MAX(date_parsed) FROM <view>)` (and MIN) with DATE
+    literals from the bounds table. The "last N days" filter then becomes a
+    constant that DuckDB pushes into the scan for zone-map / partition pruning,
+    instead of a scalar subquery that scans the whole table first.
+    """
+    if not bounds:
+        return sql
+    lo, hi = bounds
+
+    def repl(m: re.Match) -> str:
+        d = hi if m.group(1).upper() == "MAX" else lo
+        return f"DATE '{d.isoformat()}'"
+
+    return _bound_pattern(relations).sub(repl, sql)
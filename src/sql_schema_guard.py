@@ -2,6 +2,8 @@ from __future__ import annotations
 import re
 from typing import Set, List
 
+from .sql_analyzer import analyze_sql
+
 SQL_KEYWORDS = {
     # core
     "select","from","where","group","by","order","limit","having","with","as",
@@ -57,7 +59,12 @@ def extract_aliases_and_ctes(sql: str) -> Set[str]:
     return aliases
 
 def find_unknown_identifiers(sql: str, valid_identifiers: Set[str]) -> List[str]:
+    """Tables/columns referenced by `sql` that aren't schema names, CTEs or aliases."""
+    return analyze_sql(sql).unknown_identifiers(valid_identifiers)
+
+def _regex_find_unknown_identifiers(sql: str, valid_identifiers: Set[str]) -> List[str]:
     """
+    Previous regex-based check, kept for benchmarks/sql_analyzer.py.
     Return unknown identifiers (case-insensitive), excluding:
     - SQL keywords/functions
     - aliases and cte names
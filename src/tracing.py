@@ -0,0 +1,245 @@
+from __future__ import annotations
+import bisect
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+import duckdb
+
+# Histogram bucket upper bounds; milliseconds for timings, counts for tokens.
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 60000, 120000)
+
+
+class Histogram:
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation (capped at the max seen)."""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank and c:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+def prometheus_name(prefix: str, name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", f"{prefix}_{name}" if prefix else name)
+
+
+class MetricsRegistry:
+    """In-process counters and histograms, keyed by name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = {}
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            self.histograms.setdefault(name, Histogram()).observe(value)
+
+    def incr(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "histograms": {k: h.snapshot() for k, h in sorted(self.histograms.items())},
+            }
+
+    def to_prometheus(self, prefix: str = "analytics") -> str:
+        """Counters and histograms in the Prometheus text format ("stage_ms.llm" -> analytics_stage_ms_llm)."""
+        lines: List[str] = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                metric = prometheus_name(prefix, name) + "_total"
+                lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+            for name, h in sorted(self.histograms.items()):
+                metric = prometheus_name(prefix, name)
+                lines.append(f"# TYPE {metric} histogram")
+                seen = 0
+                for bound, count in zip(h.bounds, h.counts):
+                    seen += count
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {seen}')
+                lines += [f'{metric}_bucket{{le="+Inf"}} {h.count}', f"{metric}_sum {h.sum:.3f}", f"{metric}_count {h.count}"]
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+
+@dataclass
+class Span:
+    name: str
+    start_ms: float
+    ms: float = 0.0
+    attrs: Dict[str, Any] = field(default_factory=dict)
+
+
+class Trace:
+    """
+    Timed spans for one answer. Spans may be opened from worker threads
+    (early query execution), so they can overlap; `breakdown()` sums time
+    per stage name.
+    """
+
+    def __init__(self, question: str):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.question = question
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self.spans: List[Span] = []
+        self.total_ms = 0.0
+        self.attrs: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[Span]:
+        sp = Span(name, (time.perf_counter() - self._t0) * 1000, attrs=dict(attrs))
+        try:
+            yield sp
+        except BaseException as e:
+            sp.attrs.setdefault("error", f"{type(e).__name__}: {e}"[:300])
+            raise
+        finally:
+            sp.ms = (time.perf_counter() - self._t0) * 1000 - sp.start_ms
+            with self._lock:
+                self.spans.append(sp)
+
+    def finish(self, **attrs: Any) -> None:
+        self.total_ms = (time.perf_counter() - self._t0) * 1000
+        self.attrs.update(attrs)
+
+    def breakdown(self) -> Dict[str, float]:
+        out: Dict[str, float] = {}
+        with self._lock:
+            for sp in self.spans:
+                out[sp.name] = out.get(sp.name, 0.0) + sp.ms
+        return out
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start_ms)
+        return {
+            "trace_id": self.trace_id,
+            "ts": self.started,
+            "question": self.question,
+            "total_ms": round(self.total_ms, 2),
+            **self.attrs,
+            "spans": [
+                {"name": s.name, "start_ms": round(s.start_ms, 2), "ms": round(s.ms, 2), **s.attrs}
+                for s in spans
+            ],
+        }
+
+    def record(self, metrics: MetricsRegistry = METRICS) -> None:
+        metrics.incr("answers")
+        metrics.observe("answer_ms", self.total_ms)
+        for name, ms in self.breakdown().items():
+            metrics.observe(f"stage_ms.{name}", ms)
+        for sp in self.spans:
+            if sp.name != "llm":
+                continue
+            for key in ("prompt_tokens", "eval_tokens"):
+                if sp.attrs.get(key) is not None:
+                    metrics.observe(f"llm.{key}", sp.attrs[key])
+        if self.attrs.get("error"):
+            metrics.incr("answer_errors")
+
+
+class TraceLog:
+    """Append-only JSONL sink for finished traces; an empty path disables it."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def write(self, trace: Trace) -> None:
+        if not self.path:
+            return
+        line = json.dumps(trace.to_dict(), default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+@contextmanager
+def profiled(cur: duckdb.DuckDBPyConnection, path: Optional[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Run the body with DuckDB JSON profiling on `cur` and fill the yielded
+    dict with a summary of the profile afterwards. Profiling settings are
+    per cursor, so other sessions are unaffected.
+    """
+    summary: Dict[str, Any] = {}
+    if not path:
+        yield summary
+        return
+    if os.path.exists(path):
+        os.remove(path)  # a failed query writes no profile; never report a stale one
+    cur.execute("SET enable_profiling='json'")
+    cur.execute(f"SET profiling_output='{path}'")
+    try:
+        yield summary
+    finally:
+        cur.execute("PRAGMA disable_profiling")
+    summary.update(summarize_profile(path))
+
+
+def summarize_profile(path: str, top: int = 5) -> Dict[str, Any]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            prof = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    ops: List[Dict[str, Any]] = []
+
+    def walk(node: Dict[str, Any]) -> None:
+        for child in node.get("children", []):
+            ops.append({
+                "op": child.get("name", "").strip(),
+                "ms": round(float(child.get("timing", 0)) * 1000, 3),
+                "rows": int(child.get("cardinality", 0)),
+            })
+            walk(child)
+
+    walk(prof)
+    ops.sort(key=lambda o: o["ms"], reverse=True)
+    return {
+        "duckdb_ms": round(float(prof.get("timing", prof.get("result", 0))) * 1000, 3),
+        "operators": len(ops),
+        "rows_scanned": sum(o["rows"] for o in ops if o["op"].endswith("SCAN")),
+        "top_operators": ops[:top],
+    }
@@ -0,0 +1,228 @@
+from __future__ import annotations
+import re
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+TYPO_MIN_LEN = 5
+_WORD = re.compile(r"\w+")
+
+
+@dataclass(frozen=True)
+class ValueMatch:
+    start: int
+    end: int
+    text: str
+    # (column, canonical value) for every column the surface resolves in;
+    # several when a value repeats across columns (utm sources, mediums).
+    candidates: Tuple[Tuple[str, str], ...]
+    # "exact", "alias" or "typo"
+    how: str = "exact"
+
+    @property
+    def ambiguous(self) -> bool:
+        return len({c for c, _ in self.candidates}) > 1
+
+    @property
+    def column(self) -> str:
+        return self.candidates[0][0]
+
+    @property
+    def value(self) -> str:
+        return self.candidates[0][1]
+
+
+def parse_aliases(spec: str) -> Dict[str, str]:
+    """'bengaluru=Bangalore,bombay=Mumbai' -> {'bengaluru': 'Bangalore', ...}"""
+    out: Dict[str, str] = {}
+    for part in spec.split(","):
+        alias, _, value = part.partition("=")
+        if alias.strip() and value.strip():
+            out[alias.strip().lower()] = value.strip()
+    return out
+
+
+def _within_one(a: str, b: str) -> bool:
+    # Optimal string alignment distance <= 1 (one insert, delete, substitute or adjacent swap).
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    i = 0
+    while i < min(la, lb) and a[i] == b[i]:
+        i += 1
+    if la == lb:
+        return a[i + 1:] == b[i + 1:] or (a[i + 1:i + 2] == b[i:i + 1] and a[i:i + 1] == b[i + 1:i + 2] and a[i + 2:] == b[i + 2:])
+    return a[i + 1:] == b[i:] if la > lb else a[i:] == b[i + 1:]
+
+
+def _deletes(word: str) -> Set[str]:
+    return {word[:i] + word[i + 1:] for i in range(len(word))} | {word}
+
+
+class ValueIndex:
+    """
+    Every distinct value of the categorical columns, plus aliases
+    (Bengaluru -> Bangalore, "winter sale" -> winter_sale), compiled into
+    one Aho-Corasick automaton. A question is scanned once, in time linear
+    in its length whatever the number of values, and resolves to exact
+    column/value pairs (leftmost-longest, on word boundaries). Words left
+    unmatched may then resolve to a single-word value one edit away
+    ("Hyderbad"), unless they are in `protected` (the question grammar).
+    Rebuilt from dimension_values() at load and on ingest.
+    """
+
+    def __init__(
+        self,
+        entities: Dict[str, List[str]],
+        aliases: Optional[Dict[str, str]] = None,
+        protected: Iterable[str] = (),
+        typos: bool = True,
+    ):
+        self.entities = entities
+        self.typos = typos
+        self.protected = {w.lower() for w in protected}
+        # surface (lower) -> [(column, value)], and how the surface was derived
+        surfaces: Dict[str, List[Tuple[str, str]]] = {}
+        kinds: Dict[str, str] = {}
+
+        def add(surface: str, col: str, value: str, how: str) -> None:
+            surface = " ".join(surface.lower().split())
+            if not surface or kinds.get(surface, how) != how:
+                return  # an exact value always beats an alias of another one
+            kinds[surface] = how
+            if (col, value) not in surfaces.setdefault(surface, []):
+                surfaces[surface].append((col, value))
+
+        canonical: Dict[str, List[Tuple[str, str]]] = {}
+        for col, values in entities.items():
+            for v in values:
+                add(v, col, v, "exact")
+                canonical.setdefault(v.lower(), []).append((col, v))
+        for col, values in entities.items():
+            for v in values:
+                if "_" in v:
+                    add(v.replace("_", " "), col, v, "alias")
+        for alias, target in (aliases or {}).items():
+            for col, v in canonical.get(target.lower(), []):
+                add(alias, col, v, "alias")
+        self._surfaces = surfaces
+        self._kinds = kinds
+        self._build_automaton(surfaces)
+        self._build_typo_index(surfaces)
+
+    def __len__(self) -> int:
+        return len(self._surfaces)
+
+    # -- construction -----------------------------------------------------
+
+    def _build_automaton(self, surfaces: Dict[str, Any]) -> None:
+        goto: List[Dict[str, int]] = [{}]
+        out: List[List[int]] = [[]]  # lengths of surfaces ending at the node
+        for s in surfaces:
+            node = 0
+            for ch in s:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    goto.append({})
+                    out.append([])
+                    nxt = goto[node][ch] = len(goto) - 1
+                node = nxt
+            out[node].append(len(s))
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in goto[node].items():
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] = out[nxt] + out[fail[nxt]]
+                queue.append(nxt)
+        self._goto, self._fail, self._out = goto, fail, out
+
+    def _build_typo_index(self, surfaces: Dict[str, Any]) -> None:
+        # Single-word surfaces by their one-deletion variants (symmetric delete).
+        index: Dict[str, Set[str]] = {}
+        for s in surfaces:
+            if len(s) >= TYPO_MIN_LEN and " " not in s:
+                for d in _deletes(s):
+                    index.setdefault(d, set()).add(s)
+        self._typo_index = index
+
+    # -- matching ---------------------------------------------------------
+
+    def matches(self, text: str) -> List[ValueMatch]:
+        """Non-overlapping value mentions in `text`, in order."""
+        low = text.lower()
+        if len(low) != len(text):
+            # Keep offsets aligned with `text` when lowering changes lengths ("İ").
+            low = "".join(c.lower() if len(c.lower()) == 1 else c for c in text)
+        goto, fail, out = self._goto, self._fail, self._out
+        found: List[Tuple[int, int]] = []
+        node = 0
+        for i, ch in enumerate(low):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for n in out[node]:
+                start, end = i + 1 - n, i + 1
+                if (start == 0 or not _is_word(low[start - 1])) and (end == len(low) or not _is_word(low[end])):
+                    found.append((start, end))
+        # Leftmost-longest, non-overlapping.
+        found.sort(key=lambda se: (se[0], -se[1]))
+        picked: List[ValueMatch] = []
+        last_end = 0
+        for start, end in found:
+            if start >= last_end:
+                s = low[start:end]
+                picked.append(ValueMatch(start, end, text[start:end], tuple(self._surfaces[s]), self._kinds[s]))
+                last_end = end
+        if self.typos and self._typo_index:
+            picked = sorted(picked + self._typo_matches(low, text, picked), key=lambda m: m.start)
+        return picked
+
+    def _typo_matches(self, low: str, text: str, taken: List[ValueMatch]) -> List[ValueMatch]:
+        out: List[ValueMatch] = []
+        for w in _WORD.finditer(low):
+            word = w.group(0)
+            if len(word) < TYPO_MIN_LEN or word in self.protected or word.isdigit():
+                continue
+            if any(m.start < w.end() and w.start() < m.end for m in taken):
+                continue
+            hits = {s for d in _deletes(word) for s in self._typo_index.get(d, ()) if _within_one(word, s)}
+            if len(hits) == 1:
+                s = hits.pop()
+                out.append(ValueMatch(w.start(), w.end(), text[w.start():w.end()], tuple(self._surfaces[s]), "typo"))
+        return out
+
+    def filters(self, text: str) -> Dict[str, Any]:
+        """column -> value (or list of values) for the unambiguous mentions in `text`."""
+        out: Dict[str, Any] = {}
+        for m in self.matches(text):
+            if m.ambiguous:
+                continue
+            prev = out.get(m.column)
+            if prev is None:
+                out[m.column] = m.value
+            elif m.value not in (prev if isinstance(prev, list) else [prev]):
+                out[m.column] = (prev if isinstance(prev, list) else [prev]) + [m.value]
+        return out
+
+    def describe(self, text: str) -> List[Dict[str, Any]]:
+        """The mentions in `text` as prompt context: surface, column(s) and exact literal."""
+        out = []
+        for m in self.matches(text):
+            item: Dict[str, Any] = {"text": m.text, "value": m.value}
+            if m.ambiguous:
+                item["columns"] = [c for c, _ in m.candidates]
+            else:
+                item["column"] = m.column
+            out.append(item)
+        return out
+
+
+def _is_word(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"